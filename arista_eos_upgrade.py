@@ -11,12 +11,20 @@ import sys
 import time
 from datetime import datetime
 
-import yaml
-from google.cloud import storage
-
-from netmiko import connectHandler, file_transfer
-from netmiko.ssh_exception import (AuthenticationException,
-                                   NetMikoTimeoutException, SSHException)
+from capture import CaptureError, CaptureFile, capture_netmiko
+from convergence import ROUTE_COMMAND, track
+from eapi import EapiError, EapiSession
+from image_cache import (DEFAULT_CACHE_DIR, ImageCache, ImageCacheError,
+                         local_md5)
+from instrumentation import configure, get_recorder
+from inventory import add_arguments as add_inventory_arguments
+from inventory import load_devices
+from journal import DEFAULT_JOURNAL_DIR, Journal
+from reachability import wait_for_reboot, wait_for_ssh
+from snapshot import extract_arista
+from transfer_scheduler import (TransferError, TransferScheduler,
+                                scheduled_transfer)
+from validation import run_checks
 
 # Global constants,
 LINE = ('-' * 10)
@@ -24,22 +32,28 @@ MAX_PING_WAIT = 300
 WAIT_BETWEEN_PING = 15
 WAIT_AFTER_REBOOT = 60
 WAIT_FOR_CONTROL_PLAIN_CONVERGENCE = 120
+WAIT_FOR_RELOAD = 300
+# verify /md5 reads the whole image from flash, netmiko's default 10s is far too short
+MD5_READ_TIMEOUT = 300
 
 
-class Aristastate;
-    def__init__(self, image_file_path):
+class AristaState:
+    def __init__(self, image_file_path):
         self.debug_commands = {'version_summary': { 'command':'sh version', 'output':{}},
                               'environment_power':  {'command': 'sh environment power', 'output':{}},
                               'environment_cooling': {'command': 'sh environment cooling', 'output': {}},
-                              'route_summary': {'command': 'sh ip route summary', 'output': {}},
-                              'mlag_summary': {'command': 'sh meng interfaces', 'output': {}},
+                              'route_summary': {'command': ROUTE_COMMAND, 'output': {}},
+                              'mlag_summary': {'command': 'sh mlag interfaces', 'output': {}},
                               'spanning_tree_status':{'command': 'sh spanning-tree', 'output': {}},
-                              'interfaces_status': {'command': 'sh interfaces status connected', 'output':{}}
+                              'interfaces_status': {'command': 'sh interfaces status connected', 'output':{}},
+                              'file_systems': {'command': 'sh file systems', 'output': {}}
                               }
         self.free_memory = None
+        self.free_flash = None
         self.running_version = None
         self.model_name = None
         self.total_ip_routes = None
+        self.snapshot = None
         self.image_file_path = image_file_path
 
     def find_key(self, data, target_key):
@@ -49,56 +63,65 @@ class Aristastate;
           elif key == target_key:
               yield value
 
-    def _set_free_memory(self):
-        free_memory = 0
-        output = self.find_key(self.debug_commands['version_summary']['output'], 'memFree')
-        for item in output:
-            free_memory += int(item)
-        self.free_memory = free_memory
-
-    def _set_running_version(self):
-        output = self.find_key(self.debug_commands['version_summary']['output'], 'modelName')
-        for item in output:
-            self.model_name = item
-
-    def _set_model_name(self):
-        output = self.find_key(self.debug_commands['version_summary']['output'], 'modelName')
-        for item in output:
-            self.model_name = item
-
-    def _set_total_routes(self):
-        total_ip_routes = 0
-        output = self.find_key(self.debug_commands['route_summary']['output'], modelName')
-        for item in output:
-            self.model_name = item
-
-    def _set_total_routes(self):
-        total_ip_routes = 0
-        output = self.find_key(self.debug_commands['route_summary']['output'], 'totalRoutes')
-        for item in output:
-            total_ip_routes += int(item)
-        self.total_ip_routes = total_ip_routes
+    def outputs(self):
+        return {k: v['output'] for k, v in self.debug_commands.items()}
+
+    def load_outputs(self, outputs):
+        # rebuild a snapshot saved with outputs(), e.g. from the upgrade journal
+        for k, output in outputs.items():
+            if k in self.debug_commands:
+                self.debug_commands[k]['output'] = output
+        self._set_fields()
+
+    def _set_fields(self):
+        # one walk over each command output for every field we need
+        self.snapshot = extract_arista(self.debug_commands)
+        self.free_memory = self.snapshot.free_memory
+        self.free_flash = self.snapshot.free_flash
+        self.running_version = self.snapshot.running_version
+        self.model_name = self.snapshot.model_name
+        self.total_ip_routes = self.snapshot.total_ip_routes
+
+    def image_size(self):
+        statinfo = os.stat(self.image_file_path)
+        return (statinfo.st_size)/1000
+
+    def free_flash_kb(self):
+        # same KB (1000 bytes) as image_size()
+        return None if self.free_flash is None else self.free_flash / 1000
+
+    def has_flash_space(self):
+        # free space on flash:, not memFree from show version, which is RAM
+        return self.free_flash is not None and self.free_flash_kb() > self.image_size()
 
     def check_flash_memory(self):
         try:
-            statinfo = os.stat(self.image_file_path)
-            file_size = (statinfo.st_size)/1000
-
-            if self.free_memory <= file_size:
-                msg = 'Free Memory = {}, File Size = {}'.format(file_size, self.free_memory)
-                print('AVAILABLE MEMORY TEST: FAIL, ERROR: {}'.format(msg))
-                sys.exit(1)
-         except Exception as e:
-             print('AVAILABLE MEMORY TEST: PASS {}'.forma(LINE, LINE))
-
-     def populate(self, run_command):
-         for k in self.debug_commands.keys():
-             self.debug_commands[k]['output'] = \
-                run_command(self.debug_commands[k]['command'])
-        self._set_model_name()
-        self._set_free_memory()
-        self._set_running_version()
-        self._set_total_routes()
+            file_size = self.image_size()
+        except Exception as e:
+            print('AVAILABLE MEMORY TEST: FAIL, ERROR: {}'.format(e))
+            sys.exit(1)
+
+        if not self.has_flash_space():
+            msg = 'Free Flash = {} KB, File Size = {} KB'.format(self.free_flash_kb(), file_size)
+            print('AVAILABLE MEMORY TEST: FAIL, ERROR: {}'.format(msg))
+            sys.exit(1)
+        print('{} AVAILABLE MEMORY TEST: PASS {}'.format(LINE, LINE))
+
+    def populate(self, run_command, keys=None, run_commands=None):
+        keys = [k for k in self.debug_commands.keys() if keys is None or k in keys]
+        recorder = get_recorder()
+        if run_commands is not None:
+            # one batched request for the whole snapshot
+            with recorder.command('batch of {}'.format(len(keys))):
+                outputs = run_commands([self.debug_commands[k]['command'] for k in keys])
+            for k, output in zip(keys, outputs):
+                self.debug_commands[k]['output'] = output
+        else:
+            for k in keys:
+                with recorder.command(self.debug_commands[k]['command']):
+                    self.debug_commands[k]['output'] = \
+                        run_command(self.debug_commands[k]['command'])
+        self._set_fields()
         return
 
 
@@ -108,11 +131,22 @@ class AristaOsUpgrade:
         self.username = args['username']
         self.password = args['password']
         self.file_path = args['path']
+        self.image_md5 = args.get('md5')
+        self.image_staged = False
+        self.site = args.get('site')
+        self.transfer_scheduler = args.get('transfer_scheduler')
         self.ssh_conn = None
+        self.eapi = None
+        if args.get('transport') == 'eapi':
+            self.eapi = EapiSession(self.ip_address, self.username, self.password,
+                                    port=args.get('eapi_port'), protocol=args.get('eapi_protocol', 'https'))
+
+        self.port = args.get('port', 22)
 
         self.arista = {
         'device_type': 'arista_eos',
-        'host': self.ip.address,
+        'host': self.ip_address,
+        'port': self.port,
         'username': self.username,
         'password': self.password,
         'banner_timeout': 120,
@@ -120,7 +154,7 @@ class AristaOsUpgrade:
         }
 
         head, self.file_name = ntpath.split(self.file_path)
-        self.source_file = self.image_file_path
+        self.source_file = self.file_path
         self.dest_file = self.file_name
         self.direction = 'put'
         self.file_system = self.arista.pop('file_system')
@@ -129,31 +163,36 @@ class AristaOsUpgrade:
 
     def ping_check(self):
 
-        retry_counter = 3
-        while retry_counter > 0:
+        try:
+            elapsed = wait_for_ssh(self.ip_address, timeout=3 * WAIT_BETWEEN_PING, port=self.port)
+        except Exception as e:
+            print('ping TEST: FAIL, ERROR; {}'.format(e))
+            sys.exit(1)
+        if elapsed is None:
+            print('{} PING TEST: FAIL, ERROR: DEVICE NOT REACHABLE {}'.format(LINE, LINE))
+            sys.exit(1)
+        print('{} PING TEST: PASS {}'.format(LINE, LINE))
+
+    def disconnect(self):
+        # closes the SSH and eAPI sessions, safe to call more than once
+        if self.ssh_conn is not None:
             try:
-                res = os.system('ping -c 1{}'.format(self.ip_address))
-                if res == 0:
-                    print('{} PING TEST: PASS {}'.format(LINE, LINE))
-                    return
-                else:
-                    msg = 'ping status unsuccessful for {}'.format(self.ip_addres)
-                    time.sleep(WAIT_BETWEEN_PING)
-                    print(msg)
-                    print("pinging again to device {}".format(self.ip_address))
-                    retry_counter -= 1
-                    continue
-            except Exception as e:
-                print('ping TEST: FAIL, ERROR; {}'.format(e))
-                sys.exit(1)
-        print('{} PING TEST: FAIL, ERROR: DEVICE NOT REACHABLE {}'.format(LINE, LINE))
-        sys.exit(1)
+                self.ssh_conn.disconnect()
+            except Exception:
+                pass
+            self.ssh_conn = None
+        if self.eapi is not None:
+            self.eapi.close()
 
     def connect_to_device(self):
+        from netmiko import ConnectHandler
+        from netmiko.ssh_exception import (AuthenticationException,
+                                           NetMikoTimeoutException,
+                                           SSHException)
 
         try:
-            ss1.create_default_https_context = ss1.create_unverified_context
-            self.ssh_conn = ConnectHandler(self.arista)
+            ssl._create_default_https_context = ssl._create_unverified_context
+            self.ssh_conn = ConnectHandler(**self.arista)
             print('{} SSH TEST: PASS {}'.format(LINE, LINE))
             self.ssh_conn.enable()
             return
@@ -171,53 +210,132 @@ class AristaOsUpgrade:
             print('SSH TEST: FAIL, ERROR: {}'.format(e))
             sys.exit(1)
 
-    def run_commman_json(self, cmd):
+    def run_command_json(self, cmd):
+        if self.eapi is not None:
+            return self.run_commands_json([cmd])[0]
         try:
-            output = self.ssh_conn.send_command('{} | json',format(cmd))
+            output = self.ssh_conn.send_command('{} | json'.format(cmd))
             return json.loads(output)
-        except IOException as e:
+        except IOError as e:
             print(e)
             return None
 
+    def run_commands_json(self, cmds):
+        if self.eapi is not None:
+            try:
+                return self.eapi.run_commands(cmds)
+            except (EapiError, OSError) as e:
+                print('EAPI: FAIL, falling back to SSH for {}, ERROR: {}'.format(self.ip_address, e))
+                self.eapi.close()
+                self.eapi = None
+        return [self.run_command_json(cmd) for cmd in cmds]
+
     def run_command(self, cmd):
         try:
             return self.ssh_conn.send_command(cmd)
-        except IOException as e:
+        except IOError as e:
             print(e)
             return None
 
     def copy_running_config(self):
-        running_config_data = self.run_command('show runnig-config')
-        now = datetime.today().strftime('xm-xd-xy')
-        file_name = '{}_running_config.().txt'.format(self.ip_address, now)
+        now = datetime.today().strftime('%m-%d-%Y')
+        file_name = '{}_running_config_{}.txt'.format(self.ip_address, now)
+
+        # streamed to disk line by line, renamed once complete
+        try:
+            with CaptureFile(file_name + '.part') as sink:
+                capture_netmiko(self.ssh_conn, 'show running-config', sink)
+        except (CaptureError, IOError) as e:
+            print('COPY RUNNING CONFIG: FAIL, ERROR: {}'.format(e))
+            sys.exit(1)
+        os.replace(file_name + '.part', file_name)
+        print('COPY RUNNING CONFIG: PASS, file name: {}, {} lines'.format(file_name, sink.lines))
+        return file_name
 
-        with open(file_name, 'w') as f:
-            f.write(running_config_data)
-            print('COPY RUNNING CONFIG: PASS, file name: {}'.format(file_name))
+    def remote_md5(self):
+        from netmiko import ReadTimeout
+        try:
+            output = self.ssh_conn.send_command('verify /md5 flash:{}'.format(self.dest_file),
+                                                read_timeout=MD5_READ_TIMEOUT)
+        except (ReadTimeout, IOError) as e:
+            print('VERIFY MD5: FAIL on {}, ERROR: {}'.format(self.ip_address, e))
+            return None
+        match = re.search(r'\b([0-9a-fA-F]{32})\b', output or '')
+        if match:
+            return match.group(1).lower()
+        return None
+
+    def image_is_staged(self):
+        # hashing a multi-gigabyte image on flash is slow, remember a match
+        if self.image_md5 is None:
+            return False
+        if not self.image_staged:
+            self.image_staged = self.remote_md5() == self.image_md5
+        return self.image_staged
 
     def file_transfer(self):
+        from netmiko import file_transfer
         self.ssh_conn.enable()
+        if self.image_is_staged():
+            print("IMAGE {} ALREADY STAGED ON DEVICE {}, MD5 VERIFIED".format(self.file_name, self.ip_address))
+            return
+        if self.transfer_scheduler is not None and self.supports_sftp():
+            self.scheduled_file_transfer()
+            return
         retry_counter = 3
         while retry_counter > 0:
             print("COPYING IMAGE {} TO DEVICE".format(self.file_name))
+            start = time.perf_counter()
             transfer_dict = file_transfer(self.ssh_conn,
-                                          source_file-self.source_file,
-                                          dest_file-self.dest_file,
-                                          file_system-self.file_system,
-                                          direction_self.direction,
-                                          overwrite_file-True)
+                                          source_file=self.source_file,
+                                          dest_file=self.dest_file,
+                                          file_system=self.file_system,
+                                          direction=self.direction,
+                                          overwrite_file=True)
             print(transfer_dict)
+            get_recorder().event('transfer', seconds=round(time.perf_counter() - start, 3),
+                                 bytes=os.path.getsize(self.source_file), result=transfer_dict)
             if transfer_dict['file_exists'] and transfer_dict['file_transferred']:
+                if self.image_md5 is not None and self.remote_md5() != self.image_md5:
+                    print("COPYING IMAGE: FAIL, md5 mismatch on device, retrying again")
+                    retry_counter -= 1
+                    continue
                 print("COPYING IMAGE: PASS, {} COPIED TO DEVICE {}".format(
                     self.file_name, self.ip_address))
                 break
-            elif transfer_dict['file_exists'] and transfer_dict['file_transferred'] == false:
+            elif transfer_dict['file_exists'] and transfer_dict['file_transferred'] == False:
                 print("IMAGE {} ALREADY EXISTS IN DEVICE {}".format(self.file_name, self.ip_address))
                 break
             else:
                 print("COPYING IMAGE: FAIL, retrying again")
                 retry_counter -= 1
                 continue
+        if retry_counter == 0:
+            print("COPYING IMAGE: FAIL, giving up on device {}".format(self.ip_address))
+            sys.exit(1)
+
+    def supports_sftp(self):
+        # the resumable copy needs the SFTP subsystem, netmiko's SCP copy does not
+        try:
+            self.ssh_conn.remote_conn_pre.open_sftp().close()
+        except Exception as e:
+            print("SFTP NOT AVAILABLE ON {} ({}), COPYING WITHOUT RESUME".format(self.ip_address, e))
+            return False
+        return True
+
+    def scheduled_file_transfer(self):
+        # throttled SFTP copy that resumes instead of starting over
+        print("COPYING IMAGE {} TO DEVICE, SITE {}".format(self.file_name, self.site or '-'))
+        start = time.perf_counter()
+        try:
+            sent = scheduled_transfer(self, self.transfer_scheduler, site=self.site)
+        except TransferError as e:
+            print("COPYING IMAGE: FAIL, {}".format(e))
+            sys.exit(1)
+        get_recorder().event('transfer', seconds=round(time.perf_counter() - start, 3), bytes=sent,
+                             site=self.site, result='scheduled')
+        self.image_staged = self.image_md5 is not None
+        print("COPYING IMAGE: PASS, {} COPIED TO DEVICE {}".format(self.file_name, self.ip_address))
 
     def modify_boot_config(self):
 
@@ -226,7 +344,7 @@ class AristaOsUpgrade:
             self.ssh_conn.config_mode()
             status = self.ssh_conn.check_config_mode()
             if status:
-                boot_drive = 'finish:/' + self.file_name
+                boot_drive = 'flash:/' + self.file_name
                 print("Started Boot Config ...")
                 self.ssh_conn.send_command('boot system {}'.format (boot_drive))
                 boot_config = self.ssh_conn.send_command('show boot-config')
@@ -243,168 +361,302 @@ class AristaOsUpgrade:
         if retry_counter == 0:
             print("Unable to enter config mode. Exiting")
             sys.exit(1)
-            def save_and_reload(self):
 
-                self.ssh_conn.send_command('write\n')
-                print("Write configuration saved successfully")
-                self.ssh_conn.save_config(cmd='reload',
-                                          confirm=True,
-                                          confirm_response='')
-                print("Reload started ...")
+    def save_and_reload(self):
 
-    def reboot_status(self):
+        self.ssh_conn.send_command('write\n')
+        print("Write configuration saved successfully")
+        self.ssh_conn.save_config(cmd='reload',
+                                  confirm=True,
+                                  confirm_response='')
+        print("Reload started ...")
 
-        count = 0
-        time.sleep(WAIT_BETWEEN_PING)
-        while (count < MAX_PING_WAIT and os.system("ping -c 1 " + self.ip_address)):
-            sys.stderr.write(',')
-            time.sleep(WAIT_BETWEEN_PING)
-            count += 1
+    def reboot_status(self):
 
-        print("count =", count)
-        if (count < MAX_PING_WAI):
-            print(self.ip_address, 'Reboot successfull')
+        went_down, elapsed = wait_for_reboot(self.ip_address,
+                                             down_timeout=WAIT_FOR_RELOAD,
+                                             up_timeout=MAX_PING_WAIT * WAIT_BETWEEN_PING,
+                                             port=self.port)
+        if not went_down:
+            print(self.ip_address, 'Reboot unsuccessful, device never went down.')
+            sys.exit(1)
+        if elapsed is not None:
+            get_recorder().observe('reboot_ssh_back_seconds', elapsed)
+            print(self.ip_address, 'Reboot successfull, SSH back after {:.0f} seconds'.format(elapsed))
         else:
             print(self.ip_address, 'Reboot unsuccessful.')
             sys.exit(1)
 
-def main():
+
+def validate_upgrade(arista_handler, pre_upgrade_state, image_file_path):
+    post_upgrade_state = AristaState(image_file_path)
+    post_upgrade_state.populate(arista_handler.run_command_json,
+                                run_commands=arista_handler.run_commands_json)
+
+    if post_upgrade_state.running_version and post_upgrade_state.running_version in image_file_path:
+        print('{} VERSION CHECK TEST: PASS{}'.format(LINE, LINE))
+    else:
+        print('{} VERSION CHECK TEST: FAIL {}\n, running_version: {}'
+               .format(LINE, LINE, post_upgrade_state.running_version))
+        return False
+
+    def repoll(command_keys):
+        with get_recorder().phase('validate_repoll'):
+            post_upgrade_state.populate(arista_handler.run_command_json, keys=command_keys,
+                                        run_commands=arista_handler.run_commands_json)
+
+    def log(msg):
+        print('{} {} {}'.format(LINE, msg, LINE))
+
+    def sample():
+        # timed as the route_convergence phase, not as re-polls
+        post_upgrade_state.populate(arista_handler.run_command_json, keys=('route_summary',),
+                                    run_commands=arista_handler.run_commands_json)
+        return post_upgrade_state.debug_commands['route_summary']['output']
+
+    recorder = get_recorder()
+    with recorder.phase('route_convergence'):
+        convergence = track(sample, pre_upgrade_state.debug_commands['route_summary']['output'],
+                            post_upgrade_state.debug_commands['route_summary']['output'], log=log)
+    recorder.event('route_convergence', **convergence.as_dict())
+    if convergence.converged:
+        recorder.observe('route_convergence_seconds', convergence.seconds)
+        log('IP ROUTE TEST: PASS, {} routes, converged after {:.0f} seconds'.format(
+            convergence.routes, convergence.seconds))
+    else:
+        log('IP ROUTE TEST: FAIL, {}'.format(convergence.detail))
+
+    all_test_passed, failed = run_checks(pre_upgrade_state, post_upgrade_state, repoll, log=log)
+    return convergence.converged and all_test_passed
+
+
+def main(argv=None):
     # reading data from arista input yaml file
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_yaml',
-                        requered-True,
+                        required=True,
                         help='A yaml file with required parametrs')
-
-    args = parser.parse_args()
+    parser.add_argument('--inventory',
+                        nargs='+',
+                        default=None,
+                        help='yaml, jsonl or csv inventory files or globs instead of ip_address in the yaml')
+    add_inventory_arguments(parser)
+    parser.add_argument('--concurrency',
+                        type=int,
+                        default=1,
+                        help='Maximum number of devices upgraded at the same time')
+    parser.add_argument('--canary',
+                        type=int,
+                        default=1,
+                        help='Number of devices in the first (canary) wave')
+    parser.add_argument('--wave_growth',
+                        type=int,
+                        default=2,
+                        help='Factor by which each wave grows after the canary wave, also with --schedule')
+    parser.add_argument('--max_failures',
+                        type=int,
+                        default=1,
+                        help='Abort the rest of the fleet once this many devices failed, 0 disables')
+    parser.add_argument('--transport',
+                        choices=['ssh', 'eapi'],
+                        default='ssh',
+                        help='Transport used for the state snapshots, SSH stays the fallback')
+    parser.add_argument('--prestage',
+                        action='store_true',
+                        help='Only copy the image to the devices ahead of the maintenance window')
+    parser.add_argument('--image_cache_dir',
+                        default=DEFAULT_CACHE_DIR,
+                        help='Directory of the local EOS image cache')
+    parser.add_argument('--image_cache_size',
+                        type=float,
+                        default=20,
+                        help='Maximum size of the image cache in GB')
+    parser.add_argument('--preflight',
+                        action='store_true',
+                        help='Only check version and free flash of every device and report which need the upgrade')
+    parser.add_argument('--preflight_concurrency',
+                        type=int,
+                        default=50,
+                        help='Devices queried at the same time during --preflight')
+    parser.add_argument('--max_bandwidth',
+                        type=float,
+                        default=0,
+                        help='Mbit/s shared by all image copies, 0 is unlimited')
+    parser.add_argument('--site_bandwidth',
+                        type=float,
+                        default=0,
+                        help='Mbit/s per site for image copies, "site_bandwidth" in the yaml overrides it per site')
+    parser.add_argument('--max_transfers',
+                        type=int,
+                        default=0,
+                        help='Image copies running at the same time, 0 leaves it to --concurrency')
+    parser.add_argument('--transfers_per_site',
+                        type=int,
+                        default=0,
+                        help='Image copies running at the same time per site, 0 is unlimited')
+    parser.add_argument('--schedule',
+                        action='store_true',
+                        help='Build the waves from MLAG and LLDP data so redundant peers never reload together')
+    parser.add_argument('--plan',
+                        action='store_true',
+                        help='Only print the scheduled waves and the estimated duration, implies --schedule')
+    parser.add_argument('--site_cap',
+                        type=int,
+                        default=0,
+                        help='Maximum devices of one site (see "sites" in the yaml) per wave, 0 disables')
+    parser.add_argument('--window_minutes',
+                        type=float,
+                        default=0,
+                        help='Maintenance window length, waves that do not fit are left for the next run')
+    parser.add_argument('--device_minutes',
+                        type=float,
+                        default=None,
+                        help='Estimated upgrade time per device, defaults to the median of '
+                             '--metrics_dir/events.jsonl or 30 minutes')
+    parser.add_argument('--journal_dir',
+                        default=DEFAULT_JOURNAL_DIR,
+                        help='Per device progress journal, a rerun resumes every device from it')
+    parser.add_argument('--fresh',
+                        action='store_true',
+                        help='Ignore and clear the journal, upgrade every device from the start')
+    parser.add_argument('--metrics_dir',
+                        default=None,
+                        help='Write events.jsonl and a Prometheus textfile with phase timings here')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Also write a cProfile dump per device to --metrics_dir')
+
+    args = parser.parse_args(argv)
+    recorder = configure(args.metrics_dir, args.profile)
     if args.input_yaml:
         playbook = args.input_yaml
 
     device_list = []
     image_name = None
     doc = {}
+    import yaml
     try:
         with open(playbook, 'r') as f:
             doc = yaml.safe_load(f)
-            device_list = doc['ip_address']
             image_name = doc['eos_image']
     except IOError:
         print('failed to open playbook')
         return 1
     print(doc)
 
+    # the devices come from --inventory, or from the playbook's ip_address list
+    try:
+        devices = list(load_devices(args.inventory or [playbook], os=args.os or ['arista_eos'],
+                                    sites=args.site, tags=args.tag, shard=args.shard,
+                                    default_os='arista_eos'))
+    except (IOError, ValueError) as e:
+        print('failed to load inventory: {}'.format(e))
+        return 1
+    device_list = [device.host for device in devices]
+    sites = {device.host: device.site for device in devices if device.site}
+    print('{} {} DEVICES SELECTED{} {}'.format(
+        LINE, len(device_list), ', SHARD {}/{}'.format(*args.shard) if args.shard else '', LINE))
+
     # reading variables from jenkins
     username = input('USERNAME: ')
     password = input('PASSWORD: ')
+
+    # imported here, depends on the classes above
+    from scheduler import device_seconds_from_events, schedule
+    if args.device_minutes is not None:
+        device_seconds = args.device_minutes * 60
+    else:
+        device_seconds = device_seconds_from_events(os.path.join(args.metrics_dir or '.', 'events.jsonl'))
+
+    waves = None
+    if args.schedule or args.plan:
+        waves, later = schedule(device_list, username, password, sites=sites, transport=args.transport,
+                                concurrency=args.concurrency, canary=args.canary,
+                                wave_growth=args.wave_growth, site_cap=args.site_cap,
+                                window_seconds=args.window_minutes * 60, device_seconds=device_seconds)
+        if args.plan:
+            return 0
+
     gcp_key = input('ENTER GCP CREDENTIALS: ')
     bucket_name = "arista_eos_images"
 
-    cur_dir = os.getcmd()
-    image_file.path = cur_dir+"/"+image_name
-    if not os.path.exists(image_file_path):
-        # downloading image from GCP
-        try:
-            storage_client = storage.Client.from_service_account_json("{}".format(gcp_key))
-            bucket = storage_client.get_bucket(bucket_name)
-            blob = bucket.get_bloc(image_name)
-            with open(image_name, "wb") as file_obj:
-                blob.download_to_file(file_obj)
-                print("File downloaded successfully free GCP")
-
-        except AttributeError:
+    # downloading image from GCP into the shared local image cache
+    try:
+        from google.cloud import storage
+        storage_client = storage.Client.from_service_account_json("{}".format(gcp_key))
+        bucket = storage_client.get_bucket(bucket_name)
+        blob = bucket.get_blob(image_name)
+        if blob is None:
             print('File {} not found in GCP'.format(image_name))
-            retrun 1
-
-        except ValueError:
-            print('incorrect gcp key file')
-            return 1
-    print('{} IMAGE PATH = {} {}'.format{LINE, image_file_path, LINE})
-
-    for ip_address in device_list:
-        args = {
-            'username': username,
-            'password': password,
-            'ip_address': ip_address,
-            'path': image_file_path
-        }
-
-        #create arista handler
-        arista_handler = AristaOsUpgrade(args)
-        #copy running_config to a file on the Host.
-        arista_handler.copy_running_config()
-
-        # Take a snapshot of the state of Arista Device before upgrade
-        pre_upgrade_state = AristaState(image_file_path)
-        pre_upgrade_state.populate(arista_handler.run_command_json)
-
-        if pre_upgrade_state.running_version in image_file_path:
-            print('Device is already running with upgraded version: {}'
-                   .format(pre_upgrade_state.running_version))
-            return
-        pre_upgrade_state.check_flash_memory()
-
-        # start upgrade procedure.
-        arista_handler.file_transfer()
-        arista_handler.modify_boot_config()
-        arista_handler.save_and_reload()
-        arista_handler.reboot_status()
-
-        print('{} SLEEPING FOR {} SECONDS AFTER SUCCESSFUL REBOOT{}'.format(LINE, WAIT_AFTER_REBOOT, LINE))
-        time.sleep(WAIT_AFTER_REBOOT)
-
-        arista_handler.connect_to_device()
-
-        post_upgrade_state = AristaState(image_file_path)
-        post_upgrade_state.populate(arista_handler.run_command_json)
-
-        if post_upgrade_state.running_version in image_file_path:
-            print('{} VERSION CHECK TEST: PASS{}'.format(LINE, LINE))
-        else:
-            print('{} VERSION CHECK TEST: FAIL {}\n, running_version: {}'
-                   .format(LINE, LINE, post_upgrade_state,running_version))
-            return 1
-
-        all_test_passed = false
-        retry_counter = 10
-
-        while retry_counter > 0 and not all_test_passed:
-            post_upgrade_state.populate(arista_handler,run_command_json)
-            if post_upgrade_state.total_ip_routes < pre_upgrade_state.total_ip_routes:
-                print('{} IP ROUTE TEST: FAIL, got {}, expected {} {}'
-                      .format(LINE, post_upgrade_state.total_ip_routes,
-                              pre_upgrade_state.total_ip_routes, LIKE))
-                retry_counter -= 1
-                time.sleep(30)
-                continue
-            else:
-                print('{} IP ROUTE TEST: PASS {}'.format(LINE, LINE))
-
-            if not (pre_upgrade_state.debug_commands['interfaces_status']['output'] ==
-                    post_upgrade_state.debug_commands['interfaces_status']['output'])
-                print('{} INTERFACES STATUS TEST= FAIL {}'-format(LINE, LINE))
-                print(pre_upgrade_state.debug_commands['interfaces_status']['output'])
-                print(post_upgrade_state.debug_commands['interfaces_status']['output'])
-                retry_counter -= 1
-                time.sleep(30)
-                continue
-            else:
-                print('{} INTERFACES STATUS TEST: PASS {}'.format(LINE, LINE))
-
-            if not (pre_upgrade_state.debug_commands['ming_summary']['output'] ==
-                    post_upgrade_state.debug_commands['ming_summary']['output']):
-                print('{} MLAG STATUS TEST: FAIL {}'.format(LINE, LINE))
-                print(pre_upgrade_state.debug_commands['mlag_summary']['output'])
-                print(post_upgrade_state.debug_commands['mlag_summary']['output'])
-                retry_counter -= 1
-                time.sleep(30)
-                continue
-            else:
-                print('{} MLAG STATUS TEST: PASS {}'.format(LINE, LINE))
-            all_test_passed = True
-
-        if retry_counter > 0
-            return 0
-        else:
             return 1
+        if args.preflight:
+            # only the blob metadata is needed, the image is not downloaded
+            from preflight import BLOCKED, preflight
+            results = preflight(device_list, username, password, image_name, blob.size,
+                                transport=args.transport, concurrency=args.preflight_concurrency,
+                                device_seconds=device_seconds, upgrade_concurrency=args.concurrency)
+            return 1 if any(result.status == BLOCKED for result in results) else 0
+        cache = ImageCache(args.image_cache_dir, int(args.image_cache_size * 1024 ** 3))
+        with recorder.phase('image_download'):
+            image_file_path = cache.fetch(blob)
+
+    except ValueError:
+        print('incorrect gcp key file')
+        return 1
+    except ImageCacheError as e:
+        print('IMAGE DOWNLOAD: FAIL, ERROR: {}'.format(e))
+        return 1
+    print('{} IMAGE PATH = {} {}'.format(LINE, image_file_path, LINE))
+
+    image_md5 = local_md5(image_file_path)
+
+    # imported here, both depend on the classes above
+    from prestage import prestage
+    from upgrade_engine import UpgradeEngine
+
+    # always there, unthrottled without the flags, so every copy can resume
+    # Mbit/s to bytes/s
+    site_rates = {site: mbps * 125000 for site, mbps in (doc.get('site_bandwidth') or {}).items()}
+    transfer_scheduler = TransferScheduler(global_rate=args.max_bandwidth * 125000,
+                                           site_rate=args.site_bandwidth * 125000,
+                                           site_rates=site_rates,
+                                           max_transfers=args.max_transfers,
+                                           transfers_per_site=args.transfers_per_site)
+
+    if args.prestage:
+        result = prestage(device_list, image_file_path, username, password,
+                          image_md5, concurrency=args.concurrency, transport=args.transport,
+                          sites=sites, transfer_scheduler=transfer_scheduler)
+        cache.release()
+        return result
+
+    journal = Journal(args.journal_dir, image=os.path.basename(image_file_path))
+    if args.fresh:
+        journal.clear()
+
+    engine = UpgradeEngine(device_list,
+                           image_file_path,
+                           username,
+                           password,
+                           md5=image_md5,
+                           transport=args.transport,
+                           concurrency=args.concurrency,
+                           canary=args.canary,
+                           wave_growth=args.wave_growth,
+                           max_failures=args.max_failures,
+                           journal=journal,
+                           sites=sites,
+                           transfer_scheduler=transfer_scheduler,
+                           waves=waves)
+    engine.run()
+    result = engine.report()
+    metrics_path = recorder.write_metrics()
+    if metrics_path:
+        print('{} METRICS WRITTEN TO {} {}'.format(LINE, metrics_path, LINE))
+    recorder.close()
+    # the image may be evicted by other runs from here on
+    cache.release()
+    return result
 
 if __name__=="__main__":
     sys.exit(main())
@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from eapi import EapiSession
+
+# below the usual ephemeral port range, so client sockets never hold them
+SSH_BASE_PORT = 20000
+EAPI_BASE_PORT = 25000
+
+
+def start_simulator(devices, platform='eos', latency=0.0, output_size=20000, ssh=False, eapi=True):
+    cmd = [sys.executable, os.path.join(ROOT, 'simulator.py'), '--devices', str(devices),
+           '--platform', platform, '--latency', str(latency), '--output_size', str(output_size)]
+    if ssh:
+        cmd += ['--ssh_base_port', str(SSH_BASE_PORT)]
+    if eapi:
+        cmd += ['--eapi_base_port', str(EAPI_BASE_PORT)]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=tempfile.gettempdir(), text=True)
+    line = process.stdout.readline()
+    if not line.startswith('SIMULATOR READY'):
+        process.kill()
+        raise RuntimeError('simulator did not start: {}'.format(line))
+    return process
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = {}
+
+    def record(self, phase, seconds):
+        self.phases.setdefault(phase, []).append(seconds)
+
+    def timed(self, phase, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def report(self):
+        for phase, values in self.phases.items():
+            print('    {:<22} n={:<5} p50 {:7.1f} ms  p95 {:7.1f} ms  max {:7.1f} ms'.format(
+                phase, len(values), percentile(values, 0.5) * 1000,
+                percentile(values, 0.95) * 1000, max(values) * 1000))
+
+
+def snapshot_eapi(index, timer, batched):
+    from arista_eos_upgrade import AristaState
+    session = EapiSession('127.0.0.1', 'admin', 'admin', port=EAPI_BASE_PORT + index, protocol='http')
+    state = AristaState('/dev/null')
+    if batched:
+        timer.timed('snapshot_batched', state.populate, session.run_command, run_commands=session.run_commands)
+    else:
+        timer.timed('snapshot_per_command', state.populate, session.run_command)
+    session.close()
+    return state.running_version is not None
+
+
+def upgrade_session(index, timer, workdir):
+    from arista_eos_upgrade import AristaOsUpgrade, AristaState
+    args = {'ip_address': '127.0.0.1', 'port': SSH_BASE_PORT + index, 'username': 'admin',
+            'password': 'admin', 'path': os.path.join(workdir, 'EOS-4.28.3M.swi'),
+            'transport': 'eapi', 'eapi_port': EAPI_BASE_PORT + index, 'eapi_protocol': 'http'}
+    handler = timer.timed('connect', AristaOsUpgrade, args)
+    timer.timed('backup', handler.copy_running_config)
+    state = AristaState(args['path'])
+    timer.timed('snapshot', state.populate, handler.run_command_json, run_commands=handler.run_commands_json)
+    handler.ssh_conn.disconnect()
+    return state.running_version is not None
+
+
+async def collect_ssh(count, timer, concurrency):
+    from confirmations import DeviceState
+    from scrapli.driver.core import AsyncEOSDriver
+    semaphore = asyncio.Semaphore(concurrency)
+    static_commands = {'running_config': {'command': 'show running-config', 'output': {}}}
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            async with AsyncEOSDriver(host='127.0.0.1', port=SSH_BASE_PORT + index, auth_username='admin',
+                                      auth_password='admin', auth_strict_key=False,
+                                      transport='asyncssh') as conn:
+                timer.record('collect_connect', time.perf_counter() - start)
+                state = DeviceState('show hostname', ['show ip interface brief'], static_commands, conn,
+                                    string=['secret', 'password'])
+                start = time.perf_counter()
+                await state.async_populate_pipelined()
+                timer.record('collect_commands', time.perf_counter() - start)
+            return True
+
+    return await asyncio.gather(*(one(index) for index in range(count)), return_exceptions=True)
+
+
+def run_suite(name, count, concurrency, func):
+    timer = PhaseTimer()
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = func(timer)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ok = sum(1 for result in results if result is True)
+    print('{} devices={} concurrency={}: {:.2f}s wall, {:.1f} devices/s, {} ok, '
+          'peak traced {:.1f} MB, max rss {:.1f} MB'.format(
+              name, count, concurrency, elapsed, count / elapsed, ok, peak / 1024 ** 2,
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    timer.report()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='simulated per command latency in seconds')
+    parser.add_argument('--suites', nargs='+', default=['snapshot'],
+                        choices=['snapshot', 'upgrade', 'collect'],
+                        help='upgrade needs netmiko and asyncssh, collect needs scrapli and asyncssh')
+    args = parser.parse_args()
+
+    ssh = 'upgrade' in args.suites or 'collect' in args.suites
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, 'EOS-4.28.3M.swi'), 'wb') as f:
+        f.write(b'\0' * 1024)
+
+    for count in args.sizes:
+        simulator = start_simulator(count, latency=args.latency, ssh=ssh)
+        try:
+            workers = min(args.concurrency, count)
+            if 'snapshot' in args.suites:
+                for batched in (False, True):
+                    def suite(timer):
+                        with ThreadPoolExecutor(max_workers=workers) as executor:
+                            return list(executor.map(lambda i: snapshot_eapi(i, timer, batched), range(count)))
+                    run_suite('AristaState eAPI {}'.format('batched' if batched else 'per command'),
+                              count, workers, suite)
+            if 'upgrade' in args.suites:
+                cwd = os.getcwd()
+                os.chdir(workdir)
+                try:
+                    def suite(timer):
+                        with ThreadPoolExecutor(max_workers=workers) as executor:
+                            return list(executor.map(lambda i: upgrade_session(i, timer, workdir), range(count)))
+                    run_suite('AristaOsUpgrade connect/backup/snapshot', count, workers, suite)
+                finally:
+                    os.chdir(cwd)
+            if 'collect' in args.suites:
+                run_suite('DeviceState pipelined collection', count, args.concurrency,
+                          lambda timer: asyncio.run(collect_ssh(count, timer, args.concurrency)))
+        finally:
+            simulator.terminate()
+            simulator.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
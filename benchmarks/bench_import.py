@@ -0,0 +1,78 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['cli', 'arista_eos_upgrade', 'confirmations', 'config_diff', 'inventory',
+           'upgrade_engine', 'scheduler', 'preflight']
+
+# must not be loaded by importing any of the modules above
+HEAVY = ['netmiko', 'paramiko', 'google.cloud.storage', 'scrapli', 'git', 'yaml', 'pytz', 'textfsm',
+         'asyncssh']
+
+
+def run_python(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+
+def import_times(module, repeat):
+    times = []
+    for _ in range(repeat):
+        elapsed, result = run_python('import {}'.format(module))
+        if result.returncode != 0:
+            raise RuntimeError('importing {} failed:\n{}'.format(module, result.stderr))
+        times.append(elapsed)
+    return times
+
+
+def heavy_modules(module):
+    code = 'import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'.format(module, HEAVY)
+    _, result = run_python(code)
+    return result.stdout.split()
+
+
+def slowest_imports(module, count=5):
+    # self + cumulative microseconds per imported module, from -X importtime
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # 'import time:   self |  cumulative | name'
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max_ms', type=float, default=None,
+                        help='fail when a module takes longer than this over a bare interpreter (median)')
+    args = parser.parse_args()
+
+    baseline = statistics.median(import_times('sys', args.repeat))
+    print('bare interpreter: {:.1f} ms'.format(baseline * 1000))
+    failed = False
+    for module in args.modules:
+        median = statistics.median(import_times(module, args.repeat)) - baseline
+        heavy = heavy_modules(module)
+        print('{:<20} +{:6.1f} ms {}'.format(module, median * 1000,
+                                            'loads ' + ', '.join(heavy) if heavy else ''))
+        for cumulative_us, name in slowest_imports(module, 3):
+            print('    {:<30} {:6.1f} ms'.format(name, cumulative_us / 1000))
+        if heavy or (args.max_ms is not None and median * 1000 > args.max_ms):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
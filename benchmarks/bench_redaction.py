@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redaction import Redactor, iter_lines
+
+ENCRYPT_STRINGS = ['password',
+                   'secret',
+                   'wpa-psk ascii',
+                   'key-string',
+                   'key',
+                   'snmp-server community',
+                   'authentication text',
+                   'authentication-key',
+                   'authentication',
+                   'version 1',
+                   'version 2c',
+                   'version 3'
+                   ]
+
+FILLER_LINES = ['   mtu 9214',
+                '   ip address 10.{n}.0.1/31',
+                '   spanning-tree portfast',
+                '   channel-group {n} mode active',
+                '!',
+                ]
+
+CONFIG_LINES = ['interface Ethernet{n}',
+                '   description uplink to rack {n}',
+                '   switchport trunk allowed vlan 10-{n}',
+                '   no shutdown',
+                'username admin{n} privilege 15 secret sha512 $6$abcdefgh{n}',
+                'snmp-server community public{n} ro',
+                'router bgp 650{n}',
+                '   neighbor 10.0.{n}.1 password 7 0822455D0A16{n}',
+                '   neighbor 10.0.{n}.1 remote-as 65001',
+                'ip ospf authentication-key 7 070C2E4D{n}',
+                'ip ospf authentication message-digest',
+                'snmp-server host 10.1.1.{n} version 2c private',
+                '!',
+                ]
+
+
+def legacy_redact(data, encrypt_strings):
+    # the per-line, per-keyword loop DeviceState.run_command used before
+    output = data.split("\n")
+    output_data = []
+    for data in output:
+        count = 0
+        for item in encrypt_strings:
+            if item in data:
+                n = re.sub('(?<={})(.*)'.format(item), ' ***********', count=2000, string=data)
+                output_data.append(n)
+                break
+            else:
+                count+=1
+            if len(encrypt_strings) == count:
+                output_data.append(data)
+    return output_data
+
+
+def synthetic_config(size_mb, sensitive_ratio, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        choices = CONFIG_LINES if rng.random() < sensitive_ratio else FILLER_LINES
+        line = rng.choice(choices).format(n=rng.randint(1, 4000))
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 8],
+                        help='synthetic config sizes in MB')
+    parser.add_argument('--sensitive_ratio', type=float, default=0.2,
+                        help='share of lines drawn from the keyword heavy config lines')
+    args = parser.parse_args()
+
+    redactor = Redactor(ENCRYPT_STRINGS)
+    for size_mb in args.sizes:
+        config = synthetic_config(size_mb, args.sensitive_ratio)
+        legacy_time, legacy_output = timed(legacy_redact, config, ENCRYPT_STRINGS)
+        new_time, new_output = timed(redactor.redact, config)
+        stream_time, _ = timed(lambda text: sum(1 for _ in redactor.redact_lines(iter_lines(text))), config)
+        if legacy_output != new_output:
+            print('MISMATCH for {} MB config'.format(size_mb))
+            return 1
+        print('{:>5} MB  legacy {:7.3f}s  compiled {:7.3f}s  streamed {:7.3f}s  speedup {:5.1f}x'.format(
+            size_mb, legacy_time, new_time, stream_time, legacy_time / new_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
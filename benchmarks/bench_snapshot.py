@@ -0,0 +1,128 @@
+import argparse
+import copy
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot import ARISTA_EXTRACTORS, extract_arista
+
+
+def find_key(data, target_key):
+    # AristaState.find_key as used by the old _set_* methods
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from find_key(value, target_key)
+        elif key == target_key:
+            yield value
+
+
+def legacy_fields(debug_commands):
+    version_output = debug_commands['version_summary']['output']
+    free_memory = sum(int(item) for item in find_key(version_output, 'memFree'))
+    running_version = None
+    for item in find_key(version_output, 'version'):
+        running_version = item
+    model_name = None
+    for item in find_key(version_output, 'modelName'):
+        model_name = item
+    total_ip_routes = sum(int(item) for item in
+                          find_key(debug_commands['route_summary']['output'], 'totalRoutes'))
+    return free_memory, running_version, model_name, total_ip_routes
+
+
+def synthetic_state(vrfs, interfaces):
+    protocols = ['connected', 'static', 'ospf', 'bgp', 'isis', 'rip']
+    route_summary = {'vrfs': {}}
+    for v in range(vrfs):
+        route_summary['vrfs']['VRF{}'.format(v)] = {
+            'routerId': '10.0.{}.1'.format(v % 255),
+            'totalRoutes': 1000 + v,
+            'maskLen': {str(m): m * 7 for m in range(8, 33)},
+            'ospfCounts': {'ospfTotal': v, 'ospfIntraArea': v, 'ospfInterArea': 0},
+            'bgpCounts': {'bgpTotal': v * 3, 'bgpExternal': v, 'bgpInternal': v * 2},
+            'protocols': {p: {'routes': v, 'paths': v * 2} for p in protocols},
+        }
+    interface_statuses = {}
+    for i in range(interfaces):
+        interface_statuses['Ethernet{}/1'.format(i)] = {
+            'linkStatus': 'connected',
+            'description': 'to rack {}'.format(i),
+            'bandwidth': 100000000000,
+            'duplex': 'duplexFull',
+            'vlanInformation': {'interfaceMode': 'trunk', 'interfaceForwardingModel': 'bridged'},
+            'interfaceType': '100GBASE-SR4',
+        }
+    mlag = {'interfaces': {str(i): {'localInterface': 'Port-Channel{}'.format(i),
+                                    'status': 'active-full',
+                                    'localInterfaceStatus': 'up',
+                                    'peerInterfaceStatus': 'up'} for i in range(interfaces // 10)}}
+    version = {'modelName': 'DCS-7280CR3-32P4', 'version': '4.28.3M', 'memTotal': 32000000,
+               'memFree': 21000000, 'serialNumber': 'JPE00000000',
+               'details': {'packages': {'pkg{}'.format(p): {'version': '1.0.{}'.format(p)} for p in range(20)},
+                           'version': '4.28.3M'}}
+    return {'version_summary': {'output': version},
+            'route_summary': {'output': route_summary},
+            'interfaces_status': {'output': {'interfaceStatuses': interface_statuses}},
+            'mlag_summary': {'output': mlag}}
+
+
+def extractor_fields(debug_commands):
+    # the same four fields as legacy_fields, through the extractors
+    version = ARISTA_EXTRACTORS['version_summary'].extract(debug_commands['version_summary']['output'])
+    routes = ARISTA_EXTRACTORS['route_summary'].extract(debug_commands['route_summary']['output'])
+    return (sum(int(item) for item in version['memFree']),
+            version[('version',)][-1][1],
+            version['modelName'][-1],
+            sum(int(item) for item in routes['totalRoutes']))
+
+
+def timed(func, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(arg)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def retained(func, states):
+    tracemalloc.start()
+    kept = [func(state) for state in states]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vrfs', type=int, default=2000)
+    parser.add_argument('--interfaces', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--devices', type=int, default=200,
+                        help='number of device states kept for the memory comparison')
+    args = parser.parse_args()
+
+    state = synthetic_state(args.vrfs, args.interfaces)
+    legacy_time, legacy = timed(legacy_fields, state, args.repeat)
+    fields_time, fields = timed(extractor_fields, state, args.repeat)
+    new_time, snapshot = timed(extract_arista, state, args.repeat)
+    if legacy != fields or legacy != (snapshot.free_memory, snapshot.running_version,
+                  snapshot.model_name, snapshot.total_ip_routes):
+        print('MISMATCH: {} != {}'.format(legacy, snapshot))
+        return 1
+    print('find_key, one pass per field          {:8.2f} ms'.format(legacy_time * 1000))
+    print('extractor, one pass per command       {:8.2f} ms'.format(fields_time * 1000))
+    print('full snapshot incl. interfaces, mlag  {:8.2f} ms'.format(new_time * 1000))
+
+    small = synthetic_state(args.vrfs // 10, args.interfaces // 10)
+    states = [copy.deepcopy(small) for _ in range(args.devices)]
+    raw_size, _ = retained(copy.deepcopy, states)
+    snapshot_size, _ = retained(extract_arista, states)
+    print('{} devices kept as raw output {:8.1f} MB, as snapshots {:8.1f} MB'.format(
+        args.devices, raw_size / 1024 ** 2, snapshot_size / 1024 ** 2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
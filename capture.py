@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+import re
+import time
+
+# a partial line longer than this is written out as it is, so one
+# session never buffers more than a read chunk plus MAX_LINE
+MAX_LINE = 64 * 1024
+# seconds without any output before a capture gives up
+READ_TIMEOUT = 120
+POLL_INTERVAL = 0.05
+
+
+class CaptureError(Exception):
+    pass
+
+
+def safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'output'
+
+
+class CaptureFile:
+    # Line by line sink: redacts, writes and hashes each line, keeping
+    # nothing but counters in memory.
+
+    def __init__(self, path, redactor=None, compress=False):
+        if compress and not path.endswith('.gz'):
+            path += '.gz'
+        self.path = path
+        self.redactor = redactor
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if compress:
+            self.file = gzip.open(path, 'wt', compresslevel=6)
+        else:
+            self.file = open(path, 'w')
+        self.lines = 0
+        self.bytes = 0
+        self.sha1 = hashlib.sha1()
+
+    def write_line(self, line):
+        if self.redactor is not None:
+            line = self.redactor.redact_line(line)
+        data = line + '\n'
+        self.file.write(data)
+        self.sha1.update(data.encode())
+        self.lines += 1
+        self.bytes += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def summary(self):
+        return {'file': self.path, 'lines': self.lines, 'bytes': self.bytes, 'sha1': self.sha1.hexdigest()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LineSplitter:
+    # Turns channel chunks into lines for the sink. The command echo is
+    # dropped, and the trailing partial line is checked for the prompt
+    # that ends the output.
+
+    def __init__(self, sink, prompt_pattern, command=None):
+        self.sink = sink
+        self.prompt = re.compile(prompt_pattern, re.M | re.I) if isinstance(prompt_pattern, str) else prompt_pattern
+        self.echo = command
+        self.partial = ''
+
+    def feed(self, text):
+        lines = (self.partial + text.replace('\r', '')).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            if self.echo is not None:
+                echoed = line.rstrip().endswith(self.echo)
+                self.echo = None
+                if echoed:
+                    continue
+            self.sink.write_line(line)
+        if len(self.partial) > MAX_LINE:
+            self.sink.write_line(self.partial)
+            self.partial = ''
+        return bool(self.prompt.search(self.partial.strip()))
+
+
+def _decode(data):
+    return data.decode(errors='replace') if isinstance(data, bytes) else data
+
+
+def capture_scrapli(conn, command, sink, timeout=READ_TIMEOUT):
+    # send_command() would keep the whole output, read the channel instead
+    splitter = LineSplitter(sink, conn.comms_prompt_pattern, command)
+    conn.channel.write(command)
+    conn.channel.send_return()
+    deadline = time.monotonic() + timeout
+    while True:
+        data = _decode(conn.channel.read())
+        if data:
+            if splitter.feed(data):
+                return sink
+            deadline = time.monotonic() + timeout
+        elif time.monotonic() > deadline:
+            raise CaptureError('no output for {} seconds from "{}"'.format(timeout, command))
+        else:
+            time.sleep(POLL_INTERVAL)
+
+
+async def async_capture_scrapli(conn, command, sink, timeout=READ_TIMEOUT):
+    splitter = LineSplitter(sink, conn.comms_prompt_pattern, command)
+    conn.channel.write(command)
+    conn.channel.send_return()
+    deadline = time.monotonic() + timeout
+    while True:
+        data = _decode(await conn.channel.read())
+        if data:
+            if splitter.feed(data):
+                return sink
+            deadline = time.monotonic() + timeout
+        elif time.monotonic() > deadline:
+            raise CaptureError('no output for {} seconds from "{}"'.format(timeout, command))
+
+
+def capture_netmiko(conn, command, sink, timeout=READ_TIMEOUT):
+    prompt = conn.find_prompt()
+    splitter = LineSplitter(sink, r'^{}$'.format(re.escape(prompt)), command)
+    conn.write_channel(command + conn.RETURN)
+    deadline = time.monotonic() + timeout
+    while True:
+        data = conn.read_channel()
+        if data:
+            if splitter.feed(data):
+                return sink
+            deadline = time.monotonic() + timeout
+        elif time.monotonic() > deadline:
+            raise CaptureError('no output for {} seconds from "{}"'.format(timeout, command))
+        else:
+            time.sleep(POLL_INTERVAL)
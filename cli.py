@@ -0,0 +1,34 @@
+import argparse
+import importlib
+import sys
+
+# subcommand -> (module, arguments put in front, help); a module is only
+# imported once its subcommand runs, and drivers and the cloud SDK only
+# when the code path needs them
+COMMANDS = {
+    'upgrade': ('arista_eos_upgrade', [], 'upgrade Arista EOS devices'),
+    'plan': ('arista_eos_upgrade', ['--plan'], 'print the MLAG/LLDP aware upgrade waves only'),
+    'preflight': ('arista_eos_upgrade', ['--preflight'], 'version and free flash check of the fleet, no upgrade'),
+    'collect': ('confirmations', [], 'collect pre/post confirmations'),
+    'diff': ('config_diff', [], 'diff pre and post running configs'),
+    'inventory': ('inventory', [], 'list or count the devices an inventory selection resolves to'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='network automation tools',
+        epilog='\n'.join('  {:<10} {}'.format(name, command[2]) for name, command in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=sorted(COMMANDS), metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER,
+                        help='arguments of the command, see "<command> --help"')
+    args = parser.parse_args(argv)
+
+    module_name, prefix, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    return module.main(prefix + args.args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
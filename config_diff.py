@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from snapshot_store import SnapshotStore
+
+
+def config_lines(lines):
+    # what parse_config looks at, so a changed '! device: ...' header
+    # does not make two configs differ
+    for line in lines or []:
+        stripped = line.strip()
+        if stripped and not stripped.startswith('!'):
+            yield line.rstrip()
+
+
+def config_hash(lines):
+    sha1 = hashlib.sha1()
+    for line in config_lines(lines):
+        sha1.update(line.encode() + b'\n')
+    return sha1.hexdigest()
+
+
+# sections where EOS applies the entries in order, so moving a line is a change
+ORDERED_SECTIONS = ('ip access-list', 'ipv6 access-list', 'mac access-list',
+                    'ip prefix-list', 'ipv6 prefix-list', 'route-map')
+
+
+def ordered_sequences(lines):
+    # {section: [lines in config order]} for the order sensitive sections.
+    # route-map blocks are grouped per map and prefix-list one-liners per
+    # list, so moving a whole block or entry shows up as well; duplicate
+    # lines, which parse_config folds into one, are kept.
+    sequences = {}
+    current = None
+    for line in lines or []:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('!'):
+            continue
+        if line[0] != ' ':
+            current = None
+            for prefix in ORDERED_SECTIONS:
+                if stripped.startswith(prefix + ' '):
+                    words = stripped.split()
+                    if prefix == 'route-map':
+                        current = ' '.join(words[:2])
+                    elif 'prefix-list' in prefix:
+                        current = ' '.join(words[:3])
+                    else:
+                        current = stripped
+                    break
+        if current is not None:
+            sequences.setdefault(current, []).append(stripped)
+    return sequences
+
+
+def reordered_sections(pre_lines, post_lines):
+    pre = ordered_sequences(pre_lines)
+    post = ordered_sequences(post_lines)
+    return sorted(section for section in pre.keys() & post.keys() if pre[section] != post[section])
+
+
+def parse_config(lines):
+    # nested {line: children} by indentation, '!' separators and blanks dropped
+    root = {}
+    stack = [(-1, root)]
+    for line in lines or []:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('!'):
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        while indent <= stack[-1][0]:
+            stack.pop()
+        children = stack[-1][1].setdefault(stripped, {})
+        stack.append((indent, children))
+    return root
+
+
+def diff_tree(pre, post, path=()):
+    # (sign, section path, line) for every line added or removed, whole
+    # sections count as one change at their top line
+    changes = []
+    for line in pre:
+        if line not in post:
+            changes.append(('-', path, line))
+        elif pre[line] != post[line]:
+            changes.extend(diff_tree(pre[line], post[line], path + (line,)))
+    for line in post:
+        if line not in pre:
+            changes.append(('+', path, line))
+    return changes
+
+
+def section_lines(tree, depth):
+    lines = []
+    for line, children in tree.items():
+        lines.append('{}{}'.format('   ' * depth, line))
+        lines.extend(section_lines(children, depth + 1))
+    return lines
+
+
+def format_diff(changes, pre_tree, post_tree):
+    lines = []
+    printed = ()
+    for sign, path, line in changes:
+        # print the enclosing sections once, as context
+        common = 0
+        while common < min(len(printed), len(path)) and printed[common] == path[common]:
+            common += 1
+        for depth in range(common, len(path)):
+            lines.append('  {}{}'.format('   ' * depth, path[depth]))
+        printed = path
+        tree = pre_tree if sign == '-' else post_tree
+        for part in path:
+            tree = tree[part]
+        lines.append('{} {}{}'.format(sign, '   ' * len(path), line))
+        lines.extend('{} {}'.format(sign, child) for child in section_lines(tree[line], len(path) + 1))
+    return '\n'.join(lines)
+
+
+def diff_device(pair):
+    hostname, pre_lines, post_lines = pair
+    pre_tree = parse_config(pre_lines)
+    post_tree = parse_config(post_lines)
+    changes = diff_tree(pre_tree, post_tree)
+    sections = sorted(set(path[0] if path else line for _, path, line in changes))
+    reordered = reordered_sections(pre_lines, post_lines)
+    # only pairs whose config_hash differs get here, so no added or
+    # removed line means lines moved (or a duplicate line came or went)
+    summary = {'hostname': hostname,
+               'status': 'changed' if changes else 'reordered',
+               'added': sum(1 for sign, _, _ in changes if sign == '+'),
+               'removed': sum(1 for sign, _, _ in changes if sign == '-'),
+               'sections': sections,
+               'reordered': reordered}
+    diff = format_diff(changes, pre_tree, post_tree)
+    post_sequences = ordered_sequences(post_lines)
+    for section in reordered:
+        # the new order in full, the old one is in the pre snapshot
+        diff += ('\n' if diff else '') + '\n'.join(['~ {}'.format(section)] +
+                                                   ['~    {}'.format(line) for line in post_sequences[section]])
+    return summary, diff
+
+
+def pairs_from_store(store, rpd_id, command_key='running_config'):
+    for hostname, key, pre, post in store.iter_compare(rpd_id):
+        if key == command_key:
+            yield hostname, pre, post
+
+
+def pairs_from_text(pre_path, post_path, command_key='running_config'):
+    # the PRE_/POST_ copies git_push leaves behind, loaded through a throwaway store
+    store = SnapshotStore(':memory:')
+    store.import_text(pre_path, 'text')
+    store.import_text(post_path, 'text')
+    yield from pairs_from_store(store, 'text', command_key)
+    store.close()
+
+
+def diff_chunk(pairs):
+    return [diff_device(pair) for pair in pairs]
+
+
+def changed_chunks(pairs, unchanged, chunksize):
+    # identical configs never reach the pool
+    chunk = []
+    for hostname, pre, post in pairs:
+        if pre is not None and post is not None and config_hash(pre) == config_hash(post):
+            unchanged.append(hostname)
+            continue
+        chunk.append((hostname, pre, post))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_diff(pairs, workers=None, chunksize=8):
+    # Executor.map would submit every pair up front, keep only a couple of
+    # chunks per worker in flight instead
+    workers = workers or os.cpu_count()
+    unchanged = []
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in changed_chunks(pairs, unchanged, chunksize):
+            pending.append(executor.submit(diff_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                results.extend(pending.popleft().result())
+        while pending:
+            results.extend(pending.popleft().result())
+    return unchanged, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--store', help='snapshot store written by confirmations.py --store')
+    source.add_argument('--text', nargs=2, metavar=('PRE', 'POST'),
+                        help='pre and post confirmations text files')
+    parser.add_argument('--rpd', help='RPD id, required with --store')
+    parser.add_argument('--command', default='running_config',
+                        help='command key to diff')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='size of the process pool')
+    parser.add_argument('--output', help='write the full diffs to this file instead of stdout')
+    parser.add_argument('--json', action='store_true', help='print the summary as json lines')
+    args = parser.parse_args(argv)
+
+    if args.store:
+        if not args.rpd:
+            parser.error('--rpd is required with --store')
+        store = SnapshotStore(args.store)
+        pairs = pairs_from_store(store, args.rpd, args.command)
+    else:
+        pairs = pairs_from_text(args.text[0], args.text[1], args.command)
+
+    unchanged, results = run_diff(pairs, workers=args.workers)
+
+    for summary, _ in results:
+        sections = summary['sections'] + [section for section in summary['reordered']
+                                          if section not in summary['sections']]
+        if args.json:
+            print(json.dumps(summary))
+        elif summary['status'] == 'reordered':
+            print('{}: reordered {}'.format(summary['hostname'], ', '.join(sections[:5]) or 'lines'))
+        else:
+            print('{hostname}: +{added} -{removed} in {sections}'.format(
+                hostname=summary['hostname'], added=summary['added'], removed=summary['removed'],
+                sections=', '.join(sections[:5]) + (' ...' if len(sections) > 5 else '')))
+    reordered = sum(1 for summary, _ in results if summary['status'] == 'reordered')
+    print('{} devices unchanged, {} devices changed, {} devices reordered'.format(
+        len(unchanged), len(results) - reordered, reordered))
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    for summary, diff in results:
+        out.write('=== {} ===\n{}\n'.format(summary['hostname'], diff))
+    if args.output:
+        out.close()
+    return 1 if results else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,31 +1,54 @@
-import yaml
 import json
+import asyncio
+import argparse
 import re
 import os
 import sys
-import git
 import time
 import platform
 import subprocess
 
+from collections import deque
 from datetime import datetime, timedelta
-from pytz import timezone
 from shutil import copyfile
-from subprocess import Popen, PIPE
-from scrapli.driver.core import IOSXEDriver, EOSDriver
 
-eastern = timezone('US/Eastern')
-now = datetime.now(tz=eastern)
+from capture import (CaptureFile, async_capture_scrapli, capture_scrapli,
+                     safe_name)
+from inventory import add_arguments as add_inventory_arguments
+from inventory import expand, load_devices, reader_for
+from parsing import ParsePool, attach
+from publisher import GIT_HOST, Publisher, reachable, remote_host
+from redaction import get_redactor
+from snapshot_store import SnapshotStore
+
 fmt = '%m-%d-%Y,%H:%M'
-current_date = now.strftime(fmt)
+_run_started = None
+
+
+def run_started():
+    # taken once per run on first use, not at import time
+    global _run_started
+    if _run_started is None:
+        from pytz import timezone
+        _run_started = datetime.now(tz=timezone('US/Eastern'))
+    return _run_started
+
+
+def current_date():
+    return run_started().strftime(fmt)
+
 
 class DeviceState:
 
-    def __init__(self, host_command = None, commands=None, static_commands=None, conn=None, string=None):
-        self.debug_commands = static_commands
+    def __init__(self, host_command = None, commands=None, static_commands=None, conn=None, string=None,
+                 stream_dir=None, compress=False):
+        self.debug_commands = dict(static_commands)
         self.host_command = host_command
         self.conn = conn
         self.encrypt_strings = string
+        # with stream_dir every output goes line by line to its own file
+        self.stream_dir = stream_dir
+        self.compress = compress
         self.debug_output = {}
         if commands is not None:
             for command in commands:
@@ -42,40 +65,249 @@ class DeviceState:
             self.debug_output[hostname+'_'+k] = {}
             cmd = self.debug_commands[k]['command']
             self.debug_output[hostname+'_'+k]['command'] = cmd
-            self.debug_output[hostname+'_'+k]['output'] = self.run_command(self.debug_commands[k]['command'])
+            self.debug_output[hostname+'_'+k]['output'] = self.capture(hostname, k)
 
         return hostname, self.debug_output
 
+    def populate_pipelined(self, hostname=None):
+        # all commands in one send_commands exchange, hostname from the prompt
+        if hostname is None:
+            hostname = hostname_from_prompt(self.conn.get_prompt())
+        keys = list(self.debug_commands.keys())
+        responses = self.conn.send_commands([self.debug_commands[k]['command'] for k in keys])
+        return hostname, self.pipelined_output(hostname, keys, responses)
+
+    async def async_populate_pipelined(self, hostname=None):
+        if hostname is None:
+            hostname = hostname_from_prompt(await self.conn.get_prompt())
+        keys = list(self.debug_commands.keys())
+        responses = await self.conn.send_commands([self.debug_commands[k]['command'] for k in keys])
+        return hostname, self.pipelined_output(hostname, keys, responses)
+
+    def pipelined_output(self, hostname, keys, responses):
+        for k, resp in zip(keys, responses):
+            self.debug_output[hostname+'_'+k] = {}
+            self.debug_output[hostname+'_'+k]['command'] = self.debug_commands[k]['command']
+            if resp.failed:
+                print('{}: {} failed'.format(hostname, self.debug_commands[k]['command']))
+                self.debug_output[hostname+'_'+k]['output'] = None
+            else:
+                self.debug_output[hostname+'_'+k]['output'] = self.redact(resp.result)
+        return self.debug_output
+
     def run_command(self, cmd):
         try:
             resp = self.conn.send_command(cmd)
-            data = resp.result
-            output = data.split("\n")
-            output_data = []
-            for data in output:
-                count = 0
-                for item in self.encrypt_strings:
-                    if item in data:
-                        n = re.sub('(?<={})(.*)'.format(item), ' ***********', count=2000, string=data)
-                        output_data.append(n)
-                        break
-                    else:
-                        count+=1
-                    if len(self.encrypt_strings) == count:
-                        output_data.append(data)
-            return output_data
+            return self.redact(resp.result)
+
+        except Exception as e:
+            print(e)
+            return None
+
+    async def async_populate(self):
+        resp = await self.conn.send_command(self.host_command)
+        output = resp.textfsm_parse_output()
+        hostname = output[0]['hostname']
+
+        for k in self.debug_commands.keys():
+            self.debug_output[hostname+'_'+k] = {}
+            cmd = self.debug_commands[k]['command']
+            self.debug_output[hostname+'_'+k]['command'] = cmd
+            self.debug_output[hostname+'_'+k]['output'] = await self.async_capture(hostname, k)
+
+        return hostname, self.debug_output
+
+    async def async_run_command(self, cmd):
+        try:
+            resp = await self.conn.send_command(cmd)
+            return self.redact(resp.result)
 
         except Exception as e:
             print(e)
             return None
 
-def main():
+    def capture_file(self, hostname, k):
+        path = os.path.join(self.stream_dir, safe_name(hostname), safe_name(k) + '.txt')
+        return CaptureFile(path, get_redactor(tuple(self.encrypt_strings)), compress=self.compress)
+
+    def capture(self, hostname, k):
+        cmd = self.debug_commands[k]['command']
+        if self.stream_dir is None:
+            return self.run_command(cmd)
+        try:
+            with self.capture_file(hostname, k) as sink:
+                capture_scrapli(self.conn, cmd, sink)
+            return sink.summary()
+        except Exception as e:
+            print(e)
+            return None
+
+    async def async_capture(self, hostname, k):
+        cmd = self.debug_commands[k]['command']
+        if self.stream_dir is None:
+            return await self.async_run_command(cmd)
+        try:
+            with self.capture_file(hostname, k) as sink:
+                await async_capture_scrapli(self.conn, cmd, sink)
+            return sink.summary()
+        except Exception as e:
+            print(e)
+            return None
+
+    def redact(self, data):
+        redactor = get_redactor(tuple(self.encrypt_strings))
+        return redactor.redact(data)
+
+
+def hostname_from_prompt(prompt):
+    # 'ARISTA-1#', 'IOU1>', 'ARISTA-1(config)#'
+    return prompt.strip().rstrip('#>').split('(')[0]
+
+
+class HostnameCache:
+    # ip -> hostname learned on the pre run, so post runs skip discovery
+
+    def __init__(self, path):
+        self.path = path
+        self.hostnames = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.hostnames = json.load(f)
+
+    def get(self, ip):
+        return self.hostnames.get(ip)
+
+    def update(self, ip, config_state):
+        for out in config_state:
+            for hostname in out:
+                self.hostnames[ip] = hostname
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.hostnames, f, indent=4, sort_keys=True)
+
+
+def device_targets(devices):
+    for device in devices:
+        yield device.os, device.host, device.commands
+
+
+def device_params(ip, device_os, asynchronous=False):
+    device = {
+    "host": ip,
+    "auth_username": "cisco",
+    "auth_password": "cisco",
+    "auth_secondary": "cisco",
+    "auth_strict_key": False,
+    "transport": "system",
+    "ssh_config_file": '~/.ssh/config'
+    }
+    if device_os.lower() == 'cisco_ios':
+        device["transport"] = "telnet"
+    if asynchronous:
+        device["transport"] = "asynctelnet" if device["transport"] == "telnet" else "asyncssh"
+    return device
+
+
+async def collect_device(device_os, ip, commands, static_commands, encrypt_strings, pipeline=False, hostname=None,
+                         stream_dir=None, compress=False):
+    from scrapli.driver.core import AsyncEOSDriver, AsyncIOSXEDriver
+    device = device_params(ip, device_os, asynchronous=True)
+    if device_os.lower() == 'arista_eos':
+        driver, host_command = AsyncEOSDriver, 'show hostname'
+    elif device_os.lower() == 'cisco_ios':
+        driver, host_command = AsyncIOSXEDriver, 'show version'
+    else:
+        raise ValueError('Unsupported device os {}'.format(device_os))
+
+    async with driver(**device) as conn:
+        state = DeviceState(host_command, commands, static_commands[device_os.lower()], conn, string=encrypt_strings,
+                            stream_dir=stream_dir, compress=compress)
+        if pipeline:
+            return await state.async_populate_pipelined(hostname)
+        return await state.async_populate()
+
+
+async def collect_all(targets, static_commands, encrypt_strings, concurrency=50, timeout=300,
+                      pipeline=False, hostnames=None, parse_pool=None, stream_dir=None, compress=False,
+                      on_device=None):
+    # with on_device(ip, config_state) every device is handed over as soon
+    # as it is done, in completion order, and not kept for the result
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(targets)
+    progress = {'done': 0, 'failed': 0}
+    loop = asyncio.get_running_loop()
+
+    async def worker(device_os, ip, commands):
+        config_state = await collect(device_os, ip, commands)
+        if parse_pool is not None and config_state:
+            # the session slot is already free while the pool parses
+            try:
+                config_state = await parse_pool.parse(loop, device_os, config_state)
+            except Exception as e:
+                # one bad output should not cost the others, keep it unparsed
+                print('{}: parsing failed, keeping the raw output: {}'.format(ip, e))
+        if on_device is not None:
+            on_device(ip, config_state)
+            return None
+        return config_state
+
+    async def collect(device_os, ip, commands):
+        async with semaphore:
+            config_state = []
+            try:
+                hostname, state_output = await asyncio.wait_for(
+                    collect_device(device_os, ip, commands, static_commands, encrypt_strings,
+                                   pipeline=pipeline, hostname=hostnames.get(ip) if hostnames else None,
+                                   stream_dir=stream_dir, compress=compress),
+                    timeout)
+                config_state.append({hostname: state_output})
+            except asyncio.TimeoutError:
+                progress['failed'] += 1
+                print('{}: timed out after {} seconds'.format(ip, timeout))
+            except Exception as e:
+                progress['failed'] += 1
+                print('{}: {}'.format(ip, e))
+            progress['done'] += 1
+            print('[{}/{}] {} done, {} failed so far'.format(progress['done'], total, ip, progress['failed']))
+            return config_state
+
+    return await asyncio.gather(*(worker(*target) for target in targets))
+
+
+def store_device(store, rpd_id, phase, ip, config_state):
+    for out in config_state:
+        for hostname, state_output in out.items():
+            store.write_device(rpd_id, phase, run_started().isoformat(), hostname, state_output, ip=ip)
+
+
+def main(argv=None):
     global rpd_id
-    try:
-        file_name = sys.argv[1]
-    except Exception as e:
-        print('Please provide inventory file as argument. ', e)
-        sys.exit(1)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inventory', nargs='+', help='yaml, jsonl or csv inventory files or globs')
+    parser.add_argument('--parallel', action='store_true',
+                        help='collect from all devices concurrently with the async drivers')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='maximum number of concurrent sessions in parallel mode')
+    parser.add_argument('--timeout', type=int, default=300,
+                        help='per device timeout in seconds in parallel mode')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='send all commands of a device in one batch and reuse hostnames learned on the pre run')
+    parser.add_argument('--parse', action='store_true',
+                        help='also store TextFSM parsed records of every command, parsed in worker processes')
+    parser.add_argument('--parse_workers', type=int, default=None,
+                        help='number of parsing processes, defaults to the number of CPUs')
+    parser.add_argument('--stream_dir',
+                        help='write every output line by line to <dir>/<RPD>/<phase>/<hostname>/ '
+                             'instead of keeping it in memory, confirmations.txt then references the files')
+    parser.add_argument('--compress', action='store_true',
+                        help='gzip the files written with --stream_dir')
+    parser.add_argument('--store',
+                        help='also write every device to this indexed snapshot store (sqlite)')
+    add_inventory_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.stream_dir and args.pipeline:
+        parser.error('--stream_dir reads each command on its own and cannot be combined with --pipeline')
     operation_method = input('Enter operation method "pre" or "post": ')
     user_rpd = input('Enter RPD id: ')
 
@@ -107,100 +339,146 @@ def main():
     
 
     if operation_method.lower() == 'pre' or operation_method.lower() == 'post':
-        if file_name.endswith('.yml') or file_name.endswith('.yaml'):
-            with open(file_name, 'r') as f:
-                user_data = yaml.safe_load(f)
-            try:
-                os_types = user_data['devices'].keys()
-            except KeyError:
-                print('Invalid file format. Please enter the inventory details properly')
-        else:
-            print('Invalid file, please provide the file in yaml format')
+        # streamed, so a shard never holds the whole inventory
+        try:
+            for path in expand(args.inventory):
+                reader_for(path)
+        except ValueError as e:
+            print('Invalid inventory: {}'.format(e))
+            sys.exit(1)
+        devices = load_devices(args.inventory, os=args.os, sites=args.site, tags=args.tag, shard=args.shard)
+        # shards sharing a machine must not write the same files
+        suffix = '_{}of{}'.format(*args.shard) if args.shard else ''
+        confirmations_name = 'confirmations{}.txt'.format(suffix)
 
         rpd_dir_path = os.path.join(pwd, rpd_id)
         if not os.path.exists(rpd_dir_path):
             os.mkdir(rpd_dir_path)
         
         if operation_method.lower() == 'pre':
-            config_file_path = os.path.join(rpd_dir_path, 'confirmations.txt')
+            config_file_path = os.path.join(rpd_dir_path, confirmations_name)
             f = open(config_file_path, 'w')
-            f.write('{} changes at {}'.format(operation_method.lower(), current_date))
+            f.write('{} changes at {}'.format(operation_method.lower(), current_date()))
             f.close()
             
         elif operation_method.lower() == 'post':
             rpd_file_path = os.path.join(pwd, rpd_id)
             dir_list = os.listdir(rpd_file_path)
-            if dir_list:
-                config_file_path = os.path.join(rpd_dir_path, dir_list[0])
+            if confirmations_name in dir_list:
+                config_file_path = os.path.join(rpd_dir_path, confirmations_name)
                 f = open(config_file_path, 'w')
-                f.write('{} changes at {}'.format(operation_method.lower(), current_date))
+                f.write('{} changes at {}'.format(operation_method.lower(), current_date()))
                 f.close()
             else:
                 print('Please do PRE run before running post')
                 sys.exit(0)
         
-        for device_os in os_types:
-            for each_os in user_data['devices'][device_os]:
-                ip_address = each_os['ip_address']
-                commands = each_os.get('commands')
-
-                for ip in ip_address:
-                    config_state = []
-                    device = {
-                    "host": ip,
-                    "auth_username": "cisco",
-                    "auth_password": "cisco",
-                    "auth_secondary": "cisco",
-                    "auth_strict_key": False,
-                    "transport": "system",
-                    "ssh_config_file": '~/.ssh/config'
-                    }
-                    if device_os.lower() == 'arista_eos':
-                        out = {}
-                        try:
-                            with EOSDriver(**device) as conn:
-                                arista_config = DeviceState('show hostname', commands, arista_commands, conn, string=encrypt_strings)
-                                hostname, state_output = arista_config.populate()
-                                out[hostname] = state_output
-                                config_state.append(out)
-                        except Exception as e:
-                            print(e)
-
-                    elif device_os.lower() == 'cisco_ios':
-                        device["transport"] = "telnet"
-                        out = {}
-                        try:
-                            with IOSXEDriver(**device) as conn:
-                                cisco_config = DeviceState('show version', commands, cisco_commands, conn, string=encrypt_strings)
-                                hostname, state_output = cisco_config.populate()
-                                out[hostname] = state_output
-                                config_state.append(out)
-                        except Exception as e:
-                            print(e)
-
-                    with open(config_file_path, 'a') as file:
-                        json.dump(config_state, file, indent=4)
-
-        git_push(operation_method.lower(), config_file_path)            
-
-def git_push(method, file_path):
-    path = os.getcwd()
-    if os.path.isdir(path):
-        repo = git.Repo(path)
-    
-    p = Popen(['curl', '-vk', 'https://www.github.factset.com'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    output, err = p.communicate(b"input data that is passed to subprocess' curl commands")
-    fetch_commad = 'git fetch origin {}:{}'.format('master', 'master')
-    add_command = 'git add .'
-    commit_msg = "git commit -m '{} changes made at {}'".format(method, current_date)
-    #if 'Connected' in err.decode("utf-8"):
-    #    os.system(fetch_commad)
-    #    time.sleep(1)
-    os.system(add_command)
-    time.sleep(1)
-    os.system(commit_msg)
-
-    if 'Connected' in err.decode("utf-8"):
+        store = SnapshotStore(args.store) if args.store else None
+        phase = operation_method.lower()
+        hostname_cache = HostnameCache(os.path.join(rpd_dir_path, 'hostnames{}.json'.format(suffix)))
+        # one file per device, only changed ones get committed
+        publisher = Publisher(os.path.join(rpd_dir_path, phase))
+
+        parse_pool = ParsePool(args.parse_workers) if args.parse else None
+        stream_dir = os.path.join(args.stream_dir, rpd_id, phase) if args.stream_dir else None
+
+        # every device is written as soon as it is collected (and parsed)
+        def save_device(ip, config_state):
+            with open(config_file_path, 'a') as file:
+                json.dump(config_state, file, indent=4)
+            hostname_cache.update(ip, config_state)
+            publisher.add(config_state)
+            if store is not None:
+                store_device(store, rpd_id, phase, ip, config_state)
+
+        if args.parallel:
+            static_commands = {'arista_eos': arista_commands, 'cisco_ios': cisco_commands}
+            targets = list(device_targets(devices))
+            hostnames = hostname_cache.hostnames if args.pipeline and phase == 'post' else None
+            asyncio.run(collect_all(targets, static_commands, encrypt_strings,
+                                    concurrency=args.concurrency, timeout=args.timeout,
+                                    pipeline=args.pipeline, hostnames=hostnames,
+                                    parse_pool=parse_pool, stream_dir=stream_dir,
+                                    compress=args.compress, on_device=save_device))
+            if parse_pool is not None:
+                parse_pool.close()
+            if store is not None:
+                store.close()
+            hostname_cache.save()
+            git_push(operation_method.lower(), config_file_path, publisher)
+            return
+
+        # with --parse, a device is parsed in the pool while the next ones are
+        # collected; devices are written in inventory order as soon as they
+        # and every device before them are done, with at most parse_window
+        # of them waiting
+        parsing = deque()
+        parse_window = args.parse_workers or os.cpu_count()
+
+        def flush(limit):
+            while parsing and (len(parsing) > limit or parsing[0][2] is None or parsing[0][2].done()):
+                ip, config_state, future = parsing.popleft()
+                if future is not None:
+                    try:
+                        config_state = attach(config_state, future.result())
+                    except Exception as e:
+                        print('{}: parsing failed, keeping the raw output: {}'.format(ip, e))
+                save_device(ip, config_state)
+
+        from scrapli.driver.core import EOSDriver, IOSXEDriver
+        for device_os, ip, commands in device_targets(devices):
+            config_state = []
+            device = device_params(ip, device_os)
+            known_hostname = hostname_cache.get(ip) if args.pipeline and phase == 'post' else None
+            if device_os.lower() == 'arista_eos':
+                out = {}
+                try:
+                    with EOSDriver(**device) as conn:
+                        arista_config = DeviceState('show hostname', commands, arista_commands, conn, string=encrypt_strings,
+                                                    stream_dir=stream_dir, compress=args.compress)
+                        if args.pipeline:
+                            hostname, state_output = arista_config.populate_pipelined(known_hostname)
+                        else:
+                            hostname, state_output = arista_config.populate()
+                        out[hostname] = state_output
+                        config_state.append(out)
+                except Exception as e:
+                    print(e)
+
+            elif device_os.lower() == 'cisco_ios':
+                out = {}
+                try:
+                    with IOSXEDriver(**device) as conn:
+                        cisco_config = DeviceState('show version', commands, cisco_commands, conn, string=encrypt_strings,
+                                                   stream_dir=stream_dir, compress=args.compress)
+                        if args.pipeline:
+                            hostname, state_output = cisco_config.populate_pipelined(known_hostname)
+                        else:
+                            hostname, state_output = cisco_config.populate()
+                        out[hostname] = state_output
+                        config_state.append(out)
+                except Exception as e:
+                    print(e)
+
+            if parse_pool is not None and config_state:
+                parsing.append((ip, config_state, parse_pool.submit(device_os, config_state)))
+            else:
+                parsing.append((ip, config_state, None))
+            flush(parse_window)
+
+        flush(0)
+        if parse_pool is not None:
+            parse_pool.close()
+
+        if store is not None:
+            store.close()
+        hostname_cache.save()
+        git_push(operation_method.lower(), config_file_path, publisher)
+
+def git_push(method, file_path, publisher):
+    repo, commit = publisher.commit('{} changes made at {}'.format(method, current_date()))
+
+    if reachable(remote_host(repo) if repo is not None else GIT_HOST):
         print('Please push to GitHub')
     else:
         print('Unable to Connect to GitHub, Creating config files in local machine in /root/RPD_DIFFS path')
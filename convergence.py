@@ -0,0 +1,175 @@
+import time
+
+# all VRFs, the default VRF alone hides most of the table on a PE or leaf
+ROUTE_COMMAND = 'sh ip route vrf all summary'
+
+TOLERANCE = 0.005
+STABLE_SAMPLES = 3
+MIN_INTERVAL = 2
+MAX_INTERVAL = 30
+STALL_SECONDS = 90
+CONVERGENCE_TIMEOUT = 600
+
+
+def route_counts(output):
+    # {(vrf, protocol): routes} plus {(vrf, 'total'): routes} from the
+    # EOS json of ROUTE_COMMAND, e.g. 'connected': 40 or
+    # 'bgpCounts': {'bgpTotal': 1158, ...}
+    counts = {}
+    vrfs = output.get('vrfs', {}) if isinstance(output, dict) else {}
+    for vrf, summary in vrfs.items():
+        for key, value in summary.items():
+            if key == 'totalRoutes':
+                counts[(vrf, 'total')] = int(value)
+            elif isinstance(value, int) and not isinstance(value, bool):
+                counts[(vrf, key)] = value
+            elif isinstance(value, dict) and key.endswith('Counts'):
+                protocol = key[:-len('Counts')]
+                total = value.get('{}Total'.format(protocol))
+                if total is not None:
+                    counts[(vrf, protocol)] = int(total)
+    return counts
+
+
+def total(counts):
+    return sum(value for (vrf, protocol), value in counts.items() if protocol == 'total')
+
+
+def changed_keys(previous, current, tolerance):
+    # keys that moved by more than tolerance (relative, at least one route)
+    changed = []
+    for key in previous.keys() | current.keys():
+        before = previous.get(key, 0)
+        after = current.get(key, 0)
+        if abs(after - before) > max(tolerance * max(before, after), 1):
+            changed.append(key)
+    return changed
+
+
+def shortfall(baseline, counts, tolerance, limit=10):
+    # the VRF totals still short of the baseline, biggest gap first
+    missing = []
+    for key, expected in baseline.items():
+        if key[1] != 'total':
+            continue
+        got = counts.get(key, 0)
+        if got < expected * (1 - tolerance):
+            missing.append((expected - got, key[0], got, expected))
+    missing.sort(reverse=True)
+    return ', '.join('vrf {} {} of {}'.format(vrf, got, expected) for _, vrf, got, expected in missing[:limit])
+
+
+class ConvergenceResult:
+    def __init__(self, converged, seconds, samples, routes, baseline_routes, rate, detail=''):
+        self.converged = converged
+        # time until the counts reached the values they settled on
+        self.seconds = seconds
+        self.samples = samples
+        self.routes = routes
+        self.baseline_routes = baseline_routes
+        self.rate = rate
+        self.detail = detail
+
+    def as_dict(self):
+        return {'converged': self.converged, 'seconds': round(self.seconds, 1), 'samples': self.samples,
+                'routes': self.routes, 'baseline_routes': self.baseline_routes,
+                'rate': round(self.rate, 1), 'detail': self.detail}
+
+
+class ConvergenceTracker:
+    # Samples the route counts per VRF and protocol until they settle.
+    #
+    # Converged once STABLE_SAMPLES samples in a row differ by no more
+    # than the tolerance and the total is within tolerance of the
+    # baseline (the pre upgrade counts). While routes are still being
+    # learned the next sample is timed from the estimated rate, so a
+    # table that is nearly complete is polled again quickly and a slow
+    # one is not polled for nothing. Counts that stop growing short of
+    # the baseline fail after stall_seconds instead of the full timeout.
+
+    def __init__(self, sample, baseline=None, tolerance=TOLERANCE, stable_samples=STABLE_SAMPLES,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, stall_seconds=STALL_SECONDS,
+                 timeout=CONVERGENCE_TIMEOUT, log=print):
+        self.sample = sample
+        self.baseline = baseline or {}
+        self.baseline_routes = total(self.baseline) if baseline else None
+        self.tolerance = tolerance
+        self.stable_samples = stable_samples
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stall_seconds = stall_seconds
+        self.timeout = timeout
+        self.log = log
+
+    def complete(self, routes):
+        if self.baseline_routes is None:
+            return True
+        return routes >= self.baseline_routes * (1 - self.tolerance)
+
+    def next_interval(self, routes, rate, stable):
+        if stable:
+            # confirming a plateau, or waiting out a stall
+            return self.min_interval if self.complete(routes) else self.max_interval / 2
+        if rate > 0 and self.baseline_routes is not None and not self.complete(routes):
+            eta = (self.baseline_routes - routes) / rate
+            return min(max(eta / 2, self.min_interval), self.max_interval)
+        return self.min_interval
+
+    def run(self, first=None):
+        start = time.monotonic()
+        counts = first if first is not None else self.sample()
+        routes = total(counts)
+        samples = 1
+        # when the counts last moved, and for how many samples they have not
+        settled_at = 0.0
+        stable = 1
+        rate = 0.0
+        last = start
+        while True:
+            now = time.monotonic()
+            elapsed = now - start
+            if stable >= self.stable_samples and self.complete(routes):
+                return ConvergenceResult(True, settled_at, samples, routes, self.baseline_routes, rate)
+            if stable > 1 and not self.complete(routes) and elapsed - settled_at >= self.stall_seconds:
+                return ConvergenceResult(False, elapsed, samples, routes, self.baseline_routes, rate,
+                                         'stalled at {} routes for {:.0f}s, {}'.format(
+                                             routes, elapsed - settled_at,
+                                             shortfall(self.baseline, counts, self.tolerance)))
+            if stable == 1 and samples >= self.stable_samples and rate > 0 and not self.complete(routes) and \
+                    elapsed + (self.baseline_routes - routes) / rate > self.timeout:
+                return ConvergenceResult(False, elapsed, samples, routes, self.baseline_routes, rate,
+                                         'learning {:.1f} routes/s, {} routes short would take past {}s'.format(
+                                             rate, self.baseline_routes - routes, self.timeout))
+            interval = self.next_interval(routes, rate, stable > 1)
+            if elapsed + interval > self.timeout:
+                detail = 'still changing' if stable < 2 else shortfall(self.baseline, counts, self.tolerance)
+                return ConvergenceResult(False, elapsed, samples, routes, self.baseline_routes, rate,
+                                         'not converged after {:.0f}s, {}'.format(elapsed, detail))
+            self.log('{} routes{}, {:.0f} routes/s, next sample in {:.0f}s'.format(
+                routes, ' of {}'.format(self.baseline_routes) if self.baseline_routes is not None else '',
+                rate, interval))
+            time.sleep(interval)
+
+            current = self.sample()
+            samples += 1
+            now = time.monotonic()
+            current_routes = total(current)
+            # smoothed, a single burst of updates should not set the pace
+            step = (current_routes - routes) / max(now - last, 1e-3)
+            rate = step if samples == 2 else 0.5 * rate + 0.5 * step
+            if changed_keys(counts, current, self.tolerance):
+                settled_at = now - start
+                stable = 1
+            else:
+                stable += 1
+            counts = current
+            routes = current_routes
+            last = now
+
+
+def track(sample, baseline_output=None, first_output=None, **kwargs):
+    # sample() returns the json of ROUTE_COMMAND
+    tracker = ConvergenceTracker(lambda: route_counts(sample()),
+                                 route_counts(baseline_output) if baseline_output is not None else None,
+                                 **kwargs)
+    return tracker.run(route_counts(first_output) if first_output is not None else None)
@@ -0,0 +1,74 @@
+import base64
+import http.client
+import json
+import ssl
+
+
+class EapiError(Exception):
+    pass
+
+
+class EapiSession:
+    # Arista eAPI (JSON-RPC over HTTPS) client.
+    #
+    # Keeps one keep-alive connection per device and sends a whole list of
+    # commands in a single runCmds request. run_command() has the same
+    # shape as AristaOsUpgrade.run_command_json so it can be handed to
+    # AristaState.populate directly.
+
+    def __init__(self, host, username, password, port=None, protocol='https', timeout=60):
+        self.host = host
+        self.protocol = protocol
+        self.port = port or (443 if protocol == 'https' else 80)
+        self.timeout = timeout
+        token = base64.b64encode('{}:{}'.format(username, password).encode()).decode()
+        self.headers = {'Content-Type': 'application/json',
+                        'Authorization': 'Basic {}'.format(token),
+                        'Connection': 'keep-alive'}
+        self.conn = None
+        self.request_id = 0
+
+    def _connect(self):
+        if self.protocol == 'https':
+            context = ssl._create_unverified_context()
+            self.conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=context)
+        else:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _post(self, body):
+        if self.conn is None:
+            self._connect()
+        self.conn.request('POST', '/command-api', body=body, headers=self.headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise EapiError('HTTP {} {} from {}'.format(response.status, response.reason, self.host))
+        return json.loads(data)
+
+    def run_cmds(self, cmds, fmt='json'):
+        self.request_id += 1
+        body = json.dumps({'jsonrpc': '2.0',
+                           'method': 'runCmds',
+                           'params': {'version': 1, 'cmds': list(cmds), 'format': fmt},
+                           'id': self.request_id})
+        try:
+            reply = self._post(body)
+        except (http.client.HTTPException, ConnectionError):
+            # the keep-alive connection went away (idle timeout, reload), retry once
+            self.close()
+            reply = self._post(body)
+        if 'error' in reply:
+            error = reply['error']
+            raise EapiError('{}: {}'.format(error.get('code'), error.get('message')))
+        return reply['result']
+
+    def run_command(self, cmd):
+        return self.run_cmds([cmd])[0]
+
+    def run_commands(self, cmds):
+        return self.run_cmds(cmds)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,200 @@
+import base64
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/arista_eos_images')
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+CHUNK_SIZE = 32 * 1024 ** 2
+
+
+class ImageCacheError(Exception):
+    pass
+
+
+class ImageCache:
+    # Local cache of EOS images shared by every run on the jump host.
+    #
+    # Entries live in <cache_dir>/<generation>-<md5>/<image name>, so a new
+    # upload of the same image name never reuses a stale copy. Downloads go
+    # to a .part file in ranged chunks, can resume after an interruption and
+    # are hashed while they stream in; the verified file is renamed into
+    # place atomically.
+    #
+    # Every entry has a <key>.lock file next to it: a run that uses an
+    # image holds it shared until release(), and eviction skips entries
+    # it cannot lock exclusively. Downloads are serialised on a separate
+    # <key>.download lock, so a job fetching a cached image never waits
+    # for the rollouts using it.
+    # The lock files are never removed, a process blocked on a deleted
+    # lock file would hold a lock nobody else sees.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, chunk_size=CHUNK_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.in_use = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, blob):
+        md5 = self.expected_md5(blob) or 'nomd5'
+        return '{}-{}'.format(blob.generation, md5)
+
+    def expected_md5(self, blob):
+        if not blob.md5_hash:
+            return None
+        return base64.b64decode(blob.md5_hash).hex()
+
+    def path(self, blob):
+        return os.path.join(self.cache_dir, self.key(blob), os.path.basename(blob.name))
+
+    def _lock_file(self, key, kind='lock'):
+        return open(os.path.join(self.cache_dir, '{}.{}'.format(key, kind)), 'a')
+
+    @contextmanager
+    def _lock(self, key, kind='lock'):
+        with self._lock_file(key, kind) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def fetch(self, blob):
+        # Returns the path of the verified image and keeps it in use, safe
+        # from eviction by any process, until release().
+        if blob.size is None or blob.generation is None:
+            blob.reload()
+        key = self.key(blob)
+        final_path = self.path(blob)
+
+        while not self._hold(key, final_path):
+            # parallel jobs wait here while the first one downloads; the
+            # use lock is not involved, so running rollouts never block it
+            with self._lock(key, 'download'):
+                if not os.path.exists(final_path):
+                    self._fetch(blob, final_path)
+            # and go round to take the shared lock, the image may have been
+            # evicted in between
+        os.utime(final_path)
+        print('IMAGE CACHE: using {}'.format(final_path))
+
+        self.evict(keep=key)
+        return final_path
+
+    def _fetch(self, blob, final_path):
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        md5 = self._download(blob, final_path + '.part')
+        expected = self.expected_md5(blob)
+        if expected is not None and md5 != expected:
+            os.remove(final_path + '.part')
+            raise ImageCacheError('checksum mismatch for {}: got {}, expected {}'
+                                  .format(blob.name, md5, expected))
+        with open(final_path + '.md5', 'w') as f:
+            f.write(md5)
+        os.replace(final_path + '.part', final_path)
+        print('IMAGE CACHE: {} downloaded and verified'.format(final_path))
+
+    def _hold(self, key, final_path):
+        # shared lock on <key>.lock while the image exists, False when it
+        # has to be downloaded first
+        if key in self.in_use:
+            return True
+        lock_file = self._lock_file(key)
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        if not os.path.exists(final_path):
+            lock_file.close()
+            return False
+        self.in_use[key] = lock_file
+        return True
+
+    def release(self, key=None):
+        # the shared locks also go away when the process exits
+        for held in [key] if key is not None else list(self.in_use):
+            lock_file = self.in_use.pop(held, None)
+            if lock_file is not None:
+                lock_file.close()
+
+    def _download(self, blob, part_path):
+        md5 = hashlib.md5()
+        offset = 0
+        if os.path.exists(part_path):
+            if os.path.getsize(part_path) > blob.size:
+                os.remove(part_path)
+            else:
+                # resuming, hash what is already on disk instead of fetching it again
+                with open(part_path, 'rb') as f:
+                    for data in iter(lambda: f.read(self.chunk_size), b''):
+                        md5.update(data)
+                        offset += len(data)
+                print('IMAGE CACHE: resuming {} at {} of {} bytes'.format(blob.name, offset, blob.size))
+
+        with open(part_path, 'ab') as f:
+            while offset < blob.size:
+                end = min(offset + self.chunk_size, blob.size) - 1
+                data = blob.download_as_bytes(start=offset, end=end)
+                if not data:
+                    raise ImageCacheError('empty range {}-{} for {}'.format(offset, end, blob.name))
+                f.write(data)
+                f.flush()
+                md5.update(data)
+                offset += len(data)
+            os.fsync(f.fileno())
+
+        if offset != blob.size:
+            raise ImageCacheError('size mismatch for {}: got {}, expected {}'
+                                  .format(blob.name, offset, blob.size))
+        return md5.hexdigest()
+
+    def entries(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry_dir):
+                continue
+            for name in os.listdir(entry_dir):
+                if name.endswith('.part') or name.endswith('.md5'):
+                    continue
+                stat = os.stat(os.path.join(entry_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, key))
+        return entries
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep or key in self.in_use:
+                continue
+            with self._lock_file(key) as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # a rollout is copying from it, or a download is running
+                    print('IMAGE CACHE: {} is in use, not evicted'.format(key))
+                    continue
+                try:
+                    shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            total -= size
+            print('IMAGE CACHE: evicted {} ({} bytes, last used {})'
+                  .format(key, size, time.ctime(mtime)))
+
+
+
+def local_md5(image_file_path):
+    # the cache leaves the verified checksum next to the image
+    md5_path = image_file_path + '.md5'
+    if os.path.exists(md5_path):
+        with open(md5_path) as f:
+            return f.read().strip()
+    md5 = hashlib.md5()
+    with open(image_file_path, 'rb') as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(data)
+    return md5.hexdigest()
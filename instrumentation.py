@@ -0,0 +1,190 @@
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# histogram bounds in seconds, a reload or an image copy takes minutes
+PHASE_BUCKETS = (0.5, 1, 5, 10, 30, 60, 120, 300, 600, 900, 1800, 3600)
+COMMAND_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_PREFIX = 'eos_upgrade'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i in range(bisect.bisect_left(self.buckets, value), len(self.buckets)):
+            self.counts[i] += 1
+
+
+class Recorder:
+    # Per device / per phase timings for the upgrade flow.
+    #
+    # Every timing is appended to events.jsonl as it happens and folded
+    # into histograms that write_metrics() dumps in the Prometheus
+    # textfile format. Without a metrics_dir nothing is written and a
+    # timing costs two perf_counter() calls.
+
+    def __init__(self, metrics_dir=None, profile=False):
+        self.metrics_dir = metrics_dir
+        self.profile = profile
+        self.histograms = {}
+        self.gauges = {}
+        self._events = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            self._events = open(os.path.join(metrics_dir, 'events.jsonl'), 'a', buffering=1)
+
+    @property
+    def device(self):
+        return getattr(self._local, 'device', None)
+
+    @contextmanager
+    def for_device(self, device):
+        # labels every timing taken in this thread with the device
+        previous = self.device
+        self._local.device = device
+        try:
+            yield
+        finally:
+            self._local.device = previous
+
+    def event(self, kind, **fields):
+        if self._events is None:
+            return
+        record = {'ts': round(time.time(), 3), 'event': kind, 'device': self.device}
+        record.update(fields)
+        line = json.dumps(record)
+        with self._lock:
+            self._events.write(line + '\n')
+
+    def observe(self, metric, seconds, buckets=PHASE_BUCKETS, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(seconds)
+
+    def set_gauge(self, metric, value, **labels):
+        with self._lock:
+            self.gauges[(metric, tuple(sorted(labels.items())))] = value
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe('phase_seconds', seconds, phase=name)
+            self.event('phase', phase=name, seconds=round(seconds, 3), ok=ok)
+
+    @contextmanager
+    def command(self, command):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe('command_seconds', seconds, buckets=COMMAND_BUCKETS, command=command)
+            self.event('command', command=command, seconds=round(seconds, 4), ok=ok)
+
+    @contextmanager
+    def profiled(self, name):
+        # cProfile only sees the thread that enabled it, so profile per device
+        if not (self.profile and self.metrics_dir):
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self.metrics_dir, 'profile_{}.pstats'.format(name)))
+
+    def render_metrics(self):
+        lines = []
+        typed = set()
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            gauges = sorted(self.gauges.items())
+        for (metric, labels), histogram in histograms:
+            name = '{}_{}'.format(METRIC_PREFIX, metric)
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            # counts are already cumulative, observe() bumps every bucket >= value
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels, le=_number(bound)), count))
+            lines.append('{}_bucket{} {}'.format(name, _labels(labels, le='+Inf'), histogram.count))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(histogram.sum)))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), histogram.count))
+        for (metric, labels), value in gauges:
+            name = '{}_{}'.format(METRIC_PREFIX, metric)
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} gauge'.format(name))
+            lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, file_name='eos_upgrade.prom'):
+        # written to a temp file and renamed, so the node_exporter textfile
+        # collector never reads half a file
+        if not self.metrics_dir:
+            return None
+        path = os.path.join(self.metrics_dir, file_name)
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.render_metrics())
+        os.replace(path + '.tmp', path)
+        return path
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+
+def _number(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in pairs) + '}'
+
+
+RECORDER = Recorder()
+
+
+def get_recorder():
+    return RECORDER
+
+
+def configure(metrics_dir=None, profile=False):
+    global RECORDER
+    RECORDER.close()
+    RECORDER = Recorder(metrics_dir, profile)
+    return RECORDER
@@ -0,0 +1,253 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import re
+import sys
+
+# pulls the host out of a json line without decoding the whole record
+HOST_PATTERN = re.compile(r'"host"\s*:\s*"([^"\\]*)"')
+
+
+class Device:
+    __slots__ = ('host', 'os', 'site', 'tags', 'commands')
+
+    def __init__(self, host, os=None, site=None, tags=(), commands=None):
+        self.host = host
+        self.os = os
+        self.site = site
+        self.tags = frozenset(tags or ())
+        self.commands = commands
+
+    def __repr__(self):
+        return 'Device({!r}, os={!r}, site={!r})'.format(self.host, self.os, self.site)
+
+
+def parse_shard(text):
+    # 'k/N', 1 based, e.g. 2/4 is the second of four shards
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError('shard must look like k/N, got {!r}'.format(text))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError('shard {} is out of range'.format(text))
+    return index, count
+
+
+def shard_of(host, count):
+    # stable across processes and machines, unlike hash()
+    return int(hashlib.sha1(host.encode()).hexdigest()[:8], 16) % count + 1
+
+
+class Selector:
+    def __init__(self, os=None, sites=None, tags=None, shard=None):
+        self.os = set(value.lower() for value in os) if os else None
+        self.sites = set(sites) if sites else None
+        self.tags = set(tags) if tags else None
+        self.shard = shard
+
+    def wants_host(self, host):
+        # the cheap part, checked before a record is decoded
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return shard_of(host, count) == index
+
+    def wants(self, device):
+        if self.os is not None and (device.os or '').lower() not in self.os:
+            return False
+        if self.sites is not None and device.site not in self.sites:
+            return False
+        if self.tags is not None and not self.tags <= device.tags:
+            return False
+        return self.wants_host(device.host)
+
+
+def expand(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError('no inventory file matches {}'.format(pattern))
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def _split(value):
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return tuple(part.strip() for part in value.split(';') if part.strip())
+    return tuple(value)
+
+
+def _yaml_value(loader, anchors):
+    # the value starting at the next event, built like the loader would
+    import yaml
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        return anchors[event.anchor]
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        value = constructor(loader, yaml.ScalarNode(tag, event.value, style=event.style))
+    elif isinstance(event, yaml.SequenceStartEvent):
+        value = []
+        while not loader.check_event(yaml.SequenceEndEvent):
+            value.append(_yaml_value(loader, anchors))
+        loader.get_event()
+    else:
+        value = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _yaml_value(loader, anchors)
+            value[key] = _yaml_value(loader, anchors)
+        loader.get_event()
+    if event.anchor is not None:
+        anchors[event.anchor] = value
+    return value
+
+
+def _yaml_groups(loader, anchors):
+    # devices: {os: [group, ...]}, one group in memory at a time
+    import yaml
+    loader.get_event()
+    while not loader.check_event(yaml.MappingEndEvent):
+        device_os = _yaml_value(loader, anchors)
+        if not loader.check_event(yaml.SequenceStartEvent):
+            _yaml_value(loader, anchors)
+            continue
+        loader.get_event()
+        while not loader.check_event(yaml.SequenceEndEvent):
+            yield device_os, _yaml_value(loader, anchors)
+        loader.get_event()
+    loader.get_event()
+
+
+def iter_yaml(path, selector, default_os=None):
+    # Walks the parser events instead of loading the document, so a big
+    # confirmations.py inventory is never in memory as a whole.
+    import yaml
+    # the libyaml parser is several times faster on big inventories
+    loader_class = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path) as f:
+        loader = loader_class(f)
+        try:
+            anchors = {}
+            data = {}
+            loader.get_event()
+            if loader.check_event(yaml.DocumentStartEvent):
+                loader.get_event()
+                if not loader.check_event(yaml.MappingStartEvent):
+                    raise ValueError('{} is not a mapping'.format(path))
+                loader.get_event()
+                while not loader.check_event(yaml.MappingEndEvent):
+                    key = _yaml_value(loader, anchors)
+                    if key == 'devices' and loader.check_event(yaml.MappingStartEvent):
+                        # confirmations.py layout: devices -> os -> groups of ip_address
+                        data['devices'] = True
+                        for device_os, group in _yaml_groups(loader, anchors):
+                            for host in group['ip_address']:
+                                if selector.wants_host(host):
+                                    yield Device(host, device_os, group.get('site'), group.get('tags'),
+                                                 group.get('commands'))
+                    else:
+                        data[key] = _yaml_value(loader, anchors)
+        finally:
+            loader.dispose()
+    if 'devices' in data:
+        return
+    if 'ip_address' in data:
+        # arista_eos_upgrade.py playbook, optional sites: {site: [ip, ...]}
+        sites = {ip: site for site, ips in (data.get('sites') or {}).items() for ip in ips}
+        for host in data['ip_address']:
+            yield Device(host, default_os, sites.get(host))
+    else:
+        raise ValueError('{} has neither "devices" nor "ip_address"'.format(path))
+
+
+def iter_jsonl(path, selector, default_os=None):
+    # {"host": ..., "os": ..., "site": ..., "tags": [...], "commands": [...]} per line
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            match = HOST_PATTERN.search(line)
+            if match and not selector.wants_host(match.group(1)):
+                continue
+            record = json.loads(line)
+            yield Device(record['host'], record.get('os', default_os), record.get('site'),
+                         _split(record.get('tags')), _split(record.get('commands')) or None)
+
+
+def iter_csv(path, selector, default_os=None):
+    # header row with host and optional os, site, tags, commands;
+    # tags and commands are ';' separated
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [column.strip().lower() for column in next(reader)]
+        if 'host' not in header:
+            raise ValueError('{} has no "host" column'.format(path))
+        host_column = header.index('host')
+        for row in reader:
+            if not row or not selector.wants_host(row[host_column].strip()):
+                continue
+            record = dict(zip(header, (value.strip() for value in row)))
+            yield Device(record['host'], record.get('os') or default_os, record.get('site') or None,
+                         _split(record.get('tags')), _split(record.get('commands')) or None)
+
+
+READERS = {'.yml': iter_yaml, '.yaml': iter_yaml, '.jsonl': iter_jsonl, '.csv': iter_csv}
+
+
+def reader_for(path):
+    for extension, reader in READERS.items():
+        if path.lower().endswith(extension):
+            return reader
+    raise ValueError('unsupported inventory file {}, use {}'.format(path, ', '.join(READERS)))
+
+
+def load_devices(patterns, os=None, sites=None, tags=None, shard=None, default_os=None):
+    # Streams the selected devices of every file in order. Hosts listed
+    # twice are yielded once; only this shard's hosts are remembered.
+    selector = Selector(os, sites, tags, shard)
+    seen = set()
+    for path in expand(patterns):
+        reader = reader_for(path)
+        for device in reader(path, selector, default_os):
+            if device.host in seen or not selector.wants(device):
+                continue
+            seen.add(device.host)
+            yield device
+
+
+def add_arguments(parser):
+    parser.add_argument('--os', action='append', help='only devices of this os, repeatable')
+    parser.add_argument('--site', action='append', help='only devices of this site, repeatable')
+    parser.add_argument('--tag', action='append', help='only devices carrying this tag, repeatable')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='k/N: only the k-th of N hash shards of the inventory, e.g. one per jump host')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inventory', nargs='+', help='yaml, jsonl or csv files or globs')
+    add_arguments(parser)
+    parser.add_argument('--count', action='store_true', help='only print the number of devices')
+    args = parser.parse_args(argv)
+
+    count = 0
+    for device in load_devices(args.inventory, args.os, args.site, args.tag, args.shard):
+        count += 1
+        if not args.count:
+            print('{}\t{}\t{}\t{}'.format(device.host, device.os or '-', device.site or '-',
+                                          ','.join(sorted(device.tags)) or '-'))
+    if args.count:
+        print(count)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+DEFAULT_JOURNAL_DIR = 'upgrade_journal'
+
+
+class JournalEntry:
+    # Progress of one device, rewritten atomically after every phase so a
+    # crash leaves either the previous or the new record on disk.
+
+    def __init__(self, journal, ip_address, data=None):
+        self.journal = journal
+        self.ip_address = ip_address
+        self.data = data or {'ip_address': ip_address, 'image': journal.image,
+                             'completed': [], 'in_progress': None, 'status': None,
+                             'pre_state': None, 'backup_file': None}
+
+    @property
+    def completed(self):
+        return self.data['completed']
+
+    @property
+    def in_progress(self):
+        return self.data['in_progress']
+
+    @property
+    def status(self):
+        return self.data['status']
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def start(self, phase):
+        self.data['in_progress'] = phase
+        self.save()
+
+    def commit(self, phase, **fields):
+        if phase not in self.data['completed']:
+            self.data['completed'].append(phase)
+        self.data['in_progress'] = None
+        self.data.update(fields)
+        self.save()
+
+    def finish(self, status):
+        self.data['status'] = status
+        self.save()
+
+    def save(self):
+        self.data['updated'] = time.time()
+        self.journal.write(self.ip_address, self.data)
+
+
+class Journal:
+    # One json file per device under journal_dir. Entries written for a
+    # different image are ignored, so a new rollout starts from scratch.
+
+    def __init__(self, journal_dir=DEFAULT_JOURNAL_DIR, image=None):
+        self.journal_dir = journal_dir
+        self.image = image
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def path(self, ip_address):
+        return os.path.join(self.journal_dir, '{}.json'.format(ip_address))
+
+    def entry(self, ip_address):
+        try:
+            with open(self.path(ip_address)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if data is not None and data.get('image') != self.image:
+            data = None
+        return JournalEntry(self, ip_address, data)
+
+    def write(self, ip_address, data):
+        path = self.path(ip_address)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # make the rename itself durable
+        dir_fd = os.open(self.journal_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def clear(self):
+        for file_name in os.listdir(self.journal_dir):
+            if file_name.endswith('.json'):
+                os.remove(os.path.join(self.journal_dir, file_name))
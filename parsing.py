@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# compiled templates of this worker process, keyed by (platform, command);
+# None marks a command ntc-templates has no template for
+_TEMPLATES = {}
+
+
+def get_template(platform, command):
+    key = (platform, command)
+    if key not in _TEMPLATES:
+        import textfsm
+        from scrapli.helper import _textfsm_get_template
+        template_file = _textfsm_get_template(platform, command)
+        if template_file is None:
+            _TEMPLATES[key] = None
+        else:
+            with template_file:
+                _TEMPLATES[key] = textfsm.TextFSM(template_file)
+    return _TEMPLATES[key]
+
+
+def parse_output(platform, command, lines):
+    import textfsm
+    fsm = get_template(platform, command)
+    if fsm is None or lines is None:
+        return None
+    fsm.Reset()
+    header = [column.lower() for column in fsm.header]
+    try:
+        rows = fsm.ParseText('\n'.join(lines))
+    except textfsm.TextFSMError as e:
+        print('{}: parsing "{}" failed: {}'.format(platform, command, e))
+        return None
+    return [dict(zip(header, row)) for row in rows]
+
+
+def parse_device(job):
+    # job is (platform, {key: (command, output lines)}), one per device so
+    # a single round trip to the worker covers all of its commands
+    platform, outputs = job
+    parsed = {}
+    for key, (command, lines) in outputs.items():
+        records = parse_output(platform, command, lines)
+        if records is not None:
+            parsed[key] = records
+    return parsed
+
+
+def parse_job(device_os, config_state):
+    outputs = {}
+    for out in config_state:
+        for state_output in out.values():
+            for key, value in state_output.items():
+                # streamed outputs are file references, not lines
+                if isinstance(value['output'], list):
+                    outputs[key] = (value['command'], value['output'])
+    return device_os.lower(), outputs
+
+
+def attach(config_state, parsed):
+    # adds 'parsed' next to 'output' for every command that had a template
+    for out in config_state:
+        for state_output in out.values():
+            for key, records in parsed.items():
+                if key in state_output:
+                    state_output[key]['parsed'] = records
+    return config_state
+
+
+class ParsePool:
+    # TextFSM parsing in worker processes, away from the collectors
+
+    def __init__(self, workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+    def submit(self, device_os, config_state):
+        return self.executor.submit(parse_device, parse_job(device_os, config_state))
+
+    async def parse(self, loop, device_os, config_state):
+        parsed = await loop.run_in_executor(self.executor, parse_device, parse_job(device_os, config_state))
+        return attach(config_state, parsed)
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,133 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from arista_eos_upgrade import LINE, AristaState
+from eapi import EapiError, EapiSession
+from scheduler import DEFAULT_DEVICE_MINUTES, wave_seconds
+
+# pre-flight outcomes
+CURRENT = 'current'
+UPGRADABLE = 'upgradable'
+BLOCKED = 'blocked'
+
+PREFLIGHT_TIMEOUT = 15
+# the version, and the free space on flash: (memFree in show version is RAM)
+PREFLIGHT_COMMANDS = ('show version', 'show file systems')
+# dir has no json output, and dir flash:<image> fails when the image is missing
+LISTING_COMMAND = 'dir flash:'
+
+
+class PreflightResult:
+    def __init__(self, ip_address, status, reason=None, model_name=None, running_version=None,
+                 free_flash=None, staged=False):
+        self.ip_address = ip_address
+        self.status = status
+        self.reason = reason
+        self.model_name = model_name
+        self.running_version = running_version
+        self.free_flash = free_flash
+        self.staged = staged
+
+
+def preflight_eapi(ip_address, username, password, timeout=PREFLIGHT_TIMEOUT):
+    session = EapiSession(ip_address, username, password, timeout=timeout)
+    try:
+        version, file_systems = session.run_commands(PREFLIGHT_COMMANDS)
+        listing = session.run_cmds([LISTING_COMMAND], fmt='text')[0]['output']
+        return version, file_systems, listing
+    finally:
+        session.close()
+
+
+def preflight_ssh(ip_address, username, password, timeout=PREFLIGHT_TIMEOUT):
+    # a bare login, no ping, enable or config backup
+    from netmiko import ConnectHandler
+    conn = ConnectHandler(device_type='arista_eos', host=ip_address, username=username,
+                          password=password, timeout=timeout, banner_timeout=timeout)
+    try:
+        version, file_systems = [json.loads(conn.send_command('{} | json'.format(command)))
+                                 for command in PREFLIGHT_COMMANDS]
+        return version, file_systems, conn.send_command(LISTING_COMMAND)
+    finally:
+        conn.disconnect()
+
+
+def staged_size(listing, image_name):
+    # size of the image in a dir flash: listing, None when it is not there, e.g.
+    #        -rwx  1009451008            Mar 3 10:12  EOS-4.30.1F.swi
+    for line in (listing or '').splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[-1] == image_name and fields[1].isdigit():
+            return int(fields[1])
+    return None
+
+
+def check_device(ip_address, username, password, image_file_path, image_bytes,
+                 transport='eapi', timeout=PREFLIGHT_TIMEOUT):
+    fetch = preflight_eapi if transport == 'eapi' else preflight_ssh
+    try:
+        version, file_systems, listing = fetch(ip_address, username, password, timeout)
+    except (EapiError, OSError) as e:
+        return PreflightResult(ip_address, BLOCKED, 'unreachable: {}'.format(e))
+    except Exception as e:
+        return PreflightResult(ip_address, BLOCKED, 'unreachable: {}: {}'.format(type(e).__name__, e))
+
+    state = AristaState(image_file_path)
+    state.load_outputs({'version_summary': version, 'file_systems': file_systems})
+    result = PreflightResult(ip_address, UPGRADABLE, model_name=state.model_name,
+                             running_version=state.running_version, free_flash=state.free_flash)
+    if state.running_version and state.running_version in image_file_path:
+        result.status = CURRENT
+    elif state.running_version is None:
+        result.status = BLOCKED
+        result.reason = 'no version in show version output'
+    elif staged_size(listing, os.path.basename(image_file_path)) == image_bytes:
+        # a staged image needs no room and no transfer, the upgrade still
+        # verifies its md5 before using it
+        result.staged = True
+        result.reason = 'image already staged'
+    elif state.free_flash is None:
+        result.status = BLOCKED
+        result.reason = 'no flash: in show file systems output'
+    elif state.free_flash <= image_bytes:
+        result.status = BLOCKED
+        result.reason = 'free flash {:.0f} KB, image {:.0f} KB'.format(state.free_flash / 1000, image_bytes / 1000)
+    return result
+
+
+def preflight(device_list, username, password, image_file_path, image_bytes, transport='eapi',
+              concurrency=50, device_seconds=DEFAULT_DEVICE_MINUTES * 60, upgrade_concurrency=1,
+              timeout=PREFLIGHT_TIMEOUT):
+    print('{} PRE-FLIGHT: show version, file systems and dir flash: on {} devices over {} {}'.format(
+        LINE, len(device_list), transport, LINE))
+
+    def check(ip_address):
+        return check_device(ip_address, username, password, image_file_path, image_bytes,
+                            transport=transport, timeout=timeout)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(device_list)))) as executor:
+        results = list(executor.map(check, device_list))
+    report(results, image_bytes, device_seconds, upgrade_concurrency)
+    return results
+
+
+def report(results, image_bytes, device_seconds, upgrade_concurrency):
+    print('{} PRE-FLIGHT REPORT {}'.format(LINE, LINE))
+    for result in results:
+        free_flash = '{:.2f} GB'.format(result.free_flash / 1000 ** 3) if result.free_flash is not None else '-'
+        print('{:<20} {:<11} {:<20} {:<12} {:<10} {}'.format(
+            result.ip_address, result.status, result.model_name or '-',
+            result.running_version or '-', free_flash, result.reason or ''))
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    print(', '.join('{}={}'.format(k, v) for k, v in sorted(counts.items())))
+    upgradable = [result for result in results if result.status == UPGRADABLE]
+    transfers = [result for result in upgradable if not result.staged]
+    print('image transfer: {:.2f} GB to {} devices, {} already staged'.format(
+        image_bytes * len(transfers) / 1000 ** 3, len(transfers), len(upgradable) - len(transfers)))
+    print('estimated window: {:.0f} min at {:.0f} min per device, concurrency {}'.format(
+        wave_seconds(upgradable, device_seconds, upgrade_concurrency) / 60,
+        device_seconds / 60, upgrade_concurrency))
+    return counts
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from arista_eos_upgrade import LINE, AristaOsUpgrade, AristaState
+
+# pre-staging outcomes
+STAGED = 'staged'
+ALREADY_STAGED = 'already_staged'
+NEEDS_COPY = 'needs_copy'
+NO_FLASH_SPACE = 'no_flash_space'
+UNREACHABLE = 'unreachable'
+FAILED = 'failed'
+
+
+class StagingTarget:
+    def __init__(self, args, image_file_path):
+        self.args = args
+        self.ip_address = args['ip_address']
+        self.image_file_path = image_file_path
+        self.arista_handler = None
+        self.status = None
+        self.error = None
+
+    def check(self):
+        try:
+            self.arista_handler = AristaOsUpgrade(self.args)
+        except SystemExit:
+            self.status = UNREACHABLE
+            return self
+        try:
+            if self.arista_handler.image_is_staged():
+                self.status = ALREADY_STAGED
+                return self
+            state = AristaState(self.image_file_path)
+            state.populate(self.arista_handler.run_command_json, keys=('file_systems',),
+                           run_commands=self.arista_handler.run_commands_json)
+            if state.has_flash_space():
+                self.status = NEEDS_COPY
+            else:
+                self.status = NO_FLASH_SPACE
+                self.error = 'free flash {} KB, image {} KB'.format(state.free_flash_kb(), state.image_size())
+        except Exception as e:
+            self.status = FAILED
+            self.error = '{}: {}'.format(type(e).__name__, e)
+        finally:
+            # stage() logs in again, so only --concurrency sessions are open at a time
+            self.close()
+        return self
+
+    def stage(self):
+        try:
+            self.arista_handler.connect_to_device()
+            self.arista_handler.file_transfer()
+            self.arista_handler.image_staged = False
+            if self.arista_handler.image_is_staged():
+                self.status = STAGED
+            else:
+                self.status = FAILED
+                self.error = 'md5 mismatch after copy'
+        except SystemExit:
+            self.status = FAILED
+            self.error = 'login or file transfer exited'
+        except Exception as e:
+            self.status = FAILED
+            self.error = '{}: {}'.format(type(e).__name__, e)
+        finally:
+            self.close()
+        return self
+
+    def close(self):
+        if self.arista_handler is not None:
+            self.arista_handler.disconnect()
+
+
+def prestage(device_list, image_file_path, username, password, image_md5, concurrency=1, transport='ssh',
+             sites=None, transfer_scheduler=None):
+    targets = []
+    for ip_address in device_list:
+        args = {
+            'username': username,
+            'password': password,
+            'ip_address': ip_address,
+            'path': image_file_path,
+            'md5': image_md5,
+            'transport': transport,
+            'site': (sites or {}).get(ip_address),
+            'transfer_scheduler': transfer_scheduler
+        }
+        targets.append(StagingTarget(args, image_file_path))
+
+    workers = max(1, min(concurrency, len(targets)))
+    print('{} PRE-STAGING CHECK ON {} DEVICES {}'.format(LINE, len(targets), LINE))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(StagingTarget.check, targets))
+
+    # report the blockers before any copy starts
+    for target in targets:
+        if target.status in (NO_FLASH_SPACE, UNREACHABLE, FAILED):
+            print('{:<20} {:<16} {}'.format(target.ip_address, target.status, target.error or ''))
+
+    to_copy = [target for target in targets if target.status == NEEDS_COPY]
+    print('{} COPYING IMAGE TO {} DEVICES {}'.format(LINE, len(to_copy), LINE))
+    if to_copy:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(to_copy)))) as executor:
+            list(executor.map(StagingTarget.stage, to_copy))
+
+    print('{} PRE-STAGING REPORT {}'.format(LINE, LINE))
+    for target in targets:
+        target.close()
+        print('{:<20} {:<16} {}'.format(target.ip_address, target.status, target.error or ''))
+    if any(target.status not in (STAGED, ALREADY_STAGED) for target in targets):
+        return 1
+    return 0
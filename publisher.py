@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import socket
+from urllib.parse import urlsplit
+
+from capture import safe_name
+
+GIT_HOST = 'www.github.factset.com'
+CONNECT_TIMEOUT = 5
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(path, size):
+    # None when the file is missing or has another size, so most changed
+    # devices are found without reading the old file
+    try:
+        if os.path.getsize(path) != size:
+            return None
+        with open(path, 'rb') as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
+
+
+def remote_host(repo, default=GIT_HOST):
+    # host of origin, for both https://host/... and git@host:... urls
+    try:
+        url = repo.remotes.origin.url
+    except (AttributeError, IndexError, ValueError):
+        return default
+    if '://' in url:
+        return urlsplit(url).hostname or default
+    if ':' in url:
+        return url.split(':', 1)[0].rsplit('@', 1)[-1] or default
+    return default
+
+
+def reachable(host, port=443, timeout=CONNECT_TIMEOUT):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class Publisher:
+    # Writes one json file per device under directory and commits only
+    # the files whose content changed, so a run costs what changed rather
+    # than what the repository holds.
+
+    def __init__(self, directory, repo_path=None):
+        self.directory = directory
+        self.repo_path = repo_path or os.getcwd()
+        self.changed = []
+        self.unchanged = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, hostname):
+        return os.path.join(self.directory, '{}.json'.format(safe_name(hostname)))
+
+    def write_device(self, hostname, state_output):
+        data = json.dumps(state_output, indent=4, sort_keys=True).encode()
+        path = self.path(hostname)
+        if file_hash(path, len(data)) == content_hash(data):
+            self.unchanged += 1
+            return False
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.changed.append(path)
+        return True
+
+    def add(self, config_state):
+        for out in config_state:
+            for hostname, state_output in out.items():
+                self.write_device(hostname, state_output)
+
+    def commit(self, message):
+        # stages only the changed files, one commit per run
+        import git
+        try:
+            repo = git.Repo(self.repo_path, search_parent_directories=True)
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+            print('{} is not a git repository, nothing committed'.format(self.repo_path))
+            return None, None
+        paths = [os.path.relpath(os.path.abspath(path), repo.working_tree_dir)
+                 for path in self.changed]
+        commit = None
+        if self.changed:
+            repo.index.add(paths)
+            commit = repo.index.commit(message)
+        print('{} devices changed, {} unchanged{}'.format(
+            len(self.changed), self.unchanged, ', committed {}'.format(commit.hexsha[:8]) if commit else ''))
+        return repo, commit
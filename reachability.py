@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+
+SSH_PORT = 22
+CONNECT_TIMEOUT = 3
+INITIAL_DELAY = 1
+MAX_DELAY = 30
+# waiting for a host to come back: a probe is one TCP connect, so keep
+# polling often and report it ready within seconds
+UP_MAX_DELAY = 3
+JITTER = 0.2
+
+
+class ReachabilityMonitor:
+    # In-process, asyncio based SSH reachability checks.
+    #
+    # A host counts as up once it accepts a TCP connection on the SSH port
+    # and sends an 'SSH-' banner, which is the point where netmiko can log
+    # in. Probes back off exponentially with jitter, so many hosts can be
+    # watched at once without forking a ping per probe.
+
+    def __init__(self, port=SSH_PORT, connect_timeout=CONNECT_TIMEOUT, initial_delay=INITIAL_DELAY,
+                 max_delay=MAX_DELAY, up_max_delay=UP_MAX_DELAY, jitter=JITTER):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.up_max_delay = up_max_delay
+        self.jitter = jitter
+
+    async def probe(self, host):
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.port), self.connect_timeout)
+            banner = await asyncio.wait_for(reader.readline(), self.connect_timeout)
+            return banner.startswith(b'SSH-')
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    def _delay(self, delay):
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def wait_for(self, host, up=True, timeout=300):
+        # seconds until the host reached the wanted state, None on timeout
+        start = time.monotonic()
+        delay = self.initial_delay
+        max_delay = self.up_max_delay if up else self.max_delay
+        while True:
+            if await self.probe(host) == up:
+                return time.monotonic() - start
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self._delay(delay), remaining))
+            delay = min(delay * 2, max_delay)
+
+    async def wait_for_reboot(self, host, down_timeout=120, up_timeout=900):
+        # (went_down, seconds from the call, i.e. the reload, until SSH was
+        # back or None)
+        start = time.monotonic()
+        went_down = await self.wait_for(host, up=False, timeout=down_timeout)
+        if went_down is None:
+            return False, None
+        if await self.wait_for(host, up=True, timeout=up_timeout) is None:
+            return True, None
+        return True, time.monotonic() - start
+
+    async def watch(self, hosts, up=True, timeout=300):
+        # yields (host, seconds or None) for every host as soon as it is ready
+        async def wait(host):
+            return host, await self.wait_for(host, up=up, timeout=timeout)
+
+        for ready in asyncio.as_completed([wait(host) for host in hosts]):
+            yield await ready
+
+
+def wait_for_ssh(host, timeout=300, **kwargs):
+    return asyncio.run(ReachabilityMonitor(**kwargs).wait_for(host, up=True, timeout=timeout))
+
+
+def wait_for_reboot(host, down_timeout=120, up_timeout=900, **kwargs):
+    return asyncio.run(ReachabilityMonitor(**kwargs).wait_for_reboot(host, down_timeout, up_timeout))
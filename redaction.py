@@ -0,0 +1,74 @@
+import re
+from functools import lru_cache
+
+MASK = ' ***********'
+
+
+def iter_lines(text):
+    # same pieces as text.split("\n") without building the list
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+class Redactor:
+    # Masks everything after the first sensitive keyword of a line.
+    #
+    # Keywords keep their list order as priority: when a line contains
+    # several of them ('authentication' and 'authentication-key') the one
+    # listed first wins, exactly like the old per-keyword re.sub loop.
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.search = None
+        if self.keywords:
+            # a keyword containing another keyword can never be the only
+            # match on a line, so the combined matcher only needs the rest
+            required = [k for k in self.keywords
+                        if not any(o != k and o in k for o in self.keywords)]
+            alternation = '|'.join(re.escape(k) for k in sorted(set(required), key=len, reverse=True))
+            self.search = re.compile(alternation).search
+
+    def mask(self, line):
+        for keyword in self.keywords:
+            index = line.find(keyword)
+            if index != -1:
+                end = index + len(keyword)
+                redacted = line[:end] + MASK
+                # re.sub() also replaced the empty match at the end of the
+                # line when the keyword occurs there a second time
+                if end < len(line) and line.endswith(keyword):
+                    redacted += MASK
+                return redacted
+        return line
+
+    def redact_line(self, line):
+        if self.search is not None and self.search(line):
+            return self.mask(line)
+        return line
+
+    def redact_lines(self, lines):
+        search = self.search
+        if search is None:
+            yield from lines
+            return
+        mask = self.mask
+        for line in lines:
+            yield mask(line) if search(line) else line
+
+    def redact(self, text):
+        search = self.search
+        if search is None:
+            return text.split('\n')
+        mask = self.mask
+        return [mask(line) if search(line) else line for line in text.split('\n')]
+
+
+@lru_cache(maxsize=32)
+def get_redactor(keywords):
+    return Redactor(keywords)
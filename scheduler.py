@@ -0,0 +1,184 @@
+import json
+import math
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from arista_eos_upgrade import LINE, AristaOsUpgrade
+
+TOPOLOGY_COMMANDS = ['show hostname', 'show mlag', 'show lldp neighbors']
+
+DEFAULT_DEVICE_MINUTES = 30
+
+
+class DeviceInfo:
+    def __init__(self, ip_address, hostname=None, mlag_key=None, neighbors=(), reachable=True):
+        self.ip_address = ip_address
+        self.hostname = hostname
+        self.mlag_key = mlag_key
+        self.neighbors = set(neighbors)
+        self.reachable = reachable
+
+
+def parse_topology(ip_address, outputs):
+    hostname_output, mlag_output, lldp_output = outputs
+    hostname = (hostname_output or {}).get('hostname')
+    mlag_key = None
+    mlag_output = mlag_output or {}
+    # both peers report the same domain and MLAG system id
+    if mlag_output.get('state') not in (None, 'disabled') and mlag_output.get('domainId'):
+        mlag_key = (mlag_output.get('domainId'), mlag_output.get('systemId'))
+    neighbors = set()
+    for neighbor in (lldp_output or {}).get('lldpNeighbors', []):
+        name = neighbor.get('neighborDevice')
+        if name:
+            neighbors.add(name.split('.')[0])
+    return DeviceInfo(ip_address, hostname, mlag_key, neighbors)
+
+
+def device_topology(args):
+    try:
+        handler = AristaOsUpgrade(args)
+    except SystemExit:
+        return DeviceInfo(args['ip_address'], reachable=False)
+    try:
+        return parse_topology(args['ip_address'], handler.run_commands_json(TOPOLOGY_COMMANDS))
+    except Exception as e:
+        print('TOPOLOGY: FAIL for {}, ERROR: {}'.format(args['ip_address'], e))
+        return DeviceInfo(args['ip_address'], reachable=False)
+    finally:
+        handler.disconnect()
+
+
+def collect_topology(device_list, username, password, transport='ssh', concurrency=1, image_file_path=''):
+    targets = [{'username': username, 'password': password, 'ip_address': ip_address,
+                'path': image_file_path, 'transport': transport} for ip_address in device_list]
+    print('{} COLLECTING MLAG AND LLDP DATA FROM {} DEVICES {}'.format(LINE, len(targets), LINE))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets)))) as executor:
+        return list(executor.map(device_topology, targets))
+
+
+def conflict_graph(infos):
+    # MLAG peers must never be down together
+    conflicts = {info.ip_address: set() for info in infos}
+    peers = {}
+    for info in infos:
+        if info.mlag_key is not None:
+            peers.setdefault(info.mlag_key, []).append(info.ip_address)
+    for members in peers.values():
+        for ip_address in members:
+            conflicts[ip_address].update(member for member in members if member != ip_address)
+    return conflicts
+
+
+def redundancy_groups(infos):
+    # fleet devices that share an LLDP neighbor (e.g. the spines every leaf
+    # of a pod connects to), at most len(group) - 1 of them may be down
+    attached = {}
+    for info in infos:
+        for neighbor in info.neighbors:
+            attached.setdefault(neighbor, set()).add(info.ip_address)
+    groups = set(frozenset(members) for members in attached.values() if len(members) > 1)
+    return sorted(groups, key=lambda group: sorted(group))
+
+
+def plan_waves(device_list, conflicts, groups=(), sites=None, site_cap=0, canary=1, max_wave=0, isolated=(),
+               wave_growth=0):
+    # Greedy coloring, most constrained device first: each device goes into
+    # the first wave with no conflicting peer and room under the caps.
+    # With wave_growth, wave n holds at most canary * wave_growth ** n, the
+    # same sizes as the engine's unscheduled waves.
+    # Isolated devices (peers unknown) get a wave of their own at the end.
+    sites = sites or {}
+    position = {ip: index for index, ip in enumerate(device_list)}
+    waves = []
+    order = sorted((ip for ip in device_list if ip not in isolated),
+                   key=lambda ip: (-len(conflicts.get(ip, ())), position[ip]))
+    device_groups = {ip: [group for group in groups if ip in group] for ip in device_list}
+    for ip_address in order:
+        for number, wave in enumerate(waves + [[]]):
+            cap = canary if number == 0 else max_wave
+            if number and wave_growth and canary:
+                growth_cap = canary * wave_growth ** number
+                cap = min(cap, growth_cap) if cap else growth_cap
+            if cap and len(wave) >= cap:
+                continue
+            if any(other in conflicts.get(ip_address, ()) for other in wave):
+                continue
+            site = sites.get(ip_address)
+            if site_cap and site is not None and \
+                    sum(1 for other in wave if sites.get(other) == site) >= site_cap:
+                continue
+            if any(sum(1 for other in wave if other in group) >= len(group) - 1
+                   for group in device_groups[ip_address]):
+                continue
+            if number == len(waves):
+                waves.append(wave)
+            wave.append(ip_address)
+            break
+    # keep the inventory order inside a wave
+    return [sorted(wave, key=position.get) for wave in waves] + \
+        [[ip] for ip in device_list if ip in isolated]
+
+
+def wave_seconds(wave, device_seconds, concurrency):
+    return math.ceil(len(wave) / max(1, concurrency)) * device_seconds
+
+
+def split_window(waves, device_seconds, concurrency, window_seconds):
+    # the waves that fit into one maintenance window, and the rest
+    if not window_seconds:
+        return waves, []
+    total = 0
+    for number, wave in enumerate(waves):
+        total += wave_seconds(wave, device_seconds, concurrency)
+        if total > window_seconds:
+            return waves[:max(number, 1)], waves[max(number, 1):]
+    return waves, []
+
+
+def device_seconds_from_events(path, default=DEFAULT_DEVICE_MINUTES * 60):
+    # median upgrade time of earlier runs, from --metrics_dir/events.jsonl
+    durations = []
+    try:
+        with open(path) as f:
+            for line in f:
+                event = json.loads(line)
+                if event.get('event') == 'device' and event.get('status') == 'upgraded':
+                    durations.append(event['seconds'])
+    except (OSError, ValueError):
+        pass
+    if not durations:
+        return default
+    return statistics.median(durations)
+
+
+def print_plan(waves, later, infos, device_seconds, concurrency, sites=None):
+    sites = sites or {}
+    names = {info.ip_address: info.hostname for info in infos}
+    total = 0
+    print('{} UPGRADE PLAN {}'.format(LINE, LINE))
+    for number, wave in enumerate(waves):
+        seconds = wave_seconds(wave, device_seconds, concurrency)
+        total += seconds
+        print('wave {} ({} devices, ~{:.0f} min):'.format(number, len(wave), seconds / 60))
+        for ip_address in wave:
+            print('    {:<20} {:<30} {}'.format(ip_address, names.get(ip_address) or '-', sites.get(ip_address) or ''))
+    print('estimated duration: {:.0f} min for {} waves at {:.0f} min per device, concurrency {}'.format(
+        total / 60, len(waves), device_seconds / 60, concurrency))
+    if later:
+        print('{} devices in {} more waves do not fit into the maintenance window: {}'.format(
+            sum(len(wave) for wave in later), len(later),
+            ', '.join(ip for wave in later for ip in wave)))
+    return total
+
+
+def schedule(device_list, username, password, sites=None, transport='ssh', concurrency=1,
+             canary=1, wave_growth=0, site_cap=0, window_seconds=0, device_seconds=DEFAULT_DEVICE_MINUTES * 60):
+    infos = collect_topology(device_list, username, password, transport, concurrency)
+    unreachable = set(info.ip_address for info in infos if not info.reachable)
+    waves = plan_waves(device_list, conflict_graph(infos), redundancy_groups(infos),
+                       sites=sites, site_cap=site_cap, canary=canary, isolated=unreachable,
+                       wave_growth=wave_growth)
+    waves, later = split_window(waves, device_seconds, concurrency, window_seconds)
+    print_plan(waves, later, infos, device_seconds, concurrency, sites)
+    return waves, later
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import time
+
+# canned EOS json, keyed by the commands AristaState sends
+EOS_JSON = {
+    'sh version': {'modelName': 'DCS-7280CR3-32P4', 'version': '4.28.3M', 'memTotal': 32000000,
+                   'memFree': 21000000, 'serialNumber': 'SIM0000000'},
+    'sh environment power': {'powerSupplies': {'1': {'state': 'ok'}, '2': {'state': 'ok'}}},
+    'sh environment cooling': {'systemStatus': 'coolingOk', 'fanTraySlots': []},
+    'sh ip route vrf all summary': {'vrfs': {'default': {'totalRoutes': 1200, 'connected': 40, 'static': 2,
+                                                 'bgpCounts': {'bgpTotal': 1158}}}},
+    'sh mlag interfaces': {'interfaces': {'1': {'localInterface': 'Port-Channel1', 'status': 'active-full'}}},
+    'sh spanning-tree': {'spanningTreeInstances': {}},
+    'sh file systems': {'fileSystems': [{'prefix': 'flash:', 'fsType': 'flash', 'permission': 'rw',
+                                         'online': True, 'size': 3957010432, 'free': 2706481152}]},
+    'sh interfaces status connected': {'interfaceStatuses': {
+        'Ethernet{}'.format(i): {'linkStatus': 'connected', 'bandwidth': 100000000000} for i in range(1, 33)}},
+}
+
+IOS_TEXT = {
+    'show version': 'Cisco IOS Software, Version 15.2\n{name} uptime is 1 week\n',
+    'show ip interface brief': 'Interface   IP-Address   OK? Method Status   Protocol\n'
+                               'Ethernet0/0 10.0.0.1     YES manual up       up\n',
+}
+
+
+def running_config(name, size):
+    lines = ['hostname {}'.format(name), '!']
+    index = 0
+    total = 0
+    while total < size:
+        block = ['interface Ethernet{}'.format(index),
+                 '   description simulated link {}'.format(index),
+                 '   no shutdown',
+                 '!']
+        lines.extend(block)
+        total += sum(len(line) + 1 for line in block)
+        index += 1
+    lines.append('username admin privilege 15 secret sha512 $6$simulated')
+    lines.append('end')
+    return '\n'.join(lines)
+
+
+class SimulatedDevice:
+    # One fake EOS or IOS box served on localhost over SSH and/or eAPI.
+
+    def __init__(self, name, platform='eos', latency=0.0, output_size=20000,
+                 reboot_downtime=5.0, failure_rate=0.0, outputs=None):
+        self.name = name
+        self.platform = platform
+        self.latency = latency
+        self.output_size = output_size
+        self.reboot_downtime = reboot_downtime
+        self.failure_rate = failure_rate
+        self.outputs = outputs or {}
+        self.down_until = 0
+        self.on_reload = None
+        self.config = running_config(name, output_size)
+        self.commands_served = 0
+
+    def is_down(self):
+        return time.monotonic() < self.down_until
+
+    def reload(self):
+        self.down_until = time.monotonic() + self.reboot_downtime
+        if self.on_reload is not None:
+            self.on_reload()
+
+    async def respond(self, command):
+        self.commands_served += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError('injected failure for {}'.format(command))
+        command = command.strip()
+        if command in self.outputs:
+            return self.outputs[command]
+        if command.endswith('| json'):
+            return json.dumps(self.json_output(command[:-len('| json')].strip()))
+        if command in ('show running-config', 'sh running-config', 'show run'):
+            return self.config
+        if command in ('show hostname',):
+            return 'Hostname: {}\nFQDN:     {}.sim\n'.format(self.name, self.name)
+        if command in IOS_TEXT:
+            return IOS_TEXT[command].format(name=self.name)
+        if command.startswith('verify /md5'):
+            return '{} = {}'.format(command, '0' * 32)
+        return ''
+
+    def json_output(self, command):
+        if command in self.outputs:
+            return self.outputs[command]
+        return EOS_JSON.get(command, {})
+
+
+class EapiServer:
+    # minimal HTTP/1.1 keep-alive server speaking eAPI runCmds
+
+    def __init__(self, device):
+        self.device = device
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode().partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                if self.device.is_down():
+                    break
+                reply = await self.run_cmds(json.loads(body))
+                data = json.dumps(reply).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(data)).encode() + b'\r\n\r\n' + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def run_cmds(self, request):
+        results = []
+        try:
+            for cmd in request['params']['cmds']:
+                command = cmd['cmd'] if isinstance(cmd, dict) else cmd
+                output = await self.device.respond(command)
+                if request['params'].get('format', 'json') == 'json':
+                    results.append(self.device.json_output(command))
+                else:
+                    results.append({'output': output})
+        except RuntimeError as e:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': 1000, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': results}
+
+
+def ssh_server_factory(device):
+    # asyncssh is only needed when the SSH side of the simulator is used
+    import asyncssh
+
+    class Server(asyncssh.SSHServer):
+        def begin_auth(self, username):
+            return True
+
+        def password_auth_supported(self):
+            return True
+
+        def validate_password(self, username, password):
+            return True
+
+    async def handle_process(process):
+        prompt = '{}#'.format(device.name) if device.platform == 'eos' else '{}>'.format(device.name)
+        process.stdout.write(prompt)
+        try:
+            async for line in process.stdin:
+                command = line.rstrip('\r\n')
+                if device.is_down():
+                    break
+                if command in ('reload', 'reload now'):
+                    device.reload()
+                    break
+                if command in ('enable',):
+                    prompt = '{}#'.format(device.name)
+                elif command:
+                    try:
+                        output = await device.respond(command)
+                    except RuntimeError:
+                        output = '% Invalid input'
+                    if output:
+                        process.stdout.write(output.replace('\n', '\r\n') + '\r\n')
+                process.stdout.write(prompt)
+        except asyncssh.BreakReceived:
+            pass
+        process.exit(0)
+
+    return asyncssh, Server, handle_process
+
+
+class SimulatedFleet:
+    def __init__(self, count, platform='eos', ssh_base_port=None, eapi_base_port=None, **device_kwargs):
+        self.devices = [SimulatedDevice('SIM-{}'.format(i), platform=platform, **device_kwargs)
+                        for i in range(count)]
+        self.ssh_base_port = ssh_base_port
+        self.eapi_base_port = eapi_base_port
+        self.host_key = None
+        self.servers = {}
+
+    async def start(self, host_key_path='simulator_host_key'):
+        _raise_fd_limit(len(self.devices) * 4 + 256)
+        if self.ssh_base_port is not None:
+            import asyncssh
+            try:
+                self.host_key = asyncssh.read_private_key(host_key_path)
+            except (OSError, asyncssh.KeyImportError):
+                self.host_key = asyncssh.generate_private_key('ssh-ed25519')
+                self.host_key.write_private_key(host_key_path)
+        for index in range(len(self.devices)):
+            await self.start_device(index)
+
+    async def start_device(self, index):
+        device = self.devices[index]
+        device.on_reload = lambda: asyncio.ensure_future(self.reboot_device(index))
+        servers = []
+        if self.eapi_base_port is not None:
+            servers.append(await asyncio.start_server(
+                EapiServer(device).handle, '127.0.0.1', self.eapi_base_port + index))
+        if self.ssh_base_port is not None:
+            asyncssh, server, handle_process = ssh_server_factory(device)
+            servers.append(await asyncssh.create_server(
+                server, '127.0.0.1', self.ssh_base_port + index,
+                server_host_keys=[self.host_key], process_factory=handle_process))
+        self.servers[index] = servers
+
+    async def reboot_device(self, index):
+        # stop listening for the downtime so probes see the device go away
+        for server in self.servers.pop(index, []):
+            server.close()
+        await asyncio.sleep(self.devices[index].reboot_downtime)
+        await self.start_device(index)
+
+    async def stop(self):
+        for servers in self.servers.values():
+            for server in servers:
+                server.close()
+        self.servers = {}
+
+
+def _raise_fd_limit(wanted):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--platform', choices=['eos', 'ios'], default='eos')
+    parser.add_argument('--ssh_base_port', type=int, default=None,
+                        help='serve SSH on consecutive ports starting here (needs asyncssh)')
+    parser.add_argument('--eapi_base_port', type=int, default=None,
+                        help='serve plain HTTP eAPI on consecutive ports starting here')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every command')
+    parser.add_argument('--output_size', type=int, default=20000, help='running-config size in bytes')
+    parser.add_argument('--reboot_downtime', type=float, default=5.0)
+    parser.add_argument('--failure_rate', type=float, default=0.0)
+    args = parser.parse_args()
+    if args.ssh_base_port is None and args.eapi_base_port is None:
+        parser.error('give --ssh_base_port and/or --eapi_base_port')
+
+    fleet = SimulatedFleet(args.devices, platform=args.platform,
+                           ssh_base_port=args.ssh_base_port, eapi_base_port=args.eapi_base_port,
+                           latency=args.latency, output_size=args.output_size,
+                           reboot_downtime=args.reboot_downtime, failure_rate=args.failure_rate)
+
+    async def serve():
+        await fleet.start()
+        print('SIMULATOR READY: {} devices'.format(args.devices), flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
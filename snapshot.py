@@ -0,0 +1,149 @@
+WILDCARD = '*'
+
+
+class Extractor:
+    # Collects many keys and key paths from a JSON document in one walk.
+    #
+    # A bare key ('memFree') matches at any depth, like AristaState.find_key.
+    # A key path (('interfaceStatuses', '*', 'linkStatus')) matches from the
+    # root, '*' matches any key and is reported back with the value.
+
+    def __init__(self, targets):
+        self.keys = set()
+        self.paths = {}
+        for target in targets:
+            if isinstance(target, tuple):
+                node = self.paths
+                for part in target:
+                    node = node.setdefault(part, {})
+                node[None] = target
+            else:
+                self.keys.add(target)
+
+    def extract(self, data):
+        results = {key: [] for key in self.keys}
+        for node in _path_targets(self.paths):
+            results[node] = []
+        if not isinstance(data, dict):
+            return results
+
+        self._walk(data, [(self.paths, ())] if self.paths else [], results)
+        return results
+
+    def _walk(self, current, nodes, results):
+        if not nodes:
+            # outside of every key path only the bare keys matter
+            if self.keys:
+                self._walk_keys(current, results)
+            return
+        keys = self.keys
+        items = current.items()
+        if not keys and not any(WILDCARD in node for node, _ in nodes):
+            # only exact path steps below here, look them up instead of scanning
+            wanted = set()
+            for node, _ in nodes:
+                wanted.update(key for key in node if key is not None)
+            items = [(key, current[key]) for key in wanted if key in current]
+        for key, value in items:
+            next_nodes = []
+            for node, captured in nodes:
+                child = node.get(key)
+                if child is not None:
+                    next_nodes.append((child, captured))
+                child = node.get(WILDCARD)
+                if child is not None:
+                    next_nodes.append((child, captured + (key,)))
+            if isinstance(value, dict):
+                self._walk(value, next_nodes, results)
+                continue
+            if key in keys:
+                results[key].append(value)
+            for node, captured in next_nodes:
+                target = node.get(None)
+                if target is not None:
+                    results[target].append((captured, value))
+
+    def _walk_keys(self, current, results):
+        keys = self.keys
+        for key, value in current.items():
+            if type(value) is dict:
+                self._walk_keys(value, results)
+            elif key in keys:
+                results[key].append(value)
+
+
+def _path_targets(node):
+    for key, child in node.items():
+        if key is None:
+            yield child
+        else:
+            yield from _path_targets(child)
+
+
+class Snapshot:
+    # Compact, comparable summary of one AristaState
+    __slots__ = ('free_memory', 'free_flash', 'running_version', 'model_name', 'total_ip_routes',
+                 'interfaces', 'mlag')
+
+    def __init__(self, free_memory=None, free_flash=None, running_version=None, model_name=None,
+                 total_ip_routes=None, interfaces=(), mlag=()):
+        # free_memory is free RAM in KB (memFree), free_flash free bytes on flash:
+        self.free_memory = free_memory
+        self.free_flash = free_flash
+        self.running_version = running_version
+        self.model_name = model_name
+        self.total_ip_routes = total_ip_routes
+        self.interfaces = interfaces
+        self.mlag = mlag
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def diff(self, other):
+        return {name: (getattr(self, name), getattr(other, name))
+                for name in self.__slots__ if getattr(self, name) != getattr(other, name)}
+
+    def __eq__(self, other):
+        if not isinstance(other, Snapshot):
+            return NotImplemented
+        return not self.diff(other)
+
+    def __repr__(self):
+        return 'Snapshot({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.as_dict().items()
+                                               if k not in ('interfaces', 'mlag')))
+
+
+# fields AristaState needs, per debug_commands key
+ARISTA_EXTRACTORS = {
+    'version_summary': Extractor(['memFree', 'modelName', ('version',)]),
+    'route_summary': Extractor(['totalRoutes']),
+    'interfaces_status': Extractor([('interfaceStatuses', WILDCARD, 'linkStatus')]),
+    'mlag_summary': Extractor([('interfaces', WILDCARD, 'status')]),
+}
+
+
+def flash_free(output):
+    # 'sh file systems' json: {'fileSystems': [{'prefix': 'flash:', 'free': bytes, ...}]}
+    for file_system in (output or {}).get('fileSystems', []):
+        if file_system.get('prefix') == 'flash:' and file_system.get('free') is not None:
+            return int(file_system['free'])
+    return None
+
+
+def extract_arista(debug_commands):
+    results = {}
+    for command_key, extractor in ARISTA_EXTRACTORS.items():
+        results[command_key] = extractor.extract(debug_commands[command_key]['output'])
+
+    version = results['version_summary']
+    # package versions under 'details' also use the 'version' key
+    running_version = [value for _, value in version[('version',)]]
+    interfaces = results['interfaces_status'][('interfaceStatuses', WILDCARD, 'linkStatus')]
+    mlag = results['mlag_summary'][('interfaces', WILDCARD, 'status')]
+    return Snapshot(free_memory=sum(int(item) for item in version['memFree']),
+                    free_flash=flash_free(debug_commands.get('file_systems', {}).get('output')),
+                    running_version=running_version[-1] if running_version else None,
+                    model_name=version['modelName'][-1] if version['modelName'] else None,
+                    total_ip_routes=sum(int(item) for item in results['route_summary']['totalRoutes']),
+                    interfaces=tuple(sorted((captured[0], status) for captured, status in interfaces)),
+                    mlag=tuple(sorted((captured[0], status) for captured, status in mlag)))
@@ -0,0 +1,173 @@
+import argparse
+import itertools
+import json
+import re
+import sqlite3
+import sys
+import zlib
+from datetime import datetime, timezone
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    rpd_id TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    ip TEXT,
+    phase TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    command_key TEXT NOT NULL,
+    command TEXT,
+    payload BLOB
+);
+CREATE INDEX IF NOT EXISTS records_device ON records (rpd_id, hostname, phase, ts);
+CREATE INDEX IF NOT EXISTS records_compare ON records (rpd_id, hostname, command_key, phase, ts);
+CREATE INDEX IF NOT EXISTS records_ts ON records (phase, ts);
+'''
+
+# confirmations.py current_date format, US/Eastern wall clock like run_started()
+TEXT_DATE_FORMAT = '%m-%d-%Y,%H:%M'
+TEXT_TIMEZONE = 'US/Eastern'
+
+HEADER_PATTERN = re.compile(r'\s*(pre|post) changes at (\S+?)(?=\[|\s|$)')
+
+
+def utc_ts(ts):
+    # every ts is stored as UTC ISO 8601, so they sort and compare as strings
+    # whichever timezone the capture ran in
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        raise ValueError('timestamp {} has no timezone'.format(ts))
+    return ts.astimezone(timezone.utc).isoformat()
+
+
+def pack(output):
+    return zlib.compress(json.dumps(output, separators=(',', ':')).encode(), 6)
+
+
+def unpack(payload):
+    if payload is None:
+        return None
+    return json.loads(zlib.decompress(payload))
+
+
+class SnapshotStore:
+    # One compressed record per device and command in an sqlite file,
+    # indexed by RPD id, hostname, phase and timestamp.
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def write_device(self, rpd_id, phase, ts, hostname, state_output, ip=None):
+        # one transaction per device
+        ts = utc_ts(ts)
+        prefix = hostname + '_'
+        rows = []
+        for key, value in state_output.items():
+            command_key = key[len(prefix):] if key.startswith(prefix) else key
+            rows.append((rpd_id, hostname, ip, phase, ts, command_key,
+                         value.get('command'), pack(value.get('output'))))
+            if value.get('parsed') is not None:
+                # confirmations.py --parse records, diffable without re-parsing
+                rows.append((rpd_id, hostname, ip, phase, ts, command_key + ':parsed',
+                             value.get('command'), pack(value['parsed'])))
+        with self.db:
+            self.db.executemany('INSERT INTO records (rpd_id, hostname, ip, phase, ts, command_key, command, payload) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def latest_ts(self, rpd_id, hostname, phase):
+        row = self.db.execute('SELECT MAX(ts) FROM records WHERE rpd_id = ? AND hostname = ? AND phase = ?',
+                              (rpd_id, hostname, phase)).fetchone()
+        return row[0]
+
+    def get_device(self, rpd_id, hostname, phase, ts=None):
+        ts = self.latest_ts(rpd_id, hostname, phase) if ts is None else utc_ts(ts)
+        device = {}
+        for command_key, command, payload in self.db.execute(
+                'SELECT command_key, command, payload FROM records '
+                'WHERE rpd_id = ? AND hostname = ? AND phase = ? AND ts = ? ORDER BY id',
+                (rpd_id, hostname, phase, ts)):
+            device[command_key] = {'command': command, 'output': unpack(payload)}
+        return device
+
+    def hostnames(self, rpd_id):
+        return [row[0] for row in self.db.execute(
+            'SELECT DISTINCT hostname FROM records WHERE rpd_id = ? ORDER BY hostname', (rpd_id,))]
+
+    def iter_compare(self, rpd_id):
+        # streams (hostname, command_key, pre output, post output) using
+        # the latest capture of each phase, one row in memory at a time
+        cursor = self.db.execute(
+            'SELECT hostname, command_key, phase, ts, payload FROM records '
+            "WHERE rpd_id = ? AND phase IN ('pre', 'post') "
+            'ORDER BY hostname, command_key, phase, ts', (rpd_id,))
+        for (hostname, command_key), rows in itertools.groupby(cursor, key=lambda row: (row[0], row[1])):
+            latest = {}
+            for _, _, phase, _, payload in rows:
+                latest[phase] = payload
+            yield hostname, command_key, unpack(latest.get('pre')), unpack(latest.get('post'))
+
+    def import_text(self, path, rpd_id):
+        # confirmations.txt: a '<phase> changes at <date>' header followed by
+        # one json.dump()ed list per device, with nothing in between
+        with open(path) as f:
+            text = f.read()
+        match = HEADER_PATTERN.match(text)
+        if not match:
+            raise ValueError('{} does not start with a "<phase> changes at <date>" header'.format(path))
+        phase, date = match.groups()
+        from pytz import timezone as zone
+        ts = zone(TEXT_TIMEZONE).localize(datetime.strptime(date, TEXT_DATE_FORMAT))
+        decoder = json.JSONDecoder()
+        position = match.end()
+        devices = 0
+        while True:
+            while position < len(text) and text[position].isspace():
+                position += 1
+            if position >= len(text):
+                break
+            config_state, position = decoder.raw_decode(text, position)
+            for out in config_state:
+                for hostname, state_output in out.items():
+                    self.write_device(rpd_id, phase, ts, hostname, state_output)
+                    devices += 1
+        return devices
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='sqlite snapshot store')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    importer = subparsers.add_parser('import', help='import confirmations.txt files')
+    importer.add_argument('--rpd', required=True)
+    importer.add_argument('files', nargs='+')
+    show = subparsers.add_parser('show', help='print the latest capture of one device')
+    show.add_argument('--rpd', required=True)
+    show.add_argument('--phase', default='pre')
+    show.add_argument('hostname')
+    compare = subparsers.add_parser('compare', help='list devices whose pre and post captures differ')
+    compare.add_argument('--rpd', required=True)
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.store)
+    if args.action == 'import':
+        for file_name in args.files:
+            print('{}: imported {} devices'.format(file_name, store.import_text(file_name, args.rpd)))
+    elif args.action == 'show':
+        print(json.dumps(store.get_device(args.rpd, args.hostname, args.phase), indent=4))
+    elif args.action == 'compare':
+        for hostname, command_key, pre, post in store.iter_compare(args.rpd):
+            if pre != post:
+                print('{} {}: changed'.format(hostname, command_key))
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+
+import pytest
+
+import capture
+from capture import CaptureError, CaptureFile, LineSplitter, capture_scrapli
+
+PROMPT = r'^\S{0,48}[>#]\s*$'
+
+
+class ListSink:
+
+    def __init__(self):
+        self.lines = []
+
+    def write_line(self, line):
+        self.lines.append(line)
+
+
+def test_line_split_across_reads():
+    sink = ListSink()
+    splitter = LineSplitter(sink, PROMPT, 'show version')
+    assert not splitter.feed('leaf1#show version\r\nArista DCS-7')
+    assert not splitter.feed('050SX3-48YC8\r\nSoftware image version: 4.2')
+    assert splitter.feed('8.3M\r\nleaf1#')
+    # the echo and the prompt are not part of the output
+    assert sink.lines == ['Arista DCS-7050SX3-48YC8', 'Software image version: 4.28.3M']
+
+
+def test_trailing_partial_line_is_not_the_prompt():
+    sink = ListSink()
+    splitter = LineSplitter(sink, PROMPT)
+    # a partial line ending in '#' only ends the output once it is a prompt
+    assert not splitter.feed('interface Ethernet1\n   description uplink #')
+    assert sink.lines == ['interface Ethernet1']
+    assert not splitter.feed('1 to spine\n')
+    assert splitter.feed('leaf1#')
+    assert sink.lines == ['interface Ethernet1', '   description uplink #1 to spine']
+
+
+def test_capture_file_summary(tmp_path):
+    path = str(tmp_path / 'leaf1' / 'show_version')
+    with CaptureFile(path, compress=True) as sink:
+        sink.write_line('Arista DCS-7050SX3-48YC8')
+        sink.write_line('')
+    data = b'Arista DCS-7050SX3-48YC8\n\n'
+    assert sink.summary() == {'file': path + '.gz', 'lines': 2, 'bytes': len(data),
+                              'sha1': hashlib.sha1(data).hexdigest()}
+    with gzip.open(path + '.gz', 'rb') as f:
+        assert f.read() == data
+
+
+class FakeChannel:
+
+    def __init__(self, reads):
+        self.reads = list(reads)
+
+    def write(self, data):
+        pass
+
+    def send_return(self):
+        pass
+
+    def read(self):
+        return self.reads.pop(0) if self.reads else b''
+
+
+class FakeConn:
+    comms_prompt_pattern = PROMPT
+
+    def __init__(self, reads):
+        self.channel = FakeChannel(reads)
+
+
+def test_empty_reads_wait_for_the_poll_interval(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(capture.time, 'sleep', sleeps.append)
+    sink = capture_scrapli(FakeConn([b'show version\n', b'', b'', b'EOS\nleaf1#']), 'show version', ListSink())
+    assert sink.lines == ['EOS']
+    assert sleeps == [capture.POLL_INTERVAL] * 2
+
+    with pytest.raises(CaptureError, match='no output'):
+        capture_scrapli(FakeConn([]), 'show version', ListSink(), timeout=0)
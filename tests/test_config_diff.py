@@ -0,0 +1,56 @@
+from config_diff import config_hash, diff_device, run_diff
+
+PRE = '''hostname leaf1
+!
+ip access-list EDGE-IN
+   10 deny ip 10.0.0.0/8 any
+   20 permit ip any any
+!
+route-map RM-OUT permit 10
+   match ip address prefix-list LOOPBACKS
+!
+route-map RM-OUT deny 20
+!
+ip routing
+'''.splitlines()
+
+
+def pair(hostname, post):
+    return hostname, PRE, post.splitlines()
+
+
+def test_reordered_acl_entries():
+    post = '\n'.join(PRE).replace('   10 deny ip 10.0.0.0/8 any\n   20 permit ip any any',
+                                  '   20 permit ip any any\n   10 deny ip 10.0.0.0/8 any')
+    summary, diff = diff_device(pair('leaf1', post))
+    assert summary['status'] == 'reordered'
+    assert (summary['added'], summary['removed']) == (0, 0)
+    assert summary['reordered'] == ['ip access-list EDGE-IN']
+    assert diff.splitlines()[:2] == ['~ ip access-list EDGE-IN', '~    ip access-list EDGE-IN']
+
+
+def test_reordered_route_map_blocks():
+    post = '\n'.join(PRE).replace('route-map RM-OUT permit 10\n   match ip address prefix-list LOOPBACKS\n!\n'
+                                  'route-map RM-OUT deny 20\n',
+                                  'route-map RM-OUT deny 20\n!\nroute-map RM-OUT permit 10\n'
+                                  '   match ip address prefix-list LOOPBACKS\n')
+    summary, _ = diff_device(pair('leaf1', post))
+    assert summary['status'] == 'reordered'
+    assert summary['reordered'] == ['route-map RM-OUT']
+
+
+def test_changed_and_unchanged_devices():
+    changed = '\n'.join(PRE) + '\nip name-server 10.0.0.53'
+    # comments and blank lines are not a change
+    same = '\n'.join(PRE).replace('!', '! edited')
+    moved = '\n'.join(PRE).replace('ip routing', '').replace('hostname leaf1', 'hostname leaf1\nip routing')
+    assert config_hash(same.splitlines()) == config_hash(PRE)
+
+    unchanged, results = run_diff([pair('leaf1', same), pair('leaf2', changed), pair('leaf3', moved)], workers=1)
+    assert unchanged == ['leaf1']
+    summaries = {summary['hostname']: summary for summary, _ in results}
+    assert summaries['leaf2']['status'] == 'changed'
+    assert summaries['leaf2']['added'] == 1
+    # an order change outside the ordered sections is still reported
+    assert summaries['leaf3']['status'] == 'reordered'
+    assert summaries['leaf3']['reordered'] == []
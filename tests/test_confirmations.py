@@ -0,0 +1,35 @@
+import asyncio
+
+import confirmations
+
+
+class FakeParsePool:
+    # fails on one device the way a broken template or output would
+
+    def __init__(self, bad_ip):
+        self.bad_ip = bad_ip
+
+    async def parse(self, loop, device_os, config_state):
+        for out in config_state:
+            for hostname, state_output in out.items():
+                if hostname == self.bad_ip:
+                    raise ValueError('State Error raised. Rule Line: 12')
+                for output in state_output.values():
+                    output['parsed'] = [{'ok': True}]
+        return config_state
+
+
+def test_parse_error_keeps_the_raw_output(monkeypatch):
+    async def collect_device(device_os, ip, commands, *args, **kwargs):
+        return ip, {'show_version': {'output': 'EOS {}'.format(ip)}}
+
+    monkeypatch.setattr(confirmations, 'collect_device', collect_device)
+    targets = [('arista_eos', ip, ['show version']) for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3')]
+    devices = {}
+
+    asyncio.run(confirmations.collect_all(targets, [], [], parse_pool=FakeParsePool('10.0.0.2'),
+                                          on_device=devices.__setitem__))
+
+    assert sorted(devices) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert devices['10.0.0.2'] == [{'10.0.0.2': {'show_version': {'output': 'EOS 10.0.0.2'}}}]
+    assert devices['10.0.0.3'][0]['10.0.0.3']['show_version']['parsed'] == [{'ok': True}]
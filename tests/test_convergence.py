@@ -0,0 +1,61 @@
+import pytest
+
+import convergence
+from convergence import route_counts, track
+
+
+def summary(routes, bgp=None):
+    # the json of ROUTE_COMMAND for one VRF
+    vrf = {'totalRoutes': routes, 'connected': 40}
+    if bgp is not None:
+        vrf['bgpCounts'] = {'bgpTotal': bgp, 'bgpExternal': bgp, 'bgpInternal': 0}
+    return {'vrfs': {'default': vrf}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {'now': 0.0}
+    monkeypatch.setattr(convergence.time, 'monotonic', lambda: clock['now'])
+    monkeypatch.setattr(convergence.time, 'sleep', lambda seconds: clock.update(now=clock['now'] + seconds))
+    return clock
+
+
+def sampler(outputs):
+    # the last output repeats once the list is used up
+    outputs = list(outputs)
+    return lambda: outputs.pop(0) if len(outputs) > 1 else outputs[0]
+
+
+def test_route_counts():
+    assert route_counts(summary(1200, bgp=1158)) == {('default', 'total'): 1200, ('default', 'connected'): 40,
+                                                    ('default', 'bgp'): 1158}
+    assert route_counts({}) == {}
+
+
+def test_growing_table_converges(clock):
+    outputs = [summary(routes) for routes in (300, 600, 900, 1150, 1200)]
+    result = track(sampler(outputs[1:]), baseline_output=summary(1200), first_output=outputs[0],
+                   log=lambda msg: None)
+    assert result.converged
+    assert result.routes == 1200
+    # settled on the fifth sample, then confirmed by two more
+    assert result.samples == 7
+    assert 0 < result.seconds < clock['now']
+
+
+def test_plateau_short_of_the_baseline_stalls(clock):
+    result = track(sampler([summary(900)]), baseline_output=summary(1200), first_output=summary(600),
+                   stall_seconds=90, log=lambda msg: None)
+    assert not result.converged
+    assert result.detail.startswith('stalled at 900 routes')
+    assert 'vrf default 900 of 1200' in result.detail
+    assert clock['now'] < convergence.CONVERGENCE_TIMEOUT
+
+
+def test_no_baseline_converges_once_stable(clock):
+    result = track(sampler([summary(1200)]), first_output=summary(1200), log=lambda msg: None)
+    assert result.converged
+    assert result.seconds == 0
+    assert result.baseline_routes is None
+    assert result.samples == convergence.STABLE_SAMPLES
+    assert clock['now'] == (convergence.STABLE_SAMPLES - 1) * convergence.MIN_INTERVAL
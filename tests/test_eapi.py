@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from arista_eos_upgrade import AristaState
+from eapi import EapiError, EapiSession
+from simulator import EOS_JSON, EapiServer, SimulatedDevice
+
+
+@pytest.fixture
+def eapi_device(free_port):
+    # the simulator's eAPI server on its own loop, EapiSession is blocking
+    device = SimulatedDevice('SIM-0')
+    port = free_port
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(
+        asyncio.start_server(EapiServer(device).handle, '127.0.0.1', port), loop).result(5)
+    yield device, port
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def session(port):
+    return EapiSession('127.0.0.1', 'admin', 'admin', port=port, protocol='http', timeout=5)
+
+
+def test_batched_commands(eapi_device):
+    device, port = eapi_device
+    eapi = session(port)
+    outputs = eapi.run_commands(['sh version', 'sh ip route vrf all summary'])
+    assert outputs == [EOS_JSON['sh version'], EOS_JSON['sh ip route vrf all summary']]
+    # one connection, reused for the next request
+    conn = eapi.conn
+    assert eapi.run_command('sh version') == EOS_JSON['sh version']
+    assert eapi.conn is conn
+    eapi.close()
+
+
+def test_snapshot_in_one_request(eapi_device):
+    device, port = eapi_device
+    eapi = session(port)
+    state = AristaState('/images/EOS-4.28.3M.swi')
+    state.populate(eapi.run_command, run_commands=eapi.run_commands)
+    assert device.commands_served == len(state.debug_commands)
+    assert state.running_version == '4.28.3M'
+    assert state.total_ip_routes == 1200
+    eapi.close()
+
+
+def test_error_reply(eapi_device):
+    device, port = eapi_device
+    device.failure_rate = 1.0
+    with pytest.raises(EapiError):
+        session(port).run_command('sh version')
+
+
+def test_reconnects_after_the_connection_dropped(eapi_device):
+    device, port = eapi_device
+    eapi = session(port)
+    eapi.run_command('sh version')
+    # the server drops keep-alive connections of a device that is down
+    device.down_until = float('inf')
+    with pytest.raises(ConnectionError):
+        eapi.run_command('sh version')
+    device.down_until = 0
+    assert eapi.run_command('sh version') == EOS_JSON['sh version']
+    eapi.close()
@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import os
+import threading
+
+import pytest
+
+from image_cache import ImageCache, ImageCacheError, local_md5
+
+
+class FakeBlob:
+    # the parts of google.cloud.storage.Blob the cache uses
+
+    def __init__(self, name, data, generation=1, md5=None, fail_after=None):
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.generation = generation
+        digest = bytes.fromhex(md5) if md5 else hashlib.md5(data).digest()
+        self.md5_hash = base64.b64encode(digest).decode()
+        self.fail_after = fail_after
+        self.ranges = []
+
+    def reload(self):
+        pass
+
+    def download_as_bytes(self, start, end):
+        if self.fail_after is not None and len(self.ranges) >= self.fail_after:
+            raise ConnectionError('connection reset')
+        self.ranges.append((start, end))
+        return self.data[start:end + 1]
+
+
+def image(size, seed=b'eos'):
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def test_resume_after_interruption(tmp_path):
+    data = image(1000)
+    cache = ImageCache(str(tmp_path), chunk_size=100)
+
+    with pytest.raises(ConnectionError):
+        cache.fetch(FakeBlob('EOS.swi', data, fail_after=3))
+    blob = FakeBlob('EOS.swi', data)
+    path = cache.fetch(blob)
+
+    # only the missing ranges are downloaded the second time
+    assert blob.ranges[0] == (300, 399)
+    assert len(blob.ranges) == 7
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert local_md5(path) == hashlib.md5(data).hexdigest()
+    assert not os.path.exists(path + '.part')
+
+
+def test_checksum_mismatch(tmp_path):
+    cache = ImageCache(str(tmp_path), chunk_size=100)
+    blob = FakeBlob('EOS.swi', image(500), md5='00' * 16)
+
+    with pytest.raises(ImageCacheError, match='checksum mismatch'):
+        cache.fetch(blob)
+    assert not os.path.exists(cache.path(blob))
+    assert not os.path.exists(cache.path(blob) + '.part')
+
+
+def test_eviction_skips_images_in_use(tmp_path):
+    # two caches on one directory stand in for two jobs on the jump host
+    rollout = ImageCache(str(tmp_path), max_bytes=1500, chunk_size=1000)
+    other = ImageCache(str(tmp_path), max_bytes=1500, chunk_size=1000)
+    old = FakeBlob('EOS-old.swi', image(1000, b'old'), generation=1)
+    new = FakeBlob('EOS-new.swi', image(1000, b'new'), generation=2)
+
+    old_path = rollout.fetch(old)
+    new_path = other.fetch(new)
+    assert os.path.exists(old_path) and os.path.exists(new_path)
+
+    rollout.release()
+    other.evict(keep=other.key(new))
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
+    # lock files stay, so every process locks the same inode
+    assert os.path.exists(os.path.join(str(tmp_path), '{}.lock'.format(rollout.key(old))))
+
+
+def test_least_recently_used_goes_first(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=2500, chunk_size=1000)
+    blobs = [FakeBlob('EOS-{}.swi'.format(i), image(1000, str(i).encode()), generation=i) for i in range(3)]
+    paths = []
+    for i, blob in enumerate(blobs[:2]):
+        paths.append(cache.fetch(blob))
+        os.utime(paths[-1], (1000 + i, 1000 + i))
+    cache.release()
+
+    paths.append(cache.fetch(blobs[2]))
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(paths[1]) and os.path.exists(paths[2])
+
+
+def fetch_in_thread(cache, blob):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('path', cache.fetch(blob)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_fetching_an_image_in_use_does_not_block(tmp_path):
+    rollout = ImageCache(str(tmp_path), chunk_size=100)
+    other = ImageCache(str(tmp_path), chunk_size=100)
+    path = rollout.fetch(FakeBlob('EOS.swi', image(500)))
+
+    # the same instance again, and another job, while the rollout holds it
+    for cache in (rollout, other):
+        thread, result = fetch_in_thread(cache, FakeBlob('EOS.swi', image(500)))
+        thread.join(5)
+        assert not thread.is_alive()
+        assert result['path'] == path
+
+
+def test_concurrent_fetches_download_once(tmp_path):
+    blobs = [FakeBlob('EOS.swi', image(1000)) for _ in range(2)]
+    threads = [fetch_in_thread(ImageCache(str(tmp_path), chunk_size=100), blob) for blob in blobs]
+    for thread, _ in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert threads[0][1]['path'] == threads[1][1]['path']
+    assert sorted(len(blob.ranges) for blob in blobs) == [0, 10]
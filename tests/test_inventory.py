@@ -0,0 +1,67 @@
+import pytest
+
+from inventory import Device, Selector, load_devices, parse_shard, shard_of
+
+YAML = '''common: &commands
+  - show version
+devices:
+  arista_eos:
+    - ip_address: [10.0.0.1, 10.0.0.2]
+      site: dc1
+      tags: [leaf, pod1]
+      commands: *commands
+    - ip_address:
+        - 10.0.1.1
+      site: dc2
+  cisco_ios: ~
+'''
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    for text in ('0/4', '5/4', '1/0', '1-4'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shards_split_the_inventory():
+    hosts = ['10.{}.{}.{}'.format(a, b, c) for a in range(2) for b in range(10) for c in range(50)]
+    shards = [[host for host in hosts if Selector(shard=(index, 4)).wants_host(host)] for index in range(1, 5)]
+    # every host in exactly one shard, and the shards about the same size
+    assert sorted(host for shard in shards for host in shard) == sorted(hosts)
+    assert all(200 < len(shard) < 300 for shard in shards)
+    # sha1, not hash(), so every jump host agrees
+    assert shard_of('10.0.0.1', 4) == int('ed1665c1', 16) % 4 + 1
+
+
+def test_selector():
+    device = Device('10.0.0.1', 'Arista_EOS', 'dc1', ('leaf', 'pod1'))
+    assert Selector(os=['arista_eos'], sites=['dc1'], tags=['leaf']).wants(device)
+    assert not Selector(tags=['leaf', 'pod2']).wants(device)
+    assert not Selector(sites=['dc2']).wants(device)
+    assert not Selector(os=['cisco_ios']).wants(device)
+
+
+def test_yaml_inventory(tmp_path):
+    (tmp_path / 'fleet.yml').write_text(YAML)
+    (tmp_path / 'extra.jsonl').write_text('{"host": "10.0.0.2", "os": "arista_eos"}\n'
+                                          '{"host": "10.0.2.1", "os": "arista_eos", "tags": "spine"}\n')
+    devices = list(load_devices([str(tmp_path / 'fleet.yml'), str(tmp_path / '*.jsonl')]))
+    # 10.0.0.2 is listed twice, the first one wins
+    assert [device.host for device in devices] == ['10.0.0.1', '10.0.0.2', '10.0.1.1', '10.0.2.1']
+    assert devices[0].commands == ['show version']
+    assert devices[0].tags == frozenset(['leaf', 'pod1'])
+    assert devices[2].site == 'dc2'
+    assert [device.host for device in load_devices([str(tmp_path / 'fleet.yml')], tags=['leaf'])] == \
+        ['10.0.0.1', '10.0.0.2']
+
+
+def test_playbook_inventory(tmp_path):
+    path = tmp_path / 'upgrade.yml'
+    path.write_text('ip_address: [10.0.0.1, 10.0.0.2]\nsites:\n  dc1: [10.0.0.2]\n')
+    devices = list(load_devices([str(path)], default_os='arista_eos'))
+    assert [(device.host, device.os, device.site) for device in devices] == \
+        [('10.0.0.1', 'arista_eos', None), ('10.0.0.2', 'arista_eos', 'dc1')]
+    path.write_text('hosts: []\n')
+    with pytest.raises(ValueError, match='neither'):
+        list(load_devices([str(path)]))
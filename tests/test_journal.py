@@ -0,0 +1,120 @@
+import copy
+import os
+
+import pytest
+
+import upgrade_engine
+from arista_eos_upgrade import AristaState
+from journal import Journal
+from simulator import EOS_JSON
+from upgrade_engine import FAILED, UPGRADED, DeviceUpgrade
+
+IMAGE = '/images/EOS-4.30.1F.swi'
+
+
+class FakeHandler:
+    # records the AristaOsUpgrade calls a DeviceUpgrade makes
+    calls = []
+    version = '4.28.3M'
+
+    def __init__(self, args):
+        self.calls.append('connect')
+
+    def run_command_json(self, cmd):
+        output = copy.deepcopy(EOS_JSON.get(cmd, {}))
+        if cmd == 'sh version':
+            output['version'] = self.version
+        return output
+
+    def run_commands_json(self, cmds):
+        return [self.run_command_json(cmd) for cmd in cmds]
+
+    def image_is_staged(self):
+        return True
+
+    def __getattr__(self, name):
+        # copy_running_config, file_transfer, modify_boot_config, ...
+        def call():
+            self.calls.append(name)
+            return 'backup.txt' if name == 'copy_running_config' else None
+        return call
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    FakeHandler.calls = []
+    FakeHandler.version = '4.28.3M'
+    monkeypatch.setattr(upgrade_engine, 'AristaOsUpgrade', FakeHandler)
+    monkeypatch.setattr(upgrade_engine, 'validate_upgrade', lambda *args: True)
+    monkeypatch.setattr(upgrade_engine, 'wait_for_ssh', lambda *args, **kwargs: 0)
+    return FakeHandler
+
+
+def pre_state():
+    state = AristaState(IMAGE)
+    state.populate(FakeHandler.__new__(FakeHandler).run_command_json)
+    return state.outputs()
+
+
+def test_entry_round_trip(tmp_path):
+    journal = Journal(str(tmp_path), image='EOS-4.30.1F.swi')
+    entry = journal.entry('10.0.0.1')
+    entry.start('backup')
+    entry.commit('backup', backup_file='backup.txt')
+
+    entry = Journal(str(tmp_path), image='EOS-4.30.1F.swi').entry('10.0.0.1')
+    assert entry.completed == ['backup']
+    assert entry.in_progress is None
+    assert entry.get('backup_file') == 'backup.txt'
+    # a journal of another image is a fresh start
+    assert Journal(str(tmp_path), image='EOS-4.31.0F.swi').entry('10.0.0.1').completed == []
+
+
+def test_resume_restores_backup_and_snapshot(tmp_path, handler, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    open('backup.txt', 'w').close()
+    journal = Journal(str(tmp_path / 'journal'), image='EOS-4.30.1F.swi')
+    entry = journal.entry('10.0.0.1')
+    for phase in ('connect', 'backup', 'snapshot'):
+        entry.commit(phase, backup_file='backup.txt', pre_state=pre_state())
+
+    device = DeviceUpgrade({'ip_address': '10.0.0.1'}, IMAGE, journal.entry('10.0.0.1')).run()
+
+    assert device.status == UPGRADED
+    assert 'copy_running_config' not in handler.calls
+    assert handler.calls[:3] == ['connect', 'file_transfer', 'modify_boot_config']
+    assert device.pre_upgrade_state.running_version == '4.28.3M'
+    assert device.backup_file == 'backup.txt'
+    assert journal.entry('10.0.0.1').status == UPGRADED
+
+
+def test_interrupted_reload_is_not_repeated(tmp_path, handler):
+    journal = Journal(str(tmp_path), image='EOS-4.30.1F.swi')
+    entry = journal.entry('10.0.0.1')
+    for phase in ('connect', 'snapshot', 'transfer', 'boot_config'):
+        entry.commit(phase, pre_state=pre_state())
+    entry.start('reload')
+    # the device came back on the new image while nobody was watching
+    handler.version = '4.30.1F'
+
+    device = DeviceUpgrade({'ip_address': '10.0.0.1'}, IMAGE, journal.entry('10.0.0.1')).run()
+
+    assert device.status == UPGRADED
+    assert 'save_and_reload' not in handler.calls
+
+
+def test_journal_write_error_fails_only_the_device(tmp_path, handler):
+    journal = Journal(str(tmp_path), image='EOS-4.30.1F.swi')
+    entry = journal.entry('10.0.0.1')
+
+    def write(ip_address, data):
+        if data['completed']:
+            raise OSError(28, 'No space left on device')
+
+    journal.write = write
+    device = DeviceUpgrade({'ip_address': '10.0.0.1'}, IMAGE, entry).run()
+
+    assert device.status == FAILED
+    assert device.phase == 'connect'
+    assert 'No space left' in device.error
+    assert not os.path.exists(journal.path('10.0.0.1'))
@@ -0,0 +1,67 @@
+import copy
+
+import pytest
+
+import preflight
+from preflight import BLOCKED, CURRENT, UPGRADABLE, check_device, report
+from simulator import EOS_JSON
+
+IMAGE = 'EOS-4.30.1F.swi'
+IMAGE_BYTES = 1009451008
+LISTING = '''Directory of flash:/
+
+       -rwx   948477952            Jan 12 09:30  EOS-4.28.3M.swi
+       -rwx  {}            Mar  3 10:12  {}
+       drwx        4096            Mar  3 10:14  persist
+
+3957010432 bytes total (2706481152 bytes free)
+'''
+
+
+@pytest.fixture
+def device(monkeypatch):
+    # the outputs preflight_eapi returns, free flash and the listing per test
+    outputs = {'free': EOS_JSON['sh file systems']['fileSystems'][0]['free'], 'listing': ''}
+
+    def fetch(ip_address, username, password, timeout):
+        file_systems = copy.deepcopy(EOS_JSON['sh file systems'])
+        file_systems['fileSystems'][0]['free'] = outputs['free']
+        return copy.deepcopy(EOS_JSON['sh version']), file_systems, outputs['listing']
+
+    monkeypatch.setattr(preflight, 'preflight_eapi', fetch)
+    return outputs
+
+
+def check():
+    return check_device('10.0.0.1', 'admin', 'admin', IMAGE, IMAGE_BYTES)
+
+
+def test_enough_space(device):
+    result = check()
+    assert result.status == UPGRADABLE
+    assert not result.staged
+    assert result.free_flash == 2706481152
+
+
+def test_not_enough_space(device):
+    device['free'] = 500000000
+    result = check()
+    assert result.status == BLOCKED
+    assert result.reason == 'free flash 500000 KB, image 1009451 KB'
+
+
+def test_staged_image_skips_the_space_check(device, capsys):
+    device['free'] = 500000000
+    device['listing'] = LISTING.format(IMAGE_BYTES, IMAGE)
+    staged = check()
+    assert staged.status == UPGRADABLE
+    assert staged.staged
+
+    # a partial copy from an interrupted transfer is not staged
+    device['listing'] = LISTING.format(IMAGE_BYTES // 2, IMAGE)
+    assert check().status == BLOCKED
+
+    device['free'] = 2706481152
+    device['listing'] = ''
+    report([staged, check(), preflight.PreflightResult('10.0.0.3', CURRENT)], IMAGE_BYTES, 600, 1)
+    assert 'image transfer: 1.01 GB to 1 devices, 1 already staged' in capsys.readouterr().out
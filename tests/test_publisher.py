@@ -0,0 +1,54 @@
+import os
+import subprocess
+
+import pytest
+
+from publisher import Publisher, remote_host
+
+STATE = {'leaf1_version_summary': {'command': 'sh version', 'output': {'version': '4.28.3M'}}}
+
+
+def test_unchanged_devices_are_not_rewritten(tmp_path):
+    publisher = Publisher(str(tmp_path / 'devices'))
+    assert publisher.write_device('leaf1', STATE)
+    path = publisher.path('leaf1')
+    os.utime(path, (1000, 1000))
+
+    again = Publisher(str(tmp_path / 'devices'))
+    assert not again.write_device('leaf1', STATE)
+    assert (again.changed, again.unchanged) == ([], 1)
+    assert os.path.getmtime(path) == 1000
+
+    # same size, other content: only the hash tells them apart
+    same_size = {'leaf1_version_summary': {'command': 'sh version', 'output': {'version': '4.30.1F'}}}
+    assert again.write_device('leaf1', same_size)
+    assert again.changed == [path]
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_commit_stages_only_changed_files(tmp_path):
+    git = pytest.importorskip('git')
+    repo = git.Repo.init(str(tmp_path))
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'test')
+        config.set_value('user', 'email', 'test@example.com')
+    publisher = Publisher(str(tmp_path / 'devices'), str(tmp_path))
+    publisher.add([{'leaf1': STATE, 'leaf2': STATE}])
+    _, commit = publisher.commit('pre changes')
+    assert sorted(commit.stats.files) == ['devices/leaf1.json', 'devices/leaf2.json']
+
+    publisher = Publisher(str(tmp_path / 'devices'), str(tmp_path))
+    publisher.add([{'leaf1': STATE}])
+    assert publisher.commit('post changes') == (repo, None)
+    assert subprocess.check_output(['git', 'rev-list', '--count', 'HEAD'], cwd=str(tmp_path)).strip() == b'1'
+
+
+class FakeRepo:
+    def __init__(self, url):
+        self.remotes = type('Remotes', (), {'origin': type('Origin', (), {'url': url})})
+
+
+def test_remote_host():
+    assert remote_host(FakeRepo('https://git.example.com/network/confirmations.git')) == 'git.example.com'
+    assert remote_host(FakeRepo('git@git.example.com:network/confirmations.git')) == 'git.example.com'
+    assert remote_host(object(), default='fallback') == 'fallback'
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from reachability import ReachabilityMonitor
+
+
+async def banner(reader, writer):
+    writer.write(b'SSH-2.0-OpenSSH_8.0\r\n')
+    await writer.drain()
+    writer.close()
+
+
+async def silent(reader, writer):
+    writer.close()
+
+
+def monitor(port):
+    return ReachabilityMonitor(port=port, connect_timeout=0.5, initial_delay=0.05,
+                               max_delay=0.2, up_max_delay=0.1, jitter=0)
+
+
+def test_up_needs_an_ssh_banner(free_port):
+    port = free_port
+
+    async def run():
+        server = await asyncio.start_server(silent, '127.0.0.1', port)
+        try:
+            assert await monitor(port).wait_for('127.0.0.1', timeout=0.3) is None
+        finally:
+            server.close()
+            await server.wait_closed()
+        server = await asyncio.start_server(banner, '127.0.0.1', port)
+        try:
+            assert await monitor(port).wait_for('127.0.0.1', timeout=1) is not None
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_reboot_closes_and_reopens_the_listener(free_port):
+    port = free_port
+
+    async def run():
+        server = await asyncio.start_server(banner, '127.0.0.1', port)
+
+        async def reboot():
+            nonlocal server
+            await asyncio.sleep(0.3)
+            server.close()
+            await server.wait_closed()
+            await asyncio.sleep(0.7)
+            server = await asyncio.start_server(banner, '127.0.0.1', port)
+            return time.monotonic()
+
+        start = time.monotonic()
+        rebooting = asyncio.ensure_future(reboot())
+        went_down, elapsed = await monitor(port).wait_for_reboot('127.0.0.1', down_timeout=2, up_timeout=3)
+        back = await rebooting
+        server.close()
+        await server.wait_closed()
+        return start, back, went_down, elapsed
+
+    start, back, went_down, elapsed = asyncio.run(run())
+    assert went_down
+    # measured from the call, not from when the host went down, and
+    # reported shortly after the listener is back
+    assert elapsed >= back - start
+    assert elapsed - (back - start) < 0.5
+
+
+def test_reboot_that_never_goes_down(free_port):
+    port = free_port
+
+    async def run():
+        server = await asyncio.start_server(banner, '127.0.0.1', port)
+        try:
+            return await monitor(port).wait_for_reboot('127.0.0.1', down_timeout=0.3, up_timeout=1)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(run()) == (False, None)
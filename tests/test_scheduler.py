@@ -0,0 +1,54 @@
+from scheduler import DeviceInfo, conflict_graph, parse_topology, plan_waves, redundancy_groups
+
+
+def fabric():
+    # two MLAG leaf pairs under two spines, the spines are in the fleet too
+    infos = [DeviceInfo('10.0.0.{}'.format(i), 'leaf{}'.format(i), mlag_key=('pod', 'pair{}'.format((i + 1) // 2)),
+                        neighbors={'spine1', 'spine2'}) for i in range(1, 5)]
+    infos += [DeviceInfo('10.0.1.{}'.format(i), 'spine{}'.format(i), neighbors={'leaf1', 'leaf2', 'leaf3', 'leaf4'})
+              for i in (1, 2)]
+    return infos
+
+
+def plan(infos, **kwargs):
+    device_list = [info.ip_address for info in infos]
+    return plan_waves(device_list, conflict_graph(infos), redundancy_groups(infos), **kwargs)
+
+
+def test_parse_topology():
+    info = parse_topology('10.0.0.1', [{'hostname': 'leaf1'},
+                                       {'state': 'active', 'domainId': 'pod', 'systemId': '02:1c:73:00:00:01'},
+                                       {'lldpNeighbors': [{'neighborDevice': 'spine1.example.net'}]}])
+    assert (info.hostname, info.mlag_key, info.neighbors) == ('leaf1', ('pod', '02:1c:73:00:00:01'), {'spine1'})
+    assert parse_topology('10.0.0.2', [{}, {'state': 'disabled', 'domainId': 'pod'}, {}]).mlag_key is None
+
+
+def test_peers_and_redundant_spines_never_share_a_wave():
+    infos = fabric()
+    waves = plan(infos, canary=0)
+    assert sorted(ip for wave in waves for ip in wave) == sorted(info.ip_address for info in infos)
+    for wave in waves:
+        assert not {'10.0.0.1', '10.0.0.2'} <= set(wave)
+        assert not {'10.0.0.3', '10.0.0.4'} <= set(wave)
+        assert not {'10.0.1.1', '10.0.1.2'} <= set(wave)
+
+
+def test_site_cap():
+    infos = [DeviceInfo('10.0.0.{}'.format(i)) for i in range(1, 7)]
+    sites = {info.ip_address: 'dc1' if i < 4 else 'dc2' for i, info in enumerate(infos)}
+    waves = plan(infos, sites=sites, site_cap=2, canary=0)
+    assert [len(wave) for wave in waves] == [4, 2]
+    for wave in waves:
+        for site in ('dc1', 'dc2'):
+            assert sum(1 for ip in wave if sites[ip] == site) <= 2
+
+
+def test_waves_grow_from_the_canary():
+    infos = [DeviceInfo('10.0.0.{}'.format(i)) for i in range(1, 11)]
+    assert [len(wave) for wave in plan(infos, canary=1, wave_growth=2)] == [1, 2, 4, 3]
+    # an explicit max_wave still caps the grown waves
+    assert [len(wave) for wave in plan(infos, canary=1, wave_growth=2, max_wave=3)] == [1, 2, 3, 3, 1]
+    # isolated devices come last, one per wave
+    waves = plan(infos, canary=2, wave_growth=3, isolated={'10.0.0.1'})
+    assert waves == [['10.0.0.2', '10.0.0.3'], ['10.0.0.{}'.format(i) for i in range(4, 10)], ['10.0.0.10'],
+                     ['10.0.0.1']]
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from snapshot_store import SnapshotStore, utc_ts
+
+EASTERN = timezone(timedelta(hours=-4))
+
+
+def device(version, routes):
+    return {'leaf1_version_summary': {'command': 'sh version', 'output': {'version': version}},
+            'leaf1_route_summary': {'command': 'sh ip route vrf all summary', 'output': {'totalRoutes': routes},
+                                    'parsed': [{'routes': routes}]}}
+
+
+@pytest.fixture
+def store():
+    store = SnapshotStore(':memory:')
+    yield store
+    store.close()
+
+
+def test_timestamps_are_stored_in_utc():
+    assert utc_ts(datetime(2026, 3, 3, 10, 12, tzinfo=EASTERN)) == '2026-03-03T14:12:00+00:00'
+    assert utc_ts('2026-03-03T10:12:00-04:00') == '2026-03-03T14:12:00+00:00'
+    with pytest.raises(ValueError, match='no timezone'):
+        utc_ts(datetime(2026, 3, 3, 10, 12))
+
+
+def test_round_trip(store):
+    assert store.write_device('RPD-1', 'pre', datetime(2026, 3, 3, 10, 12, tzinfo=EASTERN), 'leaf1',
+                              device('4.28.3M', 1200), ip='10.0.0.1') == 3
+    # a later capture written from a host in another timezone
+    store.write_device('RPD-1', 'pre', datetime(2026, 3, 3, 15, 0, tzinfo=timezone.utc), 'leaf1',
+                       device('4.28.3M', 1201))
+
+    assert store.latest_ts('RPD-1', 'leaf1', 'pre') == '2026-03-03T15:00:00+00:00'
+    assert store.get_device('RPD-1', 'leaf1', 'pre') == {
+        'version_summary': {'command': 'sh version', 'output': {'version': '4.28.3M'}},
+        'route_summary': {'command': 'sh ip route vrf all summary', 'output': {'totalRoutes': 1201}},
+        'route_summary:parsed': {'command': 'sh ip route vrf all summary', 'output': [{'routes': 1201}]}}
+    # the same moment in any timezone finds the earlier capture
+    earlier = store.get_device('RPD-1', 'leaf1', 'pre', ts='2026-03-03T10:12:00-04:00')
+    assert earlier['route_summary']['output'] == {'totalRoutes': 1200}
+
+
+def test_iter_compare_uses_the_latest_capture(store):
+    store.write_device('RPD-1', 'pre', datetime(2026, 3, 3, 10, 0, tzinfo=EASTERN), 'leaf1', device('4.28.3M', 1200))
+    store.write_device('RPD-1', 'post', datetime(2026, 3, 3, 11, 0, tzinfo=EASTERN), 'leaf1', device('4.30.1F', 900))
+    store.write_device('RPD-1', 'post', datetime(2026, 3, 3, 16, 0, tzinfo=timezone.utc), 'leaf1',
+                       device('4.30.1F', 1200))
+    store.write_device('RPD-2', 'post', datetime(2026, 3, 3, 17, 0, tzinfo=timezone.utc), 'leaf1',
+                       device('4.31.0F', 1200))
+
+    compared = {key: (pre, post) for _, key, pre, post in store.iter_compare('RPD-1')}
+    assert compared['version_summary'] == ({'version': '4.28.3M'}, {'version': '4.30.1F'})
+    assert compared['route_summary'] == ({'totalRoutes': 1200}, {'totalRoutes': 1200})
+    assert sorted(compared) == ['route_summary', 'route_summary:parsed', 'version_summary']
+
+
+def test_import_text(store, tmp_path):
+    pytest.importorskip('pytz')
+    path = tmp_path / 'confirmations.txt'
+    path.write_text('pre changes at 03-03-2026,10:12[{"leaf1": {"leaf1_version_summary": '
+                    '{"command": "sh version", "output": {"version": "4.28.3M"}}}}]')
+    assert store.import_text(str(path), 'RPD-1') == 1
+    assert store.latest_ts('RPD-1', 'leaf1', 'pre').endswith('+00:00')
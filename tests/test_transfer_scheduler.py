@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+import transfer_scheduler
+from transfer_scheduler import TokenBucket, TransferProgress, TransferScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {'now': 100.0, 'sleeps': []}
+
+    def sleep(seconds):
+        clock['sleeps'].append(seconds)
+        clock['now'] += seconds
+
+    monkeypatch.setattr(transfer_scheduler.time, 'monotonic', lambda: clock['now'])
+    monkeypatch.setattr(transfer_scheduler.time, 'sleep', sleep)
+    return clock
+
+
+def test_token_bucket_refill(clock):
+    bucket = TokenBucket(1000, burst=2000)
+    # the full burst right away, then at the rate
+    bucket.consume(2000)
+    assert clock['sleeps'] == []
+    bucket.consume(500)
+    assert clock['sleeps'] == [0.5]
+    clock['now'] += 10
+    # refilled up to the burst, not beyond it
+    bucket.consume(2000)
+    assert bucket.tokens == 0
+    assert clock['sleeps'] == [0.5]
+
+
+def test_chunk_bigger_than_the_burst(clock):
+    bucket = TokenBucket(1000, burst=1000)
+    bucket.consume(1000)
+    bucket.consume(3000)
+    # waits for a full bucket, then runs into debt the next chunk pays off
+    assert clock['sleeps'] == [1.0]
+    assert bucket.tokens == -2000
+    bucket.consume(1000)
+    assert clock['sleeps'] == [1.0, 3.0]
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(0)
+    bucket.consume(10 ** 9)
+    assert clock['sleeps'] == []
+
+
+class FakeFile(io.BytesIO):
+    def set_pipelined(self, pipelined):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSftp:
+    # the remote file is kept across attempts, like flash: on the device
+    def __init__(self, data=b''):
+        self.file = FakeFile(data)
+
+    def stat(self, path):
+        if not self.file.getvalue():
+            raise IOError(2, 'No such file')
+        return type('Stat', (), {'st_size': len(self.file.getvalue())})
+
+    def open(self, path, mode):
+        if mode == 'wb':
+            self.file = FakeFile()
+        self.file.seek(0, io.SEEK_END)
+        return self.file
+
+
+def test_send_resumes_where_the_last_attempt_stopped(tmp_path):
+    image = tmp_path / 'EOS.swi'
+    image.write_bytes(b'eos' * 1000)
+    scheduler = TransferScheduler(chunk_size=100, progress=TransferProgress(interval=0))
+
+    sftp = FakeSftp(b'eos' * 400)
+    assert scheduler.send(sftp, str(image), 'flash:/EOS.swi', '10.0.0.1') == 1800
+    assert sftp.file.getvalue() == b'eos' * 1000
+    # a bigger remote file is not the same image, start over
+    sftp = FakeSftp(b'x' * 5000)
+    assert scheduler.send(sftp, str(image), 'flash:/EOS.swi', '10.0.0.1') == 3000
+    assert sftp.file.getvalue() == b'eos' * 1000
@@ -0,0 +1,83 @@
+import copy
+
+import validation
+from validation import EntriesCheck, diff_entries, normalize, run_checks
+
+INTERFACES = {'interfaceStatuses': {
+    'Ethernet1': {'linkStatus': 'connected', 'bandwidth': 100000000000, 'lastStatusChangeTimestamp': 1700000000.1,
+                  'interfaceCounters': {'inOctets': 100}},
+    'Ethernet2': {'linkStatus': 'connected', 'bandwidth': 100000000000, 'lastStatusChangeTimestamp': 1700000000.2,
+                  'interfaceCounters': {'inOctets': 200}}}}
+
+
+class FakeState:
+    def __init__(self, interfaces):
+        self.debug_commands = {'interfaces_status': {'command': 'sh interfaces status connected',
+                                                     'output': interfaces}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_normalize_ignores_counters_and_timestamps():
+    post = copy.deepcopy(INTERFACES)
+    for entry in post['interfaceStatuses'].values():
+        entry['lastStatusChangeTimestamp'] += 600
+        entry['interfaceCounters']['inOctets'] = 0
+    assert normalize(post) == normalize(INTERFACES)
+    assert diff_entries(INTERFACES, post, ('interfaceStatuses',)) == {}
+
+
+def test_added_and_removed_entries():
+    post = copy.deepcopy(INTERFACES)
+    del post['interfaceStatuses']['Ethernet2']
+    post['interfaceStatuses']['Ethernet3'] = {'linkStatus': 'connected'}
+    post['interfaceStatuses']['Ethernet1']['linkStatus'] = 'notconnect'
+    changed = diff_entries(INTERFACES, post, ('interfaceStatuses',))
+    assert changed['Ethernet1'] == [(('linkStatus',), 'connected', 'notconnect')]
+    assert changed['Ethernet2'] == [((), normalize(INTERFACES['interfaceStatuses']['Ethernet2']), None)]
+    assert changed['Ethernet3'] == [((), None, {'linkStatus': 'connected'})]
+
+
+def test_backoff_until_the_entries_settle(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(validation.time, 'time', clock.time)
+    monkeypatch.setattr(validation.time, 'sleep', clock.sleep)
+    post = FakeState(copy.deepcopy(INTERFACES))
+    post.debug_commands['interfaces_status']['output']['interfaceStatuses']['Ethernet2']['linkStatus'] = 'notconnect'
+    polls = []
+
+    def repoll(command_keys):
+        # Ethernet2 comes up on the third poll
+        polls.append(command_keys)
+        if len(polls) == 3:
+            post.debug_commands['interfaces_status']['output'] = copy.deepcopy(INTERFACES)
+
+    check = EntriesCheck('INTERFACES STATUS', 'interfaces_status', ('interfaceStatuses',))
+    assert run_checks(FakeState(INTERFACES), post, repoll, [check], timeout=300,
+                      initial_delay=5, max_delay=15, log=lambda msg: None) == (True, [])
+    assert clock.sleeps == [5, 10, 15]
+    assert polls == [['interfaces_status']] * 3
+
+
+def test_gives_up_at_the_timeout(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(validation.time, 'time', clock.time)
+    monkeypatch.setattr(validation.time, 'sleep', clock.sleep)
+    post = copy.deepcopy(INTERFACES)
+    del post['interfaceStatuses']['Ethernet2']
+    check = EntriesCheck('INTERFACES STATUS', 'interfaces_status', ('interfaceStatuses',))
+    assert run_checks(FakeState(INTERFACES), FakeState(post), lambda keys: None, [check], timeout=30,
+                      initial_delay=5, max_delay=60, log=lambda msg: None) == (False, ['INTERFACES STATUS'])
+    # 5 + 10 fit into 30 seconds, another 20 would not
+    assert clock.sleeps == [5, 10]
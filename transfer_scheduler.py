@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+CHUNK_SIZE = 256 * 1024
+PROGRESS_INTERVAL = 30
+MAX_ATTEMPTS = 5
+
+
+class TransferError(Exception):
+    pass
+
+
+class TokenBucket:
+    # rate in bytes per second, 0 means unlimited
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, CHUNK_SIZE)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # a chunk bigger than the burst may run the bucket into debt
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TransferProgress:
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.transfers = {}
+        self.last_report = 0
+        self._lock = threading.Lock()
+
+    def start(self, ip_address, total, offset):
+        with self._lock:
+            self.transfers[ip_address] = {'total': total, 'done': offset, 'offset': offset,
+                                          'started': time.monotonic()}
+
+    def update(self, ip_address, amount):
+        with self._lock:
+            self.transfers[ip_address]['done'] += amount
+            if time.monotonic() - self.last_report < self.interval:
+                return
+            self.last_report = time.monotonic()
+            lines = [self._line(ip, transfer) for ip, transfer in self.transfers.items()
+                     if transfer['done'] < transfer['total']]
+        print('TRANSFER PROGRESS:\n' + '\n'.join(lines))
+
+    def finish(self, ip_address):
+        with self._lock:
+            transfer = self.transfers.pop(ip_address, None)
+        if transfer is not None:
+            print('TRANSFER DONE: {}'.format(self._line(ip_address, transfer)))
+
+    def _line(self, ip_address, transfer):
+        elapsed = max(time.monotonic() - transfer['started'], 0.001)
+        rate = (transfer['done'] - transfer['offset']) / elapsed
+        remaining = transfer['total'] - transfer['done']
+        eta = '{:.0f}s'.format(remaining / rate) if rate else '-'
+        return '    {:<20} {:>6.1f}% {:>8.1f} MB/s ETA {}'.format(
+            ip_address, 100.0 * transfer['done'] / max(transfer['total'], 1), rate / 1e6, eta)
+
+
+class TransferScheduler:
+    # Shares the jump host uplink and the site WAN links between image
+    # copies: a global and a per site token bucket throttle every chunk,
+    # and semaphores cap the copies running at once overall and per site.
+
+    def __init__(self, global_rate=0, site_rate=0, site_rates=None, max_transfers=0,
+                 transfers_per_site=0, chunk_size=CHUNK_SIZE, progress=None):
+        self.global_bucket = TokenBucket(global_rate)
+        self.site_rate = site_rate
+        self.site_rates = site_rates or {}
+        self.site_buckets = {}
+        self.chunk_size = chunk_size
+        self.max_transfers = threading.Semaphore(max_transfers) if max_transfers else None
+        self.transfers_per_site = transfers_per_site
+        self.site_slots = {}
+        self.progress = progress or TransferProgress()
+        self._lock = threading.Lock()
+
+    def _site(self, site):
+        with self._lock:
+            if site not in self.site_buckets:
+                self.site_buckets[site] = TokenBucket(self.site_rates.get(site, self.site_rate))
+                self.site_slots[site] = threading.Semaphore(self.transfers_per_site) \
+                    if self.transfers_per_site else None
+            return self.site_buckets[site], self.site_slots[site]
+
+    @contextmanager
+    def slot(self, site):
+        # site first: a copy queued behind its own busy site must not sit
+        # on a global slot another site could use
+        _, site_slot = self._site(site)
+        for semaphore in (site_slot, self.max_transfers):
+            if semaphore is not None:
+                semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in (self.max_transfers, site_slot):
+                if semaphore is not None:
+                    semaphore.release()
+
+    def throttle(self, site, amount):
+        site_bucket, _ = self._site(site)
+        site_bucket.consume(amount)
+        self.global_bucket.consume(amount)
+
+    def send(self, sftp, local_path, remote_path, ip_address, site=None):
+        # appends to whatever an earlier attempt left on the device
+        total = os.path.getsize(local_path)
+        try:
+            offset = sftp.stat(remote_path).st_size
+        except IOError:
+            offset = 0
+        if offset > total:
+            offset = 0
+        self.progress.start(ip_address, total, offset)
+        with open(local_path, 'rb') as src, sftp.open(remote_path, 'ab' if offset else 'wb') as dst:
+            dst.set_pipelined(True)
+            src.seek(offset)
+            while True:
+                chunk = src.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.throttle(site, len(chunk))
+                dst.write(chunk)
+                self.progress.update(ip_address, len(chunk))
+        self.progress.finish(ip_address)
+        return total - offset
+
+
+def reconnect(handler):
+    # connect_to_device() exits the process when the login fails, here
+    # that is just a failed attempt
+    if handler.ssh_conn is not None:
+        try:
+            handler.ssh_conn.disconnect()
+        except Exception:
+            pass
+        handler.ssh_conn = None
+    try:
+        handler.connect_to_device()
+    except SystemExit:
+        raise ConnectionError('cannot reconnect to {}'.format(handler.ip_address))
+
+
+def scheduled_transfer(handler, scheduler, site=None, max_attempts=MAX_ATTEMPTS):
+    # SFTP copy of handler.source_file that resumes after a dropped
+    # connection, then checks the md5 on the device. A mismatch removes
+    # the remote file and starts over once.
+    remote_path = '{}/{}'.format(handler.file_system, handler.dest_file)
+    restarted = False
+    attempt = 0
+    with scheduler.slot(site):
+        while True:
+            attempt += 1
+            try:
+                if handler.ssh_conn is None or not handler.ssh_conn.is_alive():
+                    reconnect(handler)
+                sftp = handler.ssh_conn.remote_conn_pre.open_sftp()
+                try:
+                    sent = scheduler.send(sftp, handler.source_file, remote_path, handler.ip_address, site)
+                    if handler.image_md5 is None:
+                        return sent
+                    remote_md5 = handler.remote_md5()
+                    if remote_md5 is None:
+                        # the check itself failed, the next attempt checks again
+                        raise IOError('cannot read the md5 of {} on {}'.format(remote_path, handler.ip_address))
+                    if remote_md5 == handler.image_md5:
+                        return sent
+                    if restarted:
+                        raise TransferError('md5 mismatch after a full copy to {}'.format(handler.ip_address))
+                    print('COPYING IMAGE: md5 mismatch on {}, copying again from the start'.format(
+                        handler.ip_address))
+                    sftp.remove(remote_path)
+                    restarted = True
+                finally:
+                    sftp.close()
+            except TransferError:
+                raise
+            except Exception as e:
+                # socket, paramiko and sftp errors alike, the next attempt resumes
+                if attempt >= max_attempts:
+                    raise TransferError('copy to {} failed after {} attempts: {}'.format(
+                        handler.ip_address, attempt, e))
+                print('COPYING IMAGE: {} interrupted ({}), resuming'.format(handler.ip_address, e))
+                time.sleep(min(2 ** attempt, 60))
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from arista_eos_upgrade import (LINE, MAX_PING_WAIT, WAIT_BETWEEN_PING,
+                                AristaOsUpgrade, AristaState, validate_upgrade)
+from instrumentation import get_recorder
+from reachability import wait_for_ssh
+
+PHASES = ('connect', 'backup', 'snapshot', 'transfer',
+          'boot_config', 'reload', 'reconnect', 'validate')
+
+# phases a resumed device always runs again, the connection is not durable
+ALWAYS_RUN = ('connect',)
+
+# device outcomes
+PENDING = 'pending'
+UPGRADED = 'upgraded'
+ALREADY_UPGRADED = 'already_upgraded'
+FAILED = 'failed'
+NOT_RUN = 'not_run'
+
+
+class UpgradeError(Exception):
+    pass
+
+
+class DeviceUpgrade:
+    def __init__(self, args, image_file_path, journal_entry=None):
+        self.args = args
+        self.ip_address = args['ip_address']
+        self.image_file_path = image_file_path
+        self.journal_entry = journal_entry
+        # a run that died while the device was reloading
+        self.interrupted_reload = journal_entry is not None and journal_entry.in_progress == 'reload'
+        self.arista_handler = None
+        self.pre_upgrade_state = None
+        self.backup_file = None
+        self.status = PENDING
+        self.phase = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        recorder = get_recorder()
+        with recorder.for_device(self.ip_address), recorder.profiled(self.ip_address):
+            try:
+                self._run_phases(recorder)
+            finally:
+                if self.arista_handler is not None:
+                    self.arista_handler.disconnect()
+        recorder.event('device', device=self.ip_address, status=self.status,
+                       phase=self.phase, seconds=round(self.duration(), 3), error=self.error)
+        print('{} {} {} in phase {} {}'.format(LINE, self.ip_address,
+                                               self.status.upper(), self.phase, LINE))
+        return self
+
+    def _run_phases(self, recorder):
+        self.started = time.time()
+        entry = self.journal_entry
+        if entry is not None and entry.status in (UPGRADED, ALREADY_UPGRADED):
+            print('{} {} already {} according to the journal, skipping'.format(LINE, self.ip_address, entry.status))
+            self.status = entry.status
+            self.phase = 'journal'
+            self.finished = time.time()
+            return
+        if entry is not None and entry.completed:
+            print('{} RESUMING {} AFTER PHASE {} {}'.format(LINE, self.ip_address, entry.completed[-1], LINE))
+        for phase in PHASES:
+            self.phase = phase
+            if self._restore(phase):
+                continue
+            try:
+                if entry is not None:
+                    entry.start(phase)
+                with recorder.phase(phase):
+                    done = getattr(self, '_' + phase)()
+                # a journal that cannot be written fails this device, not the run
+                if entry is not None:
+                    entry.commit(phase, **self._journal_fields(phase))
+            except SystemExit:
+                # the AristaOsUpgrade helpers call sys.exit() on failure
+                self.status = FAILED
+                self.error = 'phase {} exited'.format(phase)
+                break
+            except Exception as e:
+                self.status = FAILED
+                self.error = '{}: {}'.format(type(e).__name__, e)
+                break
+            if done:
+                break
+        else:
+            self.status = UPGRADED
+        self.finished = time.time()
+        if entry is not None:
+            try:
+                entry.finish(self.status)
+            except Exception as e:
+                # the outcome stands, the next run just repeats the last phase
+                print('{} {} could not record {} in the journal: {}'.format(LINE, self.ip_address, self.status, e))
+
+    def _restore(self, phase):
+        # True when the journal says the phase is done and its result
+        # could be loaded back, so the phase is skipped
+        entry = self.journal_entry
+        if entry is None or phase in ALWAYS_RUN or phase not in entry.completed:
+            return False
+        if phase == 'backup':
+            if not entry.get('backup_file') or not os.path.exists(entry.get('backup_file')):
+                return False
+            self.backup_file = entry.get('backup_file')
+        elif phase == 'snapshot':
+            if entry.get('pre_state') is None:
+                return False
+            self.pre_upgrade_state = AristaState(self.image_file_path)
+            self.pre_upgrade_state.load_outputs(entry.get('pre_state'))
+        return True
+
+    def _journal_fields(self, phase):
+        if phase == 'backup':
+            return {'backup_file': self.backup_file}
+        if phase == 'snapshot':
+            return {'pre_state': self.pre_upgrade_state.outputs()}
+        return {}
+
+    def _connect(self):
+        if self.interrupted_reload:
+            # the device may still be booting, give it the full reboot wait
+            wait_for_ssh(self.ip_address, timeout=MAX_PING_WAIT * WAIT_BETWEEN_PING,
+                         port=self.args.get('port', 22))
+        self.arista_handler = AristaOsUpgrade(self.args)
+
+    def _backup(self):
+        self.backup_file = self.arista_handler.copy_running_config()
+
+    def _snapshot(self):
+        self.pre_upgrade_state = AristaState(self.image_file_path)
+        self.pre_upgrade_state.populate(self.arista_handler.run_command_json,
+                                        run_commands=self.arista_handler.run_commands_json)
+        if self.pre_upgrade_state.running_version in self.image_file_path:
+            print('Device {} is already running with upgraded version: {}'
+                  .format(self.ip_address, self.pre_upgrade_state.running_version))
+            self.status = ALREADY_UPGRADED
+            return True
+        if not self.arista_handler.image_is_staged():
+            self.pre_upgrade_state.check_flash_memory()
+
+    def _transfer(self):
+        self.arista_handler.file_transfer()
+
+    def _boot_config(self):
+        self.arista_handler.modify_boot_config()
+
+    def _reload(self):
+        if self.interrupted_reload and self._running_target_image():
+            print('{} {} already rebooted into the new image {}'.format(LINE, self.ip_address, LINE))
+            return
+        self.arista_handler.save_and_reload()
+        self.arista_handler.reboot_status()
+
+    def _running_target_image(self):
+        state = AristaState(self.image_file_path)
+        state.populate(self.arista_handler.run_command_json, keys=('version_summary',),
+                       run_commands=self.arista_handler.run_commands_json)
+        return bool(state.running_version) and state.running_version in self.image_file_path
+
+    def _reconnect(self):
+        # reboot_status() only returns once the SSH banner is back; the
+        # sessions from before the reload are dead, close them first
+        self.arista_handler.disconnect()
+        self.arista_handler.connect_to_device()
+
+    def _validate(self):
+        if not validate_upgrade(self.arista_handler, self.pre_upgrade_state, self.image_file_path):
+            raise UpgradeError('post upgrade validation failed')
+
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class UpgradeEngine:
+    def __init__(self, device_list, image_file_path, username, password, md5=None, transport='ssh',
+                 concurrency=1, canary=1, wave_growth=2, max_failures=1, journal=None, waves=None,
+                 sites=None, transfer_scheduler=None):
+        self.image_file_path = image_file_path
+        self.concurrency = max(1, concurrency)
+        self.canary = max(1, canary)
+        self.wave_growth = max(1, wave_growth)
+        self.max_failures = max_failures
+        self.devices = []
+        for ip_address in device_list:
+            args = {
+                'username': username,
+                'password': password,
+                'ip_address': ip_address,
+                'path': image_file_path,
+                'md5': md5,
+                'transport': transport,
+                'site': (sites or {}).get(ip_address),
+                'transfer_scheduler': transfer_scheduler
+            }
+            entry = journal.entry(ip_address) if journal is not None else None
+            self.devices.append(DeviceUpgrade(args, image_file_path, entry))
+        # explicit waves of ip addresses, e.g. from scheduler.plan_waves()
+        self.planned_waves = waves
+        self.failures = 0
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def waves(self):
+        if self.planned_waves is not None:
+            by_ip = {device.ip_address: device for device in self.devices}
+            return [[by_ip[ip] for ip in wave] for wave in self.planned_waves]
+        waves = []
+        start = 0
+        size = self.canary
+        while start < len(self.devices):
+            waves.append(self.devices[start:start + size])
+            start += size
+            size *= self.wave_growth
+        return waves
+
+    def _run_device(self, device):
+        # devices queued behind an abort are never started
+        with self._lock:
+            if self.aborted:
+                device.status = NOT_RUN
+                return device
+        device.run()
+        with self._lock:
+            if device.status == FAILED:
+                self.failures += 1
+                if self.max_failures and self.failures >= self.max_failures:
+                    self.aborted = True
+        return device
+
+    def run(self):
+        for number, wave in enumerate(self.waves()):
+            if self.aborted:
+                for device in wave:
+                    device.status = NOT_RUN
+                continue
+            print('{} STARTING WAVE {} WITH {} DEVICES {}'.format(LINE, number, len(wave), LINE))
+            workers = min(self.concurrency, len(wave))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(self._run_device, wave))
+            if self.aborted:
+                print('{} ABORTING FLEET UPGRADE AFTER {} FAILURES {}'.format(LINE, self.failures, LINE))
+        # devices left out of the planned waves, e.g. beyond the window
+        for device in self.devices:
+            if device.status == PENDING:
+                device.status = NOT_RUN
+        return self.devices
+
+    def report(self):
+        print('{} UPGRADE REPORT {}'.format(LINE, LINE))
+        for device in self.devices:
+            duration = device.duration()
+            print('{:<20} {:<18} phase={} duration={} {}'.format(
+                device.ip_address, device.status, device.phase,
+                '{:.0f}s'.format(duration) if duration is not None else '-',
+                device.error or ''))
+        counts = {}
+        for device in self.devices:
+            counts[device.status] = counts.get(device.status, 0) + 1
+        print(', '.join('{}={}'.format(k, v) for k, v in sorted(counts.items())))
+        recorder = get_recorder()
+        for status, count in counts.items():
+            recorder.set_gauge('devices', count, status=status)
+        if self.failures or self.aborted:
+            return 1
+        return 0
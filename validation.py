@@ -0,0 +1,121 @@
+import time
+
+# fields that change on every poll or across a reload and never indicate a problem
+VOLATILE_KEYS = frozenset(['lastStatusChangeTimestamp', 'lastChangeTime', 'lastChange',
+                           'changeCount', 'counters', 'interfaceCounters', 'uptime',
+                           'upTime', 'bootupTimestamp', 'timestamp', 'lastUpdate'])
+
+INITIAL_RETRY_DELAY = 5
+MAX_RETRY_DELAY = 60
+VALIDATION_TIMEOUT = 300
+
+
+def normalize(data, volatile=VOLATILE_KEYS):
+    if isinstance(data, dict):
+        return {k: normalize(v, volatile) for k, v in data.items() if k not in volatile}
+    if isinstance(data, list):
+        return [normalize(v, volatile) for v in data]
+    return data
+
+
+def diff(pre, post, path=()):
+    # changed leaves as (path, pre value, post value), missing side is None
+    changes = []
+    if isinstance(pre, dict) and isinstance(post, dict):
+        for key in pre.keys() | post.keys():
+            if key not in post:
+                changes.append((path + (key,), pre[key], None))
+            elif key not in pre:
+                changes.append((path + (key,), None, post[key]))
+            elif pre[key] != post[key]:
+                changes.extend(diff(pre[key], post[key], path + (key,)))
+    elif pre != post:
+        changes.append((path, pre, post))
+    return changes
+
+
+def entries(data, entry_path):
+    for key in entry_path:
+        if not isinstance(data, dict):
+            return {}
+        data = data.get(key, {})
+    return data if isinstance(data, dict) else {}
+
+
+def diff_entries(pre, post, entry_path):
+    # compare the per interface / per key entries below entry_path one by one
+    pre_entries = entries(pre, entry_path)
+    post_entries = entries(post, entry_path)
+    changed = {}
+    for name in sorted(pre_entries.keys() | post_entries.keys()):
+        pre_entry = normalize(pre_entries.get(name))
+        post_entry = normalize(post_entries.get(name))
+        if pre_entry != post_entry:
+            changed[name] = diff(pre_entry, post_entry)
+    return changed
+
+
+def format_changes(changed, limit=20):
+    lines = []
+    for name, changes in list(changed.items())[:limit]:
+        for path, pre_value, post_value in changes:
+            field = '.'.join(str(p) for p in path) or '<entry>'
+            lines.append('    {} {}: {!r} -> {!r}'.format(name, field, pre_value, post_value))
+    if len(changed) > limit:
+        lines.append('    ... {} more changed entries'.format(len(changed) - limit))
+    return '\n'.join(lines)
+
+
+class EntriesCheck:
+    def __init__(self, name, command_key, entry_path):
+        self.name = name
+        # what run_checks re-polls when the check fails
+        self.command_keys = (command_key,)
+        self.command_key = command_key
+        self.entry_path = entry_path
+
+    def run(self, pre_state, post_state):
+        # returns (passed, detail)
+        changed = diff_entries(pre_state.debug_commands[self.command_key]['output'],
+                               post_state.debug_commands[self.command_key]['output'],
+                               self.entry_path)
+        if changed:
+            return False, '{} changed entries\n{}'.format(len(changed), format_changes(changed))
+        return True, ''
+
+
+def default_checks():
+    # route counts are tracked by convergence.py, not compared once
+    return [EntriesCheck('INTERFACES STATUS', 'interfaces_status', ('interfaceStatuses',)),
+            EntriesCheck('MLAG STATUS', 'mlag_summary', ('interfaces',))]
+
+
+def run_checks(pre_state, post_state, repoll, checks=None, timeout=VALIDATION_TIMEOUT,
+               initial_delay=INITIAL_RETRY_DELAY, max_delay=MAX_RETRY_DELAY, log=print):
+    # Runs every check, then re-polls and re-runs only the failed ones with
+    # exponential backoff until they pass or the timeout is used up.
+    # repoll(command_keys) refreshes post_state for just those commands.
+    pending = checks if checks is not None else default_checks()
+    deadline = time.time() + timeout
+    delay = initial_delay
+    while True:
+        failed = []
+        for check in pending:
+            passed, detail = check.run(pre_state, post_state)
+            if passed:
+                log('{} TEST: PASS'.format(check.name))
+            else:
+                log('{} TEST: FAIL, {}'.format(check.name, detail))
+                failed.append(check)
+        if not failed:
+            return True, []
+        if time.time() + delay > deadline:
+            return False, [check.name for check in failed]
+        log('RETRYING {} IN {} SECONDS'.format(', '.join(check.name for check in failed), delay))
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+        command_keys = []
+        for check in failed:
+            command_keys.extend(k for k in check.command_keys if k not in command_keys)
+        repoll(command_keys)
+        pending = failed